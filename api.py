@@ -0,0 +1,154 @@
+import datetime
+import json
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+import matching
+import queries
+from models import Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# JSON API.
+#----------------------------------------------------------------------------#
+
+# /api/v1 serves the same data as the HTML pages, through the same query layer.
+# Collections are streamed from a server-side cursor (yield_per), either as one
+# chunked JSON array or, with ?format=ndjson or Accept: application/x-ndjson, as
+# one JSON object per line, so exporting every show never holds the table in
+# memory. ?fields=id,name selects only those columns in the SQL itself.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def to_json(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def dumps(data):
+    return json.dumps(data, default=to_json, separators=(',', ':'))
+
+
+def requested_fields(available):
+    fields = request.args.get('fields')
+    if not fields:
+        return list(available)
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        abort(400, 'Unknown fields: {}'.format(', '.join(unknown)))
+    return fields
+
+
+def wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+
+def stream(query, fields):
+    rows = query.yield_per(current_app.config['API_YIELD_PER'])
+    ndjson = wants_ndjson()
+
+    def generate():
+        if ndjson:
+            for row in rows:
+                yield dumps(dict(zip(fields, row))) + '\n'
+            return
+        yield '['
+        separator = ''
+        for row in rows:
+            yield separator + dumps(dict(zip(fields, row)))
+            separator = ','
+        yield ']'
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson' if ndjson else 'application/json'
+    )
+
+
+def detail(data):
+    if data is None:
+        abort(404)
+    fields = requested_fields(data)
+    return Response(dumps({field: data[field] for field in fields}), mimetype='application/json')
+
+
+@api.route('/venues')
+def venues():
+    fields = requested_fields(queries.VENUE_FIELDS)
+    # ?sort=busiest orders by upcoming, then past shows; ?genre=Jazz filters
+    return stream(queries.venues_query(fields, sort=request.args.get('sort', 'id'), genre=request.args.get('genre') or None), fields)
+
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    return detail(queries.venue_detail(venue_id, current_app.config['DETAIL_SHOWS']))
+
+
+@api.route('/venues/<int:venue_id>/shows')
+def venue_shows(venue_id):
+    return calendar(Venue, venue_id)
+
+
+@api.route('/venues/<int:venue_id>/suggestions')
+def venue_suggestions(venue_id):
+    return suggestions(Venue, venue_id)
+
+
+@api.route('/artists')
+def artists():
+    fields = requested_fields(queries.ARTIST_FIELDS)
+    return stream(queries.artists_query(fields, sort=request.args.get('sort', 'id'), genre=request.args.get('genre') or None), fields)
+
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    return detail(queries.artist_detail(artist_id, current_app.config['DETAIL_SHOWS']))
+
+
+@api.route('/artists/<int:artist_id>/shows')
+def artist_shows(artist_id):
+    return calendar(Artist, artist_id)
+
+
+@api.route('/artists/<int:artist_id>/suggestions')
+def artist_suggestions(artist_id):
+    return suggestions(Artist, artist_id)
+
+
+def suggestions(model, id):
+    # the precomputed matches of a venue or an artist seeking one, best first (see matching.py)
+    query = matching.suggestions_query(model, id)
+    return stream(query, [column['name'] for column in query.column_descriptions])
+
+
+def calendar(model, id):
+    # one venue's or artist's shows in calendar order, ?from=/?to= as on /shows
+    try:
+        start, end = queries.date_window(request.args.get('from'), request.args.get('to'))
+    except ValueError:
+        abort(400, 'from and to must be YYYY-MM-DD')
+    query = queries.calendar_query(model, id, start, end)
+    return stream(query, [column['name'] for column in query.column_descriptions])
+
+
+@api.route('/shows')
+def shows():
+    # ?when=upcoming|past|all and ?from=/?to= work as on /shows
+    fields = requested_fields(queries.SHOW_FIELDS)
+    when = request.args.get('when', 'all')
+    if when not in ('all', 'upcoming', 'past'):
+        abort(400, 'when must be all, upcoming or past')
+    try:
+        start, end = queries.date_window(request.args.get('from'), request.args.get('to'))
+    except ValueError:
+        abort(400, 'from and to must be YYYY-MM-DD')
+    query = queries.shows_query(fields, when=when, start=start, end=end)
+    return stream(query.order_by(Show.start_time, Show.show_id), fields)
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def error(error):
+    return jsonify({'error': error.code, 'message': error.description}), error.code
@@ -0,0 +1,137 @@
+from flask import Blueprint, abort, current_app, flash, jsonify, redirect, render_template, request, url_for
+import edits
+import ical
+import queries
+import search
+from cache import cache
+from facets import genre_facets
+from matching import matcher
+from replicas import on_primary, read_only
+from models import db, Artist
+from views import (
+    delete_record, edit_record, invalidate_artist_pages, listing_genre, listing_sort, render_listing, search_page
+)
+
+#----------------------------------------------------------------------------#
+# Artists.
+#----------------------------------------------------------------------------#
+
+artists = Blueprint('artists', __name__, url_prefix='/artists')
+
+
+@artists.route('')
+@cache.cached('artists')
+def index():
+    # ?sort=busiest lists the artists with the most upcoming shows first, ?genre= filters
+    data = queries.artists_query(['id', 'name', 'upcoming_shows_count'], sort=listing_sort(), genre=listing_genre()).yield_per(current_app.config['LISTING_YIELD_PER'])
+    facets = genre_facets.counts(Artist)
+
+    return render_listing('pages/artists.html', artists=data, sort=listing_sort(), genre=listing_genre(), facets=facets)
+
+
+@artists.route('/search', methods=['POST'])
+@read_only
+def search_artists():
+    search_term = request.form.get('search_term', '')
+    response = search.search(Artist, search_term, limit=current_app.config['SEARCH_RESULTS_PER_PAGE'], page=search_page(), genre=listing_genre())
+    facets = genre_facets.counts(Artist, term=search_term)
+
+    return render_template('pages/search_artists.html', results=response, search_term=search_term, genre=listing_genre(), facets=facets)
+
+
+@artists.route('/<int:artist_id>')
+@cache.cached('artist:{artist_id}')
+def show_artist(artist_id):
+    artist = queries.artist_detail(artist_id, current_app.config['DETAIL_SHOWS'])
+    if artist is None:
+        abort(404)
+
+    return render_template('pages/show_artist.html', artist=artist)
+
+
+@artists.route('/<int:artist_id>/calendar.ics')
+def artist_calendar(artist_id):
+    return ical.calendar_response(Artist, artist_id)
+
+#  Create Artist
+#  ----------------------------------------------------------------
+
+@artists.route('/create', methods=['GET'])
+def create_artist_form():
+    from forms import ArtistForm
+    form = ArtistForm()
+    return render_template('forms/new_artist.html', form=form)
+
+
+@artists.route('/create', methods=['POST'])
+def create_artist_submission():
+    try:
+        data = request.form
+        artist = Artist(name=data['name'], city=data['city'], state=data['state'], phone=data['phone'], genres=data.getlist('genres'), facebook_link=data['facebook_link'])
+        db.session.add(artist)
+        db.session.commit()
+        genre_facets.adjust(Artist, added=data.getlist('genres'))
+        matcher.notify(Artist, artist.id)
+        cache.invalidate('artists')
+        flash('Artist ' + request.form['name'] + ' was successfully listed!')
+    except:
+        db.session.rollback()
+        current_app.logger.exception('%s %s failed', request.method, request.path)
+        flash('Artist ' + request.form['name'] + ' was not listed! Something wrong happened!')
+    finally:
+        db.session.close()
+
+    return render_template('pages/home.html')
+
+#  Delete Artist
+#  ----------------------------------------------------------------
+
+@artists.route('/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+    deleted = delete_record(Artist, artist_id, invalidate_artist_pages)
+    if deleted is None:
+        return jsonify({'success': False}), 500
+    return jsonify({'success': deleted}), 200 if deleted else 404
+
+
+@artists.route('/<int:artist_id>/delete', methods=['POST'])
+def delete_artist_submission(artist_id):
+    if delete_record(Artist, artist_id, invalidate_artist_pages):
+        flash('Artist was successfully deleted!')
+    else:
+        flash('An error occurred. Artist could not be deleted.')
+    return redirect(url_for('index'))
+
+#  Update Artist
+#  ----------------------------------------------------------------
+
+@artists.route('/<int:artist_id>/edit', methods=['GET'])
+@on_primary
+def edit_artist(artist_id):
+    from forms import ArtistForm
+    artist = Artist.query.filter(Artist.id == artist_id, Artist.deleted_at.is_(None)).first_or_404()
+    form = ArtistForm(obj=artist)
+
+    return render_template('forms/edit_artist.html', form=form, artist=artist, version=edits.version_token(artist.updated_at))
+
+
+@artists.route('/<int:artist_id>/edit', methods=['POST'])
+def edit_artist_submission(artist_id):
+    # writes only the submitted fields, and only over the version the form was
+    # rendered with (see edits.py)
+    from forms import ArtistForm
+    updated = edit_record(Artist, artist_id, invalidate_artist_pages)
+    if updated is False:
+        artist = Artist.query.filter(Artist.id == artist_id, Artist.deleted_at.is_(None)).first_or_404()
+        flash('Artist ' + artist.name + ' was changed by someone else while you were editing. Your changes are below, next to what is saved now; save again to keep them.')
+        # the submitted values stay in the form, and the new version token lets
+        # a second save go through over what was saved meanwhile
+        form = ArtistForm(request.form)
+        conflicts = edits.conflicting_values(artist, edits.submitted_values(Artist, request.form))
+        return render_template(
+            'forms/edit_artist.html', form=form, artist=artist, version=edits.version_token(artist.updated_at), conflicts=conflicts
+        ), 409
+    if updated is None:
+        flash('An error occurred. Artist could not be updated.')
+
+    return redirect(url_for('artists.show_artist', artist_id=artist_id))
@@ -0,0 +1,301 @@
+import asyncio
+import re
+import types
+from flask import render_template, request, session
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine.url import make_url
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import HTMLResponse
+from starlette.routing import Mount, Route
+import queries
+import search
+from app import create_app
+from cache import cache
+from facets import genre_facets
+from models import Venue, Artist
+from views import listing_genre, listing_sort, search_page
+
+#----------------------------------------------------------------------------#
+# Async read server.
+#----------------------------------------------------------------------------#
+
+# An optional ASGI entry point (`uvicorn asgi:application`). The read pages
+# (/venues, /artists, /shows, the detail pages and the searches) run their
+# queries on an asyncpg pool, so a worker keeps many requests in flight while
+# they wait on Postgres; every other route, and every request these pages can't
+# answer as-is (flashed messages, bad parameters), goes to the unchanged Flask
+# app in a thread.
+#
+# The queries are the query layer's own SQLAlchemy queries compiled for asyncpg,
+# and the pages are rendered by the Flask app's templates. Werkzeug's context
+# locals are per thread, not per task, so a request context is only ever pushed
+# around code that doesn't await: once to build the queries, once to render.
+#
+# Unlike the Flask views, these pages are fetched whole before they render (a
+# long /artists listing is held in memory instead of streamed), always read
+# from the primary (no read replicas, no sticky mark), and run outside the SQL
+# instrumentation, so they carry no Server-Timing header and never reach the
+# slow request log.
+
+NUMERIC_PARAM = re.compile(r'(?<![:\w]):(\d+)')
+DIALECT = postgresql.dialect(paramstyle='numeric')
+
+
+class Fallback(Exception):
+    # hand the request to the Flask app instead
+    pass
+
+
+def compile_query(query):
+    # asyncpg wants $1, $2, ... placeholders and positional parameters
+    compiled = query.statement.compile(dialect=DIALECT)
+    params = compiled.construct_params()
+    return NUMERIC_PARAM.sub(r'$\1', str(compiled)), [params[name] for name in compiled.positiontup]
+
+
+def asyncpg_dsn(uri):
+    url = make_url(uri)
+    url.drivername = 'postgresql'
+    return str(url)
+
+
+async def read_body(receive):
+    body, more = b'', True
+    while more:
+        message = await receive()
+        body += message.get('body', b'')
+        more = message.get('more_body', False)
+    return body
+
+
+def replay(body):
+    # a receive() for the Flask app after the body has already been read
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    return receive
+
+
+class ReadPage:
+    # prepare(**path_params) runs in a request context and returns the queries
+    # to run and a dict handed on to render(results, **state), which returns
+    # (html, status)
+
+    def __init__(self, reader, tag, prepare, render):
+        self.reader = reader
+        self.tag = tag
+        self.prepare = prepare
+        self.render = render
+
+    async def __call__(self, scope, receive, send):
+        body = await read_body(receive)
+        try:
+            page, status = await self.respond(scope, body)
+        except Fallback:
+            await self.reader.wsgi(scope, replay(body), send)
+            return
+        await HTMLResponse(page, status)(scope, receive, send)
+
+    async def respond(self, scope, body):
+        params = scope.get('path_params', {})
+        key = tag = None
+        with self.reader.context(scope, body):
+            if '_flashes' in session:
+                raise Fallback
+            if self.tag and cache.backend is not None and request.method == 'GET':
+                tag = self.tag.format(**params)
+                key = tag + '|' + request.full_path
+                page = cache.backend.get(key)
+                if page is not None:
+                    return page, 200
+            try:
+                statements, state = self.prepare(**params)
+            except ValueError:
+                raise Fallback
+            statements = [compile_query(query) for query in statements]
+
+        results = await asyncio.gather(*[self.reader.fetch(*statement) for statement in statements])
+
+        with self.reader.context(scope, body):
+            page, status = self.render(*results, **state)
+        if key is not None and status == 200:
+            cache.backend.set(key, page, tag)
+        return page, status
+
+
+class AsyncReader:
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi = WSGIMiddleware(app)
+        self.pool = None
+
+    async def startup(self):
+        import asyncpg
+        self.pool = await asyncpg.create_pool(
+            asyncpg_dsn(self.app.config['SQLALCHEMY_DATABASE_URI']),
+            min_size=self.app.config['ASYNC_DB_POOL_MIN_SIZE'],
+            max_size=self.app.config['ASYNC_DB_POOL_MAX_SIZE']
+        )
+
+    async def shutdown(self):
+        await self.pool.close()
+
+    async def fetch(self, sql, params):
+        async with self.pool.acquire() as connection:
+            records = await connection.fetch(sql, *params)
+        # the query layer reads rows by attribute
+        return [types.SimpleNamespace(**record) for record in records]
+
+    def context(self, scope, body):
+        return self.app.test_request_context(
+            scope['path'],
+            method=scope['method'],
+            query_string=scope['query_string'].decode('latin-1'),
+            headers=[(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']],
+            data=body or None
+        )
+
+    def asgi(self):
+        return Starlette(
+            routes=[
+                Route('/venues', ReadPage(self, 'venues', prepare_venues, render_venues), methods=['GET']),
+                Route('/venues/search', ReadPage(self, None, prepare_search(Venue), render_search('pages/search_venues.html')), methods=['POST']),
+                Route('/venues/{venue_id:int}', ReadPage(self, 'venue:{venue_id}', prepare_venue, render_venue), methods=['GET']),
+                Route('/artists', ReadPage(self, 'artists', prepare_artists, render_artists), methods=['GET']),
+                Route('/artists/search', ReadPage(self, None, prepare_search(Artist), render_search('pages/search_artists.html')), methods=['POST']),
+                Route('/artists/{artist_id:int}', ReadPage(self, 'artist:{artist_id}', prepare_artist, render_artist), methods=['GET']),
+                Route('/shows', ReadPage(self, 'shows', prepare_shows, render_shows), methods=['GET']),
+                Mount('/', app=self.wsgi)
+            ],
+            on_startup=[self.startup],
+            on_shutdown=[self.shutdown]
+        )
+
+
+#  Pages
+#  ----------------------------------------------------------------
+#  each mirrors its view in venues.py, artists.py or shows.py
+
+def with_facets(statements, state, model, **filters):
+    # the genre counts are one more query, unless they are cached
+    facets, query, collect = genre_facets.lookup(model, **filters)
+    if query is not None:
+        statements = statements + [query]
+    state.update(facets=facets, collect=collect)
+    return statements, state
+
+
+def page_facets(facet_rows, facets, collect):
+    return facets if collect is None else collect(facet_rows)
+
+
+def prepare_venues():
+    per_area = min(request.args.get('per_area', app.config['VENUES_PER_AREA'], type=int), app.config['VENUES_PER_AREA_MAX'])
+    page = max(request.args.get('page', 1, type=int), 1)
+    city, state = request.args.get('city'), request.args.get('state')
+    query = queries.venue_areas_query(
+        per_area=max(per_area, 1),
+        city=city,
+        state=state,
+        page=page,
+        sort=listing_sort(),
+        genre=listing_genre()
+    )
+    return with_facets([query], {'page': page}, Venue, city=city, state=state)
+
+
+def render_venues(rows, facet_rows=None, page=1, facets=None, collect=None):
+    return render_template(
+        'pages/venues.html',
+        areas=queries.group_areas(rows, page),
+        sort=listing_sort(),
+        genre=listing_genre(),
+        facets=page_facets(facet_rows, facets, collect)
+    ), 200
+
+
+def prepare_artists():
+    query = queries.artists_query(['id', 'name', 'upcoming_shows_count'], sort=listing_sort(), genre=listing_genre())
+    return with_facets([query], {}, Artist)
+
+
+def render_artists(rows, facet_rows=None, facets=None, collect=None):
+    return render_template(
+        'pages/artists.html',
+        artists=rows,
+        sort=listing_sort(),
+        genre=listing_genre(),
+        facets=page_facets(facet_rows, facets, collect)
+    ), 200
+
+
+def prepare_shows():
+    when = request.args.get('when', 'all')
+    if when not in ('all', 'upcoming', 'past'):
+        raise Fallback
+    start, end = queries.date_window(request.args.get('from'), request.args.get('to'))
+    query = queries.show_feed_query(
+        limit=app.config['SHOWS_PER_PAGE'],
+        when=when,
+        start=start,
+        end=end,
+        cursor=request.args.get('after')
+    )
+    return [query], {'when': when}
+
+
+def render_shows(rows, when):
+    feed = queries.ShowPage(rows, app.config['SHOWS_PER_PAGE'])
+    return render_template('pages/shows.html', shows=feed, when=when), 200
+
+
+def prepare_venue(venue_id):
+    return queries.venue_detail_queries(venue_id, app.config['DETAIL_SHOWS']), {}
+
+
+def render_venue(venues, shows):
+    venue = queries.build_venue_detail(venues[0] if venues else None, shows)
+    if venue is None:
+        return render_template('errors/404.html'), 404
+    return render_template('pages/show_venue.html', venue=venue), 200
+
+
+def prepare_artist(artist_id):
+    return queries.artist_detail_queries(artist_id, app.config['DETAIL_SHOWS']), {}
+
+
+def render_artist(artists, shows):
+    artist = queries.build_artist_detail(artists[0] if artists else None, shows)
+    if artist is None:
+        return render_template('errors/404.html'), 404
+    return render_template('pages/show_artist.html', artist=artist), 200
+
+
+def prepare_search(model):
+    def prepare():
+        search_term = request.form.get('search_term', '')
+        limit = app.config['SEARCH_RESULTS_PER_PAGE']
+        page = search_page()
+        query = search.search_query(model, search_term, limit=limit, page=page, genre=listing_genre())
+        state = {'search_term': search_term, 'limit': limit, 'page': page}
+        return with_facets([query], state, model, term=search_term)
+    return prepare
+
+
+def render_search(template_name):
+    def render(rows, facet_rows=None, search_term='', limit=None, page=1, facets=None, collect=None):
+        results = search.search_results(rows, limit, page)
+        return render_template(
+            template_name,
+            results=results,
+            search_term=search_term,
+            genre=listing_genre(),
+            facets=page_facets(facet_rows, facets, collect)
+        ), 200
+    return render
+
+
+app = create_app()
+reader = AsyncReader(app)
+application = reader.asgi()
@@ -0,0 +1,225 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+#----------------------------------------------------------------------------#
+# Static assets.
+#----------------------------------------------------------------------------#
+
+# `flask assets build` concatenates and minifies the layout's stylesheets and
+# scripts into a few bundles under static/dist, named after a hash of their
+# content, each next to a .gz (and, with the brotli package installed, a .br)
+# copy, and records them in static/dist/manifest.json. Templates ask for
+# asset_urls('main.css') / asset_url('img/...'); with a manifest they get the
+# hashed URLs, which are served precompressed and cached forever, since a new
+# build means new URLs. Without one they get the plain source files, so a
+# fresh checkout works before anything is built.
+
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    # layouts/form.html, on top of main.css
+    'form.css': [
+        'css/bootstrap-theme.min.css',
+    ],
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+        'js/script.js',
+    ],
+    'main.js': [
+        'js/libs/jquery-1.11.1.min.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+    ],
+}
+# single files that are fingerprinted as they are
+FILES = ['img/front-splash.jpg', 'js/libs/respond-1.4.2.min.js']
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json')
+MIN_COMPRESS_SIZE = 512
+
+CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+CSS_SPACE = re.compile(r'\s*([{};,>])\s*')
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+SOURCE_MAP = re.compile(r'^\s*//[#@] sourceMappingURL=.*$', re.M)
+
+
+def minify_css(text):
+    try:
+        import rcssmin
+        return rcssmin.cssmin(text)
+    except ImportError:
+        pass
+    text = CSS_COMMENT.sub('', text)
+    text = ' '.join(text.split())
+    return CSS_SPACE.sub(r'\1', text).replace(';}', '}')
+
+
+def minify_js(text):
+    # without rjsmin the scripts are only concatenated; the libraries already
+    # ship minified and the app's own scripts are tiny
+    text = SOURCE_MAP.sub('', text)
+    try:
+        import rjsmin
+        return rjsmin.jsmin(text)
+    except ImportError:
+        return text
+
+
+def rebase_urls(text, source, dist):
+    # url(...) in a stylesheet is relative to that stylesheet, not to the bundle
+    def rebase(match):
+        quote, target = match.groups()
+        if re.match(r'^(?:[a-z]+:|/|#)', target, re.I):
+            return match.group(0)
+        path, sep, suffix = target.partition('?') if '?' in target else target.partition('#')
+        absolute = os.path.normpath(os.path.join(os.path.dirname(source), path))
+        return 'url({0}{1}{2}{3}{0})'.format(quote, os.path.relpath(absolute, dist).replace(os.sep, '/'), sep, suffix)
+    return CSS_URL.sub(rebase, text)
+
+
+def bundle(static, dist, name, sources):
+    parts = []
+    for source in sources:
+        with open(os.path.join(static, source), encoding='utf-8') as f:
+            text = f.read()
+        if name.endswith('.css'):
+            parts.append(minify_css(rebase_urls(text, os.path.join(static, source), dist)))
+        else:
+            # ';' keeps a file without a trailing semicolon from running into the next
+            parts.append(minify_js(text).strip().rstrip(';') + ';')
+    return '\n'.join(parts).encode('utf-8')
+
+
+def hashed_name(name, content):
+    root, ext = os.path.splitext(name)
+    return '{}.{}{}'.format(root, hashlib.sha256(content).hexdigest()[:12], ext)
+
+
+def write_compressed(path, content):
+    # returns the sizes written, by encoding
+    sizes = {'identity': len(content)}
+    if not path.endswith(COMPRESSIBLE) or len(content) < MIN_COMPRESS_SIZE:
+        return sizes
+    with open(path + '.gz', 'wb') as f:
+        # mtime=0 so rebuilding the same content gives the same bytes
+        with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=9, mtime=0) as gz:
+            gz.write(content)
+    sizes['gzip'] = os.path.getsize(path + '.gz')
+    try:
+        import brotli
+    except ImportError:
+        return sizes
+    with open(path + '.br', 'wb') as f:
+        f.write(brotli.compress(content, quality=11))
+    sizes['br'] = os.path.getsize(path + '.br')
+    return sizes
+
+
+def build(static, dist):
+    # earlier builds are left in place: cached pages and workers that haven't
+    # restarted yet may still link to them
+    os.makedirs(dist, exist_ok=True)
+    manifest, report = {}, {}
+    outputs = [(name, bundle(static, dist, name, sources)) for name, sources in BUNDLES.items()]
+    for name in FILES:
+        with open(os.path.join(static, name), 'rb') as f:
+            outputs.append((name, f.read()))
+    for name, content in outputs:
+        target = hashed_name(name, content)
+        path = os.path.join(dist, target)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        manifest[name] = target
+        report[name] = (target, write_compressed(path, content))
+    with open(os.path.join(dist, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return report
+
+
+class Assets:
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_DIST', 'dist')
+        app.config.setdefault('ASSETS_MAX_AGE', 365 * 24 * 3600)
+        self.dist = os.path.join(app.static_folder, app.config['ASSETS_DIST'])
+        self.load()
+
+        # more specific than the /static/<path> rule, so it wins for built files
+        app.add_url_rule(
+            '{}/{}/<path:filename>'.format(app.static_url_path, app.config['ASSETS_DIST']),
+            'assets',
+            self.send
+        )
+        app.add_template_global(self.asset_url)
+        app.add_template_global(self.asset_urls)
+
+    def load(self):
+        try:
+            with open(os.path.join(self.dist, 'manifest.json')) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+
+    def asset_url(self, name):
+        if name in self.manifest:
+            return url_for('assets', filename=self.manifest[name])
+        return url_for('static', filename=name)
+
+    def asset_urls(self, name):
+        # a bundle is one URL once built, its source files until then
+        if name in self.manifest or name not in BUNDLES:
+            return [self.asset_url(name)]
+        return [url_for('static', filename=source) for source in BUNDLES[name]]
+
+    def send(self, filename):
+        # the precompressed copy the client accepts, if there is one
+        accepted = request.accept_encodings
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[encoding] and os.path.isfile(os.path.join(self.dist, filename + suffix)):
+                response = send_from_directory(self.dist, filename + suffix, mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.dist, filename)
+        response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(current_app.config['ASSETS_MAX_AGE'])
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+@click.group('assets')
+def assets_command():
+    """Build the fingerprinted static bundles."""
+
+
+@assets_command.command('build')
+@with_appcontext
+def build_command():
+    """Bundle, minify, fingerprint and precompress the static assets."""
+    static = current_app.static_folder
+    dist = os.path.join(static, current_app.config['ASSETS_DIST'])
+    for name, (target, sizes) in sorted(build(static, dist).items()):
+        click.echo('{:<28} -> {:<36} {}'.format(name, target, '  '.join(
+            '{} {:.1f}kB'.format(encoding, size / 1024) for encoding, size in sizes.items()
+        )))
+    click.echo('Wrote {}'.format(os.path.join(dist, 'manifest.json')))
+
+
+static_assets = Assets()
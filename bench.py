@@ -0,0 +1,437 @@
+import datetime
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import timeit
+from collections import Counter
+from urllib.parse import urlencode, urlsplit
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, func
+import edits
+from cache import cache
+from explain import busiest
+from filters import DATETIME_FORMATS, format_datetime
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Benchmarks.
+#----------------------------------------------------------------------------#
+
+# Drives every route through the Flask test client and reports latency
+# percentiles and SQL query counts per endpoint. --output writes the results as
+# JSON and --compare checks them against an earlier run, exiting non-zero when an
+# endpoint got slower than --threshold or started issuing more queries.
+#
+# `flask bench-throughput` instead loads a running server over HTTP from many
+# threads at once, to compare the sync (gunicorn 'app:create_app()') and async
+# (uvicorn asgi:application) servers with the same number of workers.
+#
+# `flask bench-startup` times fresh interpreters building the app and running a
+# `flask` command, the cost every worker boot and CLI call pays, and lists the
+# slowest imports behind it.
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def read_routes(venue_id, artist_id):
+    return [
+        ('GET /', 'GET', '/', None),
+        ('GET /venues', 'GET', '/venues', None),
+        ('POST /venues/search', 'POST', '/venues/search', {'search_term': 'Music'}),
+        ('GET /venues/<id>', 'GET', '/venues/%s' % venue_id, None),
+        ('GET /venues/create', 'GET', '/venues/create', None),
+        ('GET /venues/<id>/edit', 'GET', '/venues/%s/edit' % venue_id, None),
+        ('GET /artists', 'GET', '/artists', None),
+        ('POST /artists/search', 'POST', '/artists/search', {'search_term': 'Band'}),
+        ('GET /artists/<id>', 'GET', '/artists/%s' % artist_id, None),
+        ('GET /artists/create', 'GET', '/artists/create', None),
+        ('GET /artists/<id>/edit', 'GET', '/artists/%s/edit' % artist_id, None),
+        ('GET /shows', 'GET', '/shows', None),
+        ('GET /shows?when=upcoming', 'GET', '/shows?when=upcoming', None),
+        ('GET /shows?when=past', 'GET', '/shows?when=past', None),
+        ('GET /shows/create', 'GET', '/shows/create', None),
+        ('GET /shows/tour', 'GET', '/shows/tour', None),
+        ('GET /venues/<id>/calendar.ics', 'GET', '/venues/%s/calendar.ics' % venue_id, None),
+        ('GET /artists/<id>/calendar.ics', 'GET', '/artists/%s/calendar.ics' % artist_id, None),
+        ('GET /api/v1/venues', 'GET', '/api/v1/venues', None),
+        ('GET /api/v1/venues?format=ndjson', 'GET', '/api/v1/venues?format=ndjson', None),
+        ('GET /api/v1/venues/<id>', 'GET', '/api/v1/venues/%s' % venue_id, None),
+        ('GET /api/v1/venues/<id>/shows', 'GET', '/api/v1/venues/%s/shows' % venue_id, None),
+        ('GET /api/v1/venues/<id>/suggestions', 'GET', '/api/v1/venues/%s/suggestions' % venue_id, None),
+        ('GET /api/v1/artists', 'GET', '/api/v1/artists', None),
+        ('GET /api/v1/artists/<id>', 'GET', '/api/v1/artists/%s' % artist_id, None),
+        ('GET /api/v1/artists/<id>/shows', 'GET', '/api/v1/artists/%s/shows' % artist_id, None),
+        ('GET /api/v1/artists/<id>/suggestions', 'GET', '/api/v1/artists/%s/suggestions' % artist_id, None),
+        ('GET /api/v1/shows', 'GET', '/api/v1/shows', None),
+    ]
+
+
+def write_routes(venue_id, artist_id):
+    venue = db.session.query(Venue).get(venue_id)
+    artist = db.session.query(Artist).get(artist_id)
+    venue_form = {
+        'name': venue.name, 'city': venue.city, 'state': venue.state, 'address': venue.address or '',
+        'phone': venue.phone or '', 'genres': venue.genres, 'facebook_link': venue.facebook_link or ''
+    }
+    artist_form = {
+        'name': artist.name, 'city': artist.city, 'state': artist.state, 'phone': artist.phone or '',
+        'genres': artist.genres, 'facebook_link': artist.facebook_link or ''
+    }
+
+    # each edit only goes through with the row's current version token, read
+    # again before every request since the previous one moved it
+    def edit_form(model, id, form):
+        def data():
+            updated_at = db.session.query(model.updated_at).filter(model.id == id).scalar()
+            return dict(form, version=edits.version_token(updated_at))
+        return data
+
+    show_form = {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': '2030-01-01 20:00:00'}
+
+    # a new week every request, so each tour is booked rather than rejected as a double-booking
+    weeks = iter(range(1, 1000000))
+
+    def tour_form():
+        start = datetime.datetime(2031, 1, 1, 20, 0) + datetime.timedelta(weeks=next(weeks))
+        lines = ['{}, {}, {:%Y-%m-%d %H:%M}'.format(artist_id, venue_id, start + datetime.timedelta(days=day)) for day in range(5)]
+        return {'shows': '\n'.join(lines)}
+
+    return [
+        ('POST /venues/create', 'POST', '/venues/create', dict(venue_form, name='Bench Venue')),
+        ('POST /venues/<id>/edit', 'POST', '/venues/%s/edit' % venue_id, edit_form(Venue, venue_id, venue_form)),
+        ('POST /artists/create', 'POST', '/artists/create', dict(artist_form, name='Bench Artist')),
+        ('POST /artists/<id>/edit', 'POST', '/artists/%s/edit' % artist_id, edit_form(Artist, artist_id, artist_form)),
+        ('POST /shows/create', 'POST', '/shows/create', show_form),
+        ('POST /shows/tour', 'POST', '/shows/tour', tour_form),
+    ]
+
+
+def run_routes(app, routes, requests, warmup, warm_cache):
+    counter = {'queries': 0}
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counter['queries'] += 1
+
+    # the primary and, with DATABASE_REPLICA_URLS, every replica a read may go to
+    replicas = app.extensions.get('replicas')
+    engines = [db.engine] + ([replica.engine for replica in replicas.replicas] if replicas is not None else [])
+    client = app.test_client()
+    results = {}
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', count)
+    try:
+        for name, method, url, data in routes:
+            timings, queries, status = [], [], None
+            for n in range(warmup + requests):
+                if not warm_cache:
+                    cache.clear()
+                form = data() if callable(data) else data
+                counter['queries'] = 0
+                started = time.perf_counter()
+                response = client.open(url, method=method, data=form)
+                # reading the body runs streamed pages to completion
+                response.get_data()
+                elapsed = (time.perf_counter() - started) * 1000
+                response.close()
+                status = response.status_code
+                if n >= warmup:
+                    timings.append(elapsed)
+                    queries.append(counter['queries'])
+            results[name] = {
+                'status': status,
+                'requests': requests,
+                'p50_ms': round(percentile(timings, 0.50), 3),
+                'p90_ms': round(percentile(timings, 0.90), 3),
+                'p99_ms': round(percentile(timings, 0.99), 3),
+                'max_ms': round(max(timings), 3),
+                'queries': max(queries)
+            }
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', count)
+    return results
+
+
+def regressions(baseline, current, threshold):
+    found = []
+    for name, result in current.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['queries'] > before['queries']:
+            found.append('{}: {} -> {} queries'.format(name, before['queries'], result['queries']))
+        if before['p50_ms'] and result['p50_ms'] > before['p50_ms'] * (1 + threshold):
+            found.append('{}: p50 {:.2f}ms -> {:.2f}ms'.format(name, before['p50_ms'], result['p50_ms']))
+    return found
+
+
+@click.command('bench')
+@click.option('--requests', default=20, show_default=True, help='Measured requests per endpoint.')
+@click.option('--warmup', default=2, show_default=True, help='Unmeasured requests per endpoint.')
+@click.option('--warm-cache', is_flag=True, help='Keep the page cache between requests instead of measuring the database path.')
+@click.option('--include-writes', is_flag=True, help='Also benchmark the POST handlers. They insert rows: use a disposable database.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results to this JSON file.')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), help='JSON results of an earlier run to compare against.')
+@click.option('--threshold', default=0.2, show_default=True, help='Allowed p50 slowdown before --compare reports a regression.')
+@with_appcontext
+def bench_command(requests, warmup, warm_cache, include_writes, output, compare, threshold):
+    """Benchmark every route and report latency and query counts."""
+    app = current_app._get_current_object()
+    venue_id = busiest(Show.venue_id) or db.session.query(func.min(Venue.id)).scalar()
+    artist_id = busiest(Show.artist_id) or db.session.query(func.min(Artist.id)).scalar()
+    if venue_id is None or artist_id is None:
+        raise click.ClickException('The database has no venues or artists; run `flask seed` first.')
+
+    routes = read_routes(venue_id, artist_id)
+    if include_writes:
+        routes += write_routes(venue_id, artist_id)
+    db.session.remove()
+    results = run_routes(app, routes, requests, warmup, warm_cache)
+
+    click.echo('{:<40} {:>6} {:>9} {:>9} {:>9} {:>8}'.format('endpoint', 'status', 'p50 ms', 'p90 ms', 'p99 ms', 'queries'))
+    for name, result in results.items():
+        click.echo('{:<40} {:>6} {:>9.2f} {:>9.2f} {:>9.2f} {:>8}'.format(
+            name, result['status'], result['p50_ms'], result['p90_ms'], result['p99_ms'], result['queries']
+        ))
+
+    report = {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'requests': requests,
+            'warm_cache': warm_cache,
+            'venues': db.session.query(func.count(Venue.id)).scalar(),
+            'artists': db.session.query(func.count(Artist.id)).scalar(),
+            'shows': db.session.query(func.count(Show.show_id)).scalar()
+        },
+        'endpoints': results
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)['endpoints']
+        found = regressions(baseline, results, threshold)
+        for line in found:
+            click.echo('REGRESSION ' + line)
+        if found:
+            raise SystemExit(1)
+        click.echo('No regressions against {}'.format(compare))
+
+
+def format_datetime_from_string(value, format='medium'):
+    # the filter as it was: every view stringified start_time and every call re-parsed it
+    import babel.dates
+    import dateutil.parser
+    date = dateutil.parser.parse(value)
+    return babel.dates.format_datetime(date, DATETIME_FORMATS.get(format, format))
+
+
+@click.command('bench-datetime')
+@click.option('--iterations', default=20000, show_default=True)
+def bench_datetime_command(iterations):
+    """Compare the datetime filter against the old string round trip."""
+    value = datetime.datetime(2019, 5, 21, 21, 30)
+    for format in ('full', 'medium'):
+        assert format_datetime(value, format) == format_datetime_from_string(str(value), format)
+        old = timeit.timeit(lambda: format_datetime_from_string(str(value), format), number=iterations)
+        new = timeit.timeit(lambda: format_datetime(value, format), number=iterations)
+        click.echo('{:<7} string round trip {:7.2f}us   datetime {:7.2f}us   saved {:7.2f}us/call ({:.1f}x)'.format(
+            format, old / iterations * 1e6, new / iterations * 1e6, (old - new) / iterations * 1e6, old / new
+        ))
+
+
+def throughput_routes(venue_id, artist_id):
+    # the pages the async server answers itself
+    return [
+        ('GET', '/venues', None),
+        ('GET', '/venues/%s' % venue_id, None),
+        ('POST', '/venues/search', {'search_term': 'Music'}),
+        ('GET', '/artists', None),
+        ('GET', '/artists/%s' % artist_id, None),
+        ('POST', '/artists/search', {'search_term': 'Band'}),
+        ('GET', '/shows', None),
+        ('GET', '/shows?when=upcoming', None),
+    ]
+
+
+def hammer(base_url, routes, concurrency, duration):
+    # every thread keeps one keep-alive connection and cycles through the routes
+    target = urlsplit(base_url)
+    deadline = time.monotonic() + duration
+    timings = {(method, url): [] for method, url, data in routes}
+    errors = Counter()
+    lock = threading.Lock()
+
+    def connect():
+        return http.client.HTTPConnection(target.hostname, target.port or 80, timeout=60)
+
+    def worker(offset):
+        connection = connect()
+        n = offset
+        while time.monotonic() < deadline:
+            method, url, data = routes[n % len(routes)]
+            n += 1
+            body = urlencode(data, doseq=True) if data else None
+            headers = {'Content-Type': 'application/x-www-form-urlencoded'} if data else {}
+            started = time.perf_counter()
+            try:
+                connection.request(method, url, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+                connection.close()
+                connection = connect()
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                if ok:
+                    timings[method, url].append(elapsed)
+                else:
+                    errors[method, url] += 1
+        connection.close()
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, errors, time.monotonic() - started
+
+
+@click.command('bench-throughput')
+@click.argument('base_url', default='http://127.0.0.1:8000')
+@click.option('--concurrency', default=64, show_default=True, help='Requests kept in flight.')
+@click.option('--duration', default=30, show_default=True, help='Seconds to run.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results to this JSON file.')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), help='JSON results of another server to compare against.')
+@with_appcontext
+def bench_throughput_command(base_url, concurrency, duration, output, compare):
+    """Measure requests per second of a running server on the read pages."""
+    venue_id = busiest(Show.venue_id) or db.session.query(func.min(Venue.id)).scalar()
+    artist_id = busiest(Show.artist_id) or db.session.query(func.min(Artist.id)).scalar()
+    if venue_id is None or artist_id is None:
+        raise click.ClickException('The database has no venues or artists; run `flask seed` first.')
+    db.session.remove()
+
+    timings, errors, elapsed = hammer(base_url.rstrip('/'), throughput_routes(venue_id, artist_id), concurrency, duration)
+
+    results = {}
+    click.echo('{:<28} {:>8} {:>8} {:>9} {:>9}'.format('endpoint', 'req/s', 'errors', 'p50 ms', 'p99 ms'))
+    for (method, url), samples in timings.items():
+        name = '{} {}'.format(method, url)
+        results[name] = {
+            'rps': round(len(samples) / elapsed, 1),
+            'errors': errors[method, url],
+            'p50_ms': round(percentile(samples, 0.50), 3) if samples else None,
+            'p99_ms': round(percentile(samples, 0.99), 3) if samples else None
+        }
+        click.echo('{:<28} {:>8.1f} {:>8} {:>9} {:>9}'.format(
+            name, results[name]['rps'], results[name]['errors'], results[name]['p50_ms'], results[name]['p99_ms']
+        ))
+    total = sum(len(samples) for samples in timings.values()) / elapsed
+    click.echo('total {:.1f} req/s at concurrency {}'.format(total, concurrency))
+
+    report = {
+        'meta': {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'base_url': base_url, 'concurrency': concurrency, 'duration': duration},
+        'total_rps': round(total, 1),
+        'endpoints': results
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)
+        click.echo('total {:.1f} -> {:.1f} req/s ({:+.0%})'.format(
+            baseline['total_rps'], total, total / baseline['total_rps'] - 1 if baseline['total_rps'] else 0
+        ))
+        for name, result in results.items():
+            before = baseline['endpoints'].get(name)
+            if before:
+                click.echo('  {:<28} {:>8.1f} -> {:>8.1f} req/s'.format(name, before['rps'], result['rps']))
+
+
+# works against trees from before create_app() too, for --compare across commits
+STARTUP_APP = "import app; getattr(app, 'create_app', lambda: app.app)()"
+STARTUP_TARGETS = [
+    ('python', ['-c', 'pass']),
+    ('import app', ['-c', STARTUP_APP]),
+    ('flask --help', ['-m', 'flask', '--help']),
+    ('flask routes', ['-m', 'flask', 'routes']),
+]
+
+
+def time_process(args, cwd, env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - started) * 1000
+
+
+def slowest_imports(cwd, env, count):
+    # what app.py imports directly, by cumulative time, from python -X importtime
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_APP],
+        cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True
+    ).stderr
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # ' app' is the top level, its own imports are one level (two spaces) further in
+        if len(name) - len(name.lstrip(' ')) == 3:
+            imports.append((int(cumulative_us), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+@click.command('bench-startup')
+@click.option('--runs', default=10, show_default=True, help='Fresh interpreters per target.')
+@click.option('--imports', 'import_count', default=15, show_default=True, help='Slowest imports of app.py to list.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results to this JSON file.')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), help='JSON results of an earlier run to compare against.')
+def bench_startup_command(runs, import_count, output, compare):
+    """Time cold starts: building the app and running flask commands."""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, FLASK_APP='app')
+    env.pop('FLASK_RUN_FROM_CLI', None)
+
+    results = {}
+    click.echo('{:<16} {:>9} {:>9}'.format('target', 'min ms', 'p50 ms'))
+    for name, args in STARTUP_TARGETS:
+        # one unmeasured run so every target starts from a warm disk cache
+        time_process(args, cwd, env)
+        samples = [time_process(args, cwd, env) for n in range(runs)]
+        results[name] = {'min_ms': round(min(samples), 1), 'p50_ms': round(statistics.median(samples), 1)}
+        click.echo('{:<16} {:>9.1f} {:>9.1f}'.format(name, results[name]['min_ms'], results[name]['p50_ms']))
+
+    click.echo('')
+    click.echo('slowest imports of the app:')
+    for cumulative_us, name in slowest_imports(cwd, env, import_count):
+        click.echo('  {:>8.1f} ms  {}'.format(cumulative_us / 1000, name))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'meta': {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'runs': runs}, 'targets': results}, f, indent=2)
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)['targets']
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before:
+                click.echo('{:<16} {:>9.1f} -> {:>9.1f} ms p50 ({:+.0%})'.format(
+                    name, before['p50_ms'], result['p50_ms'], result['p50_ms'] / before['p50_ms'] - 1
+                ))
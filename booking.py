@@ -0,0 +1,153 @@
+import datetime
+from collections import defaultdict
+from sqlalchemy import and_, literal, or_, text, union_all
+import counters
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Tour booking.
+#----------------------------------------------------------------------------#
+
+# A tour is a list of (artist_id, venue_id, start_time) entries booked in one
+# transaction. Every id is checked in one query, the venues and artists involved
+# are locked for the rest of the transaction (advisory locks, so two tours for the
+# same venue queue up instead of both passing the check), double-bookings against
+# existing shows come from one indexed range query, and the accepted shows go in
+# with one executemany. Each entry gets its own result.
+
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M')
+VENUE_LOCK, ARTIST_LOCK = 1, 2
+
+
+def parse_start_time(value):
+    if isinstance(value, datetime.datetime):
+        return value
+    if not isinstance(value, str):
+        raise ValueError('start_time must be a string, not {}'.format(type(value).__name__))
+    for format in TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(value.strip(), format)
+        except ValueError:
+            pass
+    raise ValueError('start_time must look like YYYY-MM-DD HH:MM')
+
+
+def parse_entries(items):
+    # items are dicts or 'artist_id, venue_id, start_time' lines; returns the entries
+    # with every malformed one already rejected
+    entries = []
+    for line, item in enumerate(items, start=1):
+        entry = {'line': line, 'status': 'rejected', 'reason': None}
+        try:
+            if isinstance(item, str):
+                artist_id, venue_id, start_time = [part.strip() for part in item.split(',', 2)]
+            else:
+                artist_id, venue_id, start_time = item['artist_id'], item['venue_id'], item['start_time']
+            entry.update(
+                artist_id=int(artist_id),
+                venue_id=int(venue_id),
+                start_time=parse_start_time(start_time),
+                status=None
+            )
+        except (KeyError, TypeError, ValueError) as error:
+            entry['input'] = item
+            entry['reason'] = 'Expected artist_id, venue_id, YYYY-MM-DD HH:MM ({})'.format(error)
+        entries.append(entry)
+    return entries
+
+
+def existing_ids(artist_ids, venue_ids):
+    # one round trip for both tables
+    if not artist_ids and not venue_ids:
+        return set(), set()
+    query = union_all(
+        db.session.query(literal('artist').label('kind'), Artist.id).filter(Artist.id.in_(artist_ids), Artist.deleted_at.is_(None)).statement,
+        db.session.query(literal('venue').label('kind'), Venue.id).filter(Venue.id.in_(venue_ids), Venue.deleted_at.is_(None)).statement
+    )
+    found = defaultdict(set)
+    for kind, id in db.session.execute(query):
+        found[kind].add(id)
+    return found['artist'], found['venue']
+
+
+def lock(artist_ids, venue_ids):
+    # always taken in the same order, so concurrent tours can't deadlock
+    keys = sorted([(VENUE_LOCK, id) for id in venue_ids] + [(ARTIST_LOCK, id) for id in artist_ids])
+    if keys:
+        db.session.execute(
+            text('SELECT pg_advisory_xact_lock(k.kind, k.id) FROM unnest(:kinds, :ids) AS k(kind, id) ORDER BY k.kind, k.id'),
+            {'kinds': [kind for kind, id in keys], 'ids': [id for kind, id in keys]}
+        )
+
+
+def clashing_shows(entries, duration):
+    # each condition is a range scan on shows(venue_id, start_time) or
+    # shows(artist_id, start_time); shows of a deleted venue or artist that
+    # the purger hasn't removed yet don't count
+    conditions = []
+    for entry in entries:
+        start, end = entry['start_time'] - duration, entry['start_time'] + duration
+        conditions.append(and_(Show.venue_id == entry['venue_id'], Show.start_time > start, Show.start_time < end))
+        conditions.append(and_(Show.artist_id == entry['artist_id'], Show.start_time > start, Show.start_time < end))
+    if not conditions:
+        return []
+    return db.session.query(Show.show_id, Show.venue_id, Show.artist_id, Show.start_time).join(
+        Venue, Venue.id == Show.venue_id
+    ).join(
+        Artist, Artist.id == Show.artist_id
+    ).filter(
+        or_(*conditions),
+        Venue.deleted_at.is_(None),
+        Artist.deleted_at.is_(None)
+    ).all()
+
+
+def clash_reason(entry, other, duration):
+    if abs(entry['start_time'] - other.start_time) >= duration:
+        return None
+    when = other.start_time.strftime('%Y-%m-%d %H:%M')
+    if other.venue_id == entry['venue_id']:
+        return 'Venue {} is already booked at {}'.format(entry['venue_id'], when)
+    if other.artist_id == entry['artist_id']:
+        return 'Artist {} is already playing at {}'.format(entry['artist_id'], when)
+    return None
+
+
+def book_tour(items, duration):
+    entries = parse_entries(items)
+    pending = [entry for entry in entries if entry['status'] is None]
+
+    artist_ids = {entry['artist_id'] for entry in pending}
+    venue_ids = {entry['venue_id'] for entry in pending}
+    known_artists, known_venues = existing_ids(artist_ids, venue_ids)
+    for entry in pending:
+        if entry['artist_id'] not in known_artists:
+            entry.update(status='rejected', reason='No artist with id {}'.format(entry['artist_id']))
+        elif entry['venue_id'] not in known_venues:
+            entry.update(status='rejected', reason='No venue with id {}'.format(entry['venue_id']))
+    pending = [entry for entry in pending if entry['status'] is None]
+
+    lock({entry['artist_id'] for entry in pending}, {entry['venue_id'] for entry in pending})
+    existing = clashing_shows(pending, duration)
+
+    # earlier dates in the tour win over later ones that clash with them
+    accepted = []
+    for entry in sorted(pending, key=lambda entry: (entry['start_time'], entry['line'])):
+        for other in existing + accepted:
+            reason = clash_reason(entry, other, duration)
+            if reason:
+                entry.update(status='rejected', reason=reason)
+                break
+        else:
+            entry['status'] = 'booked'
+            accepted.append(Show(venue_id=entry['venue_id'], artist_id=entry['artist_id'], start_time=entry['start_time']))
+
+    if accepted:
+        db.session.execute(Show.__table__.insert(), [{
+            'venue_id': show.venue_id,
+            'artist_id': show.artist_id,
+            'start_time': show.start_time
+        } for show in accepted])
+        counters.adjust(db.session.connection(), [(show.venue_id, show.artist_id, show.start_time) for show in accepted])
+    db.session.commit()
+    return entries
@@ -0,0 +1,188 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+from flask import Response, g, request, session
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+# Rendered read pages are cached under a tag ('venues', 'venue:4', ...) and the
+# write handlers invalidate exactly the tags they touch. Every cached key belongs
+# to one tag, so invalidating a tag drops all query-string variants of that page.
+# An invalidation has to reach every worker, so with more than one the backend
+# must be the shared 'redis' one; the per-process 'local' LRU is refused.
+#
+# Pages read from a read replica (see replicas.py) are served but not stored: a
+# replica can still be behind a write whose invalidation has already run, and
+# would put the page from before it back for CACHE_TTL. The cache is filled by
+# the pages read from the primary instead, such as the ones a writer is sent to.
+
+
+def from_primary(state):
+    # state is the request's g, kept past the request for streamed pages
+    return state.get('db_replica') is None
+
+
+class LocalBackend:
+    # bounded in-process LRU with per-entry expiry
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, tag, value = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, tag):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, tag, value)
+            self.tags.setdefault(tag, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate(self, tag):
+        with self.lock:
+            for key in list(self.tags.get(tag, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tags.clear()
+
+    def _remove(self, key):
+        expires, tag, value = self.entries.pop(key)
+        keys = self.tags.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.tags[tag]
+
+
+class RedisBackend:
+    # shared between workers; each tag is a redis set of the keys cached under it
+
+    def __init__(self, url, ttl, prefix='fyyur:page:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, tag):
+        tag_key = self.prefix + 'tag:' + tag
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, value.encode('utf-8'), ex=self.ttl)
+        pipe.sadd(tag_key, self.prefix + key)
+        pipe.expire(tag_key, self.ttl)
+        pipe.execute()
+
+    def invalidate(self, tag):
+        tag_key = self.prefix + 'tag:' + tag
+        keys = self.client.smembers(tag_key)
+        self.client.delete(tag_key, *keys)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class PageCache:
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('WEB_CONCURRENCY', 1)
+        app.config.setdefault('CACHE_BACKEND', 'local')
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('CACHE_TTL', 300)
+        app.config.setdefault('CACHE_REDIS_URL', None)
+        app.config.setdefault('CACHE_MAX_PAGE_SIZE', 1024 * 1024)
+        self.max_page_size = app.config['CACHE_MAX_PAGE_SIZE']
+
+        if app.config['CACHE_BACKEND'] == 'local' and app.config['WEB_CONCURRENCY'] > 1:
+            # the other workers would keep serving the pages a write invalidated
+            raise RuntimeError("CACHE_BACKEND 'local' can't serve more than one worker; use 'redis' or 'none'")
+        if app.config['CACHE_BACKEND'] == 'redis':
+            self.backend = RedisBackend(app.config['CACHE_REDIS_URL'], app.config['CACHE_TTL'])
+        elif app.config['CACHE_BACKEND'] == 'local':
+            self.backend = LocalBackend(app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_TTL'])
+        else:
+            self.backend = None
+
+    def tee(self, chunks, key, tag, state):
+        # streamed pages are stored once they have been sent in full; pages that
+        # fail halfway, grow past CACHE_MAX_PAGE_SIZE or were read from a
+        # replica are not stored at all
+        parts, size = [], 0
+        for chunk in chunks:
+            if parts is not None:
+                size += len(chunk)
+                if size > self.max_page_size:
+                    parts = None
+                else:
+                    parts.append(chunk)
+            yield chunk
+        if parts is not None and from_primary(state):
+            self.backend.set(key, ''.join(parts), tag)
+
+    def invalidate(self, *tags):
+        if self.backend is None:
+            return
+        for tag in tags:
+            self.backend.invalidate(tag)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def cached(self, tag):
+        # tag may reference the view's arguments, e.g. 'venue:{venue_id}'
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**kwargs):
+                # pages carrying flashed messages are per-user, never share them
+                if self.backend is None or request.method != 'GET' or '_flashes' in session:
+                    return view(**kwargs)
+
+                page_tag = tag.format(**kwargs)
+                key = page_tag + '|' + request.full_path
+                page = self.backend.get(key)
+                if page is None:
+                    page = view(**kwargs)
+                    if isinstance(page, str):
+                        if from_primary(g):
+                            self.backend.set(key, page, page_tag)
+                    elif isinstance(page, Response) and page.is_streamed and page.status_code == 200:
+                        # the replica is only chosen at the first query, which a
+                        # streamed page runs while it is sent
+                        page.response = self.tee(page.response, key, page_tag, g._get_current_object())
+                return page
+            return wrapper
+        return decorator
+
+
+cache = PageCache()
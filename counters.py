@@ -0,0 +1,204 @@
+import datetime
+from collections import Counter
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, bindparam, event, func, select, text
+from cache import cache
+from models import db, Venue, Artist, Show, ShowCounters
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venues and artists carry upcoming_shows_count and past_shows_count, so the
+# listings can show and sort by them without touching shows. "Upcoming" means
+# starting at or after show_counters.rolled_at rather than now: inserts and
+# deletes adjust the counters against that watermark, and `flask roll-shows`
+# (run from cron every few minutes) moves the shows that started since the last
+# roll from upcoming to past and advances it. The watermark row is the lock
+# between the two: writers hold it FOR SHARE until they commit, a roll holds it
+# FOR UPDATE, so a show is never counted on the wrong side of a roll.
+#
+# Only shows whose venue and artist are both live are counted. Soft-deleting a
+# venue or artist takes its shows off the other side's counters at once
+# (remove_owner), and the purge that deletes those shows later leaves the
+# counters alone.
+#
+# ORM inserts and deletes of Show are counted by the mapper events below, which
+# init_app() registers for every app, whatever imports it. Core bulk paths
+# either call adjust() themselves or finish with recount().
+
+LIVE_SHOWS = '''
+shows JOIN venues ON venues.id = shows.venue_id AND venues.deleted_at IS NULL
+      JOIN artists ON artists.id = shows.artist_id AND artists.deleted_at IS NULL
+'''
+
+RECOUNT = '''
+UPDATE {table} SET
+    upcoming_shows_count = COALESCE(counts.upcoming, 0),
+    past_shows_count = COALESCE(counts.past, 0)
+FROM {table} AS t LEFT JOIN (
+    SELECT shows.{column} AS id,
+           count(*) FILTER (WHERE shows.start_time >= :now) AS upcoming,
+           count(*) FILTER (WHERE shows.start_time < :now) AS past
+    FROM ''' + LIVE_SHOWS + ''' GROUP BY shows.{column}
+) AS counts ON counts.id = t.id
+WHERE {table}.id = t.id
+'''
+
+# the owner's shows, off the counters of the other side's live rows
+REMOVE_OWNER = '''
+UPDATE {table} SET
+    upcoming_shows_count = {table}.upcoming_shows_count - counts.upcoming,
+    past_shows_count = {table}.past_shows_count - counts.past
+FROM (
+    SELECT {column} AS id,
+           count(*) FILTER (WHERE start_time >= :rolled_at) AS upcoming,
+           count(*) FILTER (WHERE start_time < :rolled_at) AS past
+    FROM shows WHERE {owner_column} = :owner_id GROUP BY {column}
+) AS counts
+WHERE {table}.id = counts.id AND {table}.deleted_at IS NULL
+'''
+
+TARGETS = ((Venue, Show.venue_id, 0), (Artist, Show.artist_id, 1))
+
+
+def watermark(connection, exclusive=False):
+    query = select([ShowCounters.rolled_at]).where(ShowCounters.id == 1).with_for_update(read=not exclusive)
+    return connection.execute(query).scalar()
+
+
+def adjust(connection, shows, delta=1):
+    # shows are (venue_id, artist_id, start_time) that were just inserted (delta=1)
+    # or deleted (delta=-1) in the current transaction
+    if not shows:
+        return
+    rolled_at = watermark(connection) or datetime.datetime.now()
+    for model, column, position in TARGETS:
+        upcoming, past = Counter(), Counter()
+        for show in shows:
+            (upcoming if show[2] >= rolled_at else past)[show[position]] += delta
+        table = model.__table__
+        # ids in order, so concurrent writers lock rows in the same order
+        connection.execute(
+            table.update().where(table.c.id == bindparam('row_id')).values(
+                upcoming_shows_count=table.c.upcoming_shows_count + bindparam('upcoming'),
+                past_shows_count=table.c.past_shows_count + bindparam('past')
+            ),
+            [{'row_id': id, 'upcoming': upcoming[id], 'past': past[id]} for id in sorted(set(upcoming) | set(past))]
+        )
+
+
+def live(connection, shows):
+    # the shows of (venue_id, artist_id, start_time) whose venue and artist are both live
+    if not shows:
+        return shows
+    venue_ids = {show[0] for show in shows}
+    artist_ids = {show[1] for show in shows}
+    live_venues = {id for (id,) in connection.execute(
+        select([Venue.id]).where(Venue.id.in_(venue_ids)).where(Venue.deleted_at.is_(None))
+    )}
+    live_artists = {id for (id,) in connection.execute(
+        select([Artist.id]).where(Artist.id.in_(artist_ids)).where(Artist.deleted_at.is_(None))
+    )}
+    return [show for show in shows if show[0] in live_venues and show[1] in live_artists]
+
+
+def remove_owner(connection, model, id):
+    # called in the transaction that soft-deletes model's row id
+    rolled_at = watermark(connection) or datetime.datetime.now()
+    for other, column, position in TARGETS:
+        if other is model:
+            continue
+        owner_column = Show.venue_id if model is Venue else Show.artist_id
+        connection.execute(
+            text(REMOVE_OWNER.format(table=other.__tablename__, column=column.key, owner_column=owner_column.key)),
+            rolled_at=rolled_at, owner_id=id
+        )
+
+
+def recount(now=None):
+    # rebuilds every counter from shows; for bulk loads and repairs
+    now = now or datetime.datetime.now()
+    connection = db.session.connection()
+    connection.execute(
+        text('INSERT INTO show_counters (id, rolled_at) VALUES (1, :now) ON CONFLICT (id) DO UPDATE SET rolled_at = excluded.rolled_at'),
+        now=now
+    )
+    for model, column, position in TARGETS:
+        connection.execute(text(RECOUNT.format(table=model.__tablename__, column=column.key)), now=now)
+
+
+def roll(now=None):
+    # moves shows that started since the last roll from upcoming to past;
+    # returns the number of shows moved
+    now = now or datetime.datetime.now()
+    connection = db.session.connection()
+    rolled_at = watermark(connection, exclusive=True)
+    if rolled_at is None:
+        recount(now)
+        return None
+    if now <= rolled_at:
+        return 0
+
+    # only live shows are on the counters
+    shows = Show.__table__.join(Venue.__table__, and_(Venue.id == Show.venue_id, Venue.deleted_at.is_(None))).join(
+        Artist.__table__, and_(Artist.id == Show.artist_id, Artist.deleted_at.is_(None))
+    )
+    window = and_(Show.start_time >= rolled_at, Show.start_time < now)
+    moved = connection.execute(select([func.count()]).select_from(shows).where(window)).scalar()
+    for model, column, position in TARGETS:
+        crossed = select([column.label('id'), func.count().label('moved')]).select_from(shows).where(
+            window
+        ).group_by(column).alias('crossed')
+        table = model.__table__
+        connection.execute(table.update().where(table.c.id == crossed.c.id).values(
+            upcoming_shows_count=table.c.upcoming_shows_count - crossed.c.moved,
+            past_shows_count=table.c.past_shows_count + crossed.c.moved
+        ))
+    connection.execute(ShowCounters.__table__.update().where(ShowCounters.id == 1).values(rolled_at=now))
+    return moved
+
+
+def show_key(show):
+    start_time = show.start_time
+    if isinstance(start_time, str):
+        # the create form hands start_time over as a string
+        import dateutil.parser
+        start_time = dateutil.parser.parse(start_time)
+    return int(show.venue_id), int(show.artist_id), start_time
+
+
+def count_inserted_show(mapper, connection, target):
+    adjust(connection, live(connection, [show_key(target)]), 1)
+
+
+def count_deleted_show(mapper, connection, target):
+    adjust(connection, live(connection, [show_key(target)]), -1)
+
+
+def init_app(app):
+    if not event.contains(Show, 'after_insert', count_inserted_show):
+        event.listen(Show, 'after_insert', count_inserted_show)
+        event.listen(Show, 'after_delete', count_deleted_show)
+
+
+@click.command('roll-shows')
+@click.option('--recount', 'full', is_flag=True, help='Rebuild every counter from the shows table instead.')
+@with_appcontext
+def roll_shows_command(full):
+    """Move shows that have started from the upcoming to the past counters."""
+    if full:
+        recount()
+        db.session.commit()
+        cache.invalidate('venues', 'artists')
+        click.echo('Recounted shows for every venue and artist')
+        return
+    moved = roll()
+    db.session.commit()
+    if moved != 0:
+        cache.invalidate('venues', 'artists')
+    if moved is None:
+        click.echo('No watermark yet, recounted shows for every venue and artist')
+    else:
+        click.echo('{} shows moved to past'.format(moved))
@@ -0,0 +1,105 @@
+import datetime
+from sqlalchemy import and_, func, null
+from models import db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Edits.
+#----------------------------------------------------------------------------#
+
+# An edit is a single UPDATE ... RETURNING that sets only the fields the request
+# sent, and only if the row's updated_at is still the one the edit form was
+# rendered with. Two people editing the same venue can't overwrite each other:
+# whoever saves second matches no row and gets a conflict instead, and nothing
+# is read before the write to find that out.
+#
+# updated_at only moves on edits. The show counters are updated in place and
+# leave it alone, so booking a show never invalidates an open edit form.
+
+EDITABLE = {
+    Venue: ['name', 'city', 'state', 'address', 'phone', 'genres', 'image_link', 'facebook_link'],
+    Artist: [
+        'name', 'city', 'state', 'phone', 'genres', 'image_link', 'facebook_link',
+        'website', 'seeking_venue', 'seeking_description'
+    ],
+}
+SEARCH_TEXT_FIELDS = ('name', 'city', 'state', 'genres')
+
+
+def version_token(updated_at):
+    return updated_at.isoformat()
+
+
+def parse_version(token):
+    # raises ValueError on anything version_token() could not have produced
+    if not token:
+        raise ValueError('missing version')
+    return datetime.datetime.fromisoformat(token)
+
+
+def submitted_values(model, formdata):
+    # the editable fields present in the request; a field that wasn't sent is
+    # left as it is rather than blanked
+    values = {}
+    for field in EDITABLE[model]:
+        if field == 'genres':
+            # a multi-select with nothing chosen isn't sent at all
+            if 'genres' in formdata:
+                values['genres'] = formdata.getlist('genres')
+        elif field == 'seeking_venue':
+            if field in formdata:
+                values[field] = formdata[field] in ('y', 'on', 'true', 'True', '1')
+        elif field in formdata:
+            values[field] = formdata[field]
+    return values
+
+
+def conflicting_values(record, values):
+    # the stored value of each submitted field that differs from what was
+    # submitted, to show next to it after a conflict
+    conflicts = {}
+    for field, value in values.items():
+        stored = getattr(record, field)
+        if field == 'genres':
+            if sorted(stored or []) != sorted(value):
+                conflicts[field] = ', '.join(stored or [])
+        elif (stored or '') != (value or ''):
+            conflicts[field] = stored
+    return conflicts
+
+
+def search_text_expression(model, values):
+    # build_search_text() in SQL, from the new values where they were sent and
+    # the stored ones where they weren't
+    def part(field):
+        if field in values:
+            return values[field] or None
+        return func.nullif(getattr(model, field), '')
+    if 'genres' in values:
+        genres = ' '.join(genre for genre in values['genres'] if genre) or None
+    else:
+        genres = func.nullif(func.array_to_string(model.genres, ' '), '')
+    return func.concat_ws(' ', part('name'), part('city'), part('state'), genres)
+
+
+def update_record(model, id, version, values):
+    # returns (updated_at, old_genres), or None if the row is gone or was edited
+    # since version; old_genres is only read when genres were sent, from the
+    # row as it was before this statement, for the genre facets
+    values = dict(values)
+    if any(field in values for field in SEARCH_TEXT_FIELDS):
+        values['search_text'] = search_text_expression(model, values)
+    values['updated_at'] = func.localtimestamp()
+    condition = and_(
+        model.id == id,
+        model.updated_at == version,
+        model.deleted_at.is_(None)
+    )
+    if 'genres' in values:
+        # UPDATE ... FROM a second copy of the row, which still holds the old values
+        old = model.__table__.alias('old')
+        condition = and_(condition, old.c.id == model.id)
+        returning = (model.updated_at, old.c.genres.label('old_genres'))
+    else:
+        returning = (model.updated_at, null().label('old_genres'))
+    statement = model.__table__.update().where(condition).values(**values).returning(*returning)
+    return db.session.execute(statement).first()
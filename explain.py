@@ -0,0 +1,105 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, func
+from cache import cache
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Query plans.
+#----------------------------------------------------------------------------#
+
+# Runs every read route through the test client, records the SELECTs it issues
+# and prints EXPLAIN ANALYZE for each one. With --compare each plan is printed a
+# second time with the hot query indexes (revision 8c4d2e6f1a93) dropped inside a
+# transaction that is rolled back, i.e. the plan the app got before that migration.
+# DROP INDEX locks the tables until the rollback: run it against a dev database.
+
+HOT_QUERY_INDEXES = [
+    'ix_shows_venue_id_start_time',
+    'ix_shows_artist_id_start_time',
+    'ix_venues_city_state',
+    'ix_venues_genres',
+    'ix_artists_genres',
+]
+
+
+def busiest(column):
+    return db.session.query(column).group_by(column).order_by(func.count().desc()).limit(1).scalar()
+
+
+def sample_routes():
+    venue_id = busiest(Show.venue_id) or db.session.query(func.min(Venue.id)).scalar()
+    artist_id = busiest(Show.artist_id) or db.session.query(func.min(Artist.id)).scalar()
+    return [
+        ('GET', '/venues', None),
+        ('GET', '/venues/%s' % venue_id, None),
+        ('POST', '/venues/search', {'search_term': 'Music'}),
+        ('GET', '/artists', None),
+        ('GET', '/artists/%s' % artist_id, None),
+        ('POST', '/artists/search', {'search_term': 'Band'}),
+        ('GET', '/shows', None),
+        ('GET', '/shows?when=upcoming', None),
+        ('GET', '/shows?when=past', None),
+    ]
+
+
+def capture_selects(app, method, url, data):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    # a cached page would not touch the database at all
+    cache.clear()
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = app.test_client().open(url, method=method, data=data)
+        response.get_data()
+        response.close()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+def explain(cursor, statement, parameters):
+    cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters)
+    return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+@click.command('explain-queries')
+@click.option('--compare', is_flag=True, help='Also show each plan without the hot query indexes.')
+@with_appcontext
+def explain_queries_command(compare):
+    """Print EXPLAIN ANALYZE for the queries behind each read route."""
+    app = current_app._get_current_object()
+    captured = [(method, url, capture_selects(app, method, url, data)) for method, url, data in sample_routes()]
+
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        before = []
+        if compare:
+            for index in HOT_QUERY_INDEXES:
+                cursor.execute('DROP INDEX IF EXISTS ' + index)
+            for method, url, statements in captured:
+                for statement, parameters in statements:
+                    before.append(explain(cursor, statement, parameters))
+            connection.rollback()
+
+        before = iter(before)
+        for method, url, statements in captured:
+            click.echo('=' * 78)
+            click.echo('{} {}  ({} queries)'.format(method, url, len(statements)))
+            for statement, parameters in statements:
+                click.echo('-' * 78)
+                click.echo(' '.join(statement.split()))
+                if compare:
+                    click.echo('\n-- before --')
+                    click.echo(next(before))
+                    click.echo('\n-- after --')
+                click.echo(explain(cursor, statement, parameters))
+        connection.rollback()
+    finally:
+        connection.close()
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import Counter
+from sqlalchemy import func
+import search
+from models import db
+
+#----------------------------------------------------------------------------#
+# Genre facets.
+#----------------------------------------------------------------------------#
+
+# The "Jazz (132) / Rock (87)" counts on /venues, /artists and the searches are
+# one unnest(genres) ... GROUP BY in Postgres, never rows loaded into Python.
+# A facet counts the rows that match everything on the page except the genre
+# itself, so picking Rock after Jazz shows the Rock count, not Jazz and Rock.
+#
+# The counts over all rows are what the unfiltered listings show on every
+# render, so they are kept per process for FACETS_TTL seconds, and the create,
+# edit and delete handlers adjust them in place by the genres they add and
+# remove instead of dropping them. Other processes catch up when their copy
+# expires. Counts within a city, a state or a search are queried each time;
+# those rows are found through ix_venues_city_state and the trigram index.
+
+
+def facet_query(model, city=None, state=None, term=None):
+    genre = func.unnest(model.genres).label('genre')
+    query = db.session.query(genre, func.count().label('count')).filter(model.deleted_at.is_(None))
+    if city is not None:
+        query = query.filter(model.city == city)
+    if state is not None:
+        query = query.filter(model.state == state)
+    if term is not None:
+        query = query.filter(search.matches(model, term))
+    return query.group_by(genre)
+
+
+def as_facets(counts):
+    # most common first
+    return [
+        {'genre': genre, 'count': count}
+        for genre, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        if count > 0
+    ]
+
+
+def count_rows(rows):
+    return Counter({row.genre: row.count for row in rows})
+
+
+class GenreFacets:
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        # model -> (expires, Counter)
+        self.totals = {}
+        # bumped by every change, so totals counted before a change aren't stored after it
+        self.generations = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FACETS_TTL', 300)
+        self.ttl = app.config['FACETS_TTL']
+
+    def cached(self, model):
+        # (facets or None, generation); hand the generation back to store()
+        with self.lock:
+            generation = self.generations.get(model, 0)
+            entry = self.totals.get(model)
+            if entry is None or entry[0] < time.monotonic():
+                return None, generation
+            return as_facets(entry[1]), generation
+
+    def store(self, model, rows, generation):
+        counts = count_rows(rows)
+        with self.lock:
+            if self.generations.get(model, 0) == generation:
+                self.totals[model] = (time.monotonic() + self.ttl, counts)
+        return as_facets(counts)
+
+    def adjust(self, model, removed=(), added=()):
+        removed, added = set(removed or ()), set(added or ())
+        with self.lock:
+            self.generations[model] = self.generations.get(model, 0) + 1
+            entry = self.totals.get(model)
+            if entry is not None:
+                entry[1].subtract(removed - added)
+                entry[1].update(added - removed)
+
+    def invalidate(self, model):
+        with self.lock:
+            self.generations[model] = self.generations.get(model, 0) + 1
+            self.totals.pop(model, None)
+
+    def lookup(self, model, city=None, state=None, term=None):
+        # (facets, None, None) when they are cached, else (None, query, collect):
+        # collect(rows) turns the query's rows into the facets, caching them when
+        # they are the totals. For callers that run the query themselves (asgi.py).
+        # An empty search matches everything, like no search at all.
+        term = (term or '').strip() or None
+        if city is None and state is None and term is None:
+            facets, generation = self.cached(model)
+            if facets is not None:
+                return facets, None, None
+            return None, facet_query(model), lambda rows: self.store(model, rows, generation)
+        return None, facet_query(model, city, state, term), lambda rows: as_facets(count_rows(rows))
+
+    def counts(self, model, city=None, state=None, term=None):
+        facets, query, collect = self.lookup(model, city, state, term)
+        return facets if query is None else collect(query)
+
+
+genre_facets = GenreFacets()
@@ -0,0 +1,39 @@
+import datetime
+import functools
+
+#----------------------------------------------------------------------------#
+# Filters.
+#----------------------------------------------------------------------------#
+
+# Babel and dateutil are imported on the first call rather than with the module,
+# so only processes that render a date pay for loading them.
+
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma"
+}
+
+
+@functools.lru_cache(maxsize=64)
+def compiled_pattern(format, locale):
+    import babel.dates
+    from babel import Locale
+    return babel.dates.parse_pattern(format), Locale.parse(locale)
+
+
+def format_datetime(value, format='medium', locale=None):
+    import babel.dates
+    # views pass datetimes straight through; strings are still accepted
+    if not isinstance(value, datetime.datetime):
+        import dateutil.parser
+        value = dateutil.parser.parse(value)
+    if locale is None:
+        locale = babel.dates.LC_TIME
+    format = DATETIME_FORMATS.get(format, format)
+    if format in ('long', 'short'):
+        return babel.dates.format_datetime(value, format, locale=locale)
+    # the same normalisation babel.dates.format_datetime applies to naive values
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=babel.dates.UTC)
+    pattern, locale = compiled_pattern(format, locale)
+    return pattern.apply(value, locale)
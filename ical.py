@@ -0,0 +1,120 @@
+import datetime
+import hashlib
+from flask import Response, abort, current_app, request, stream_with_context, url_for
+import queries
+from models import db, Venue
+
+#----------------------------------------------------------------------------#
+# Calendar feeds.
+#----------------------------------------------------------------------------#
+
+# /venues/<id>/calendar.ics and /artists/<id>/calendar.ics list the shows as an
+# iCalendar feed, by default from CALENDAR_PAST_DAYS ago onwards (?from= and
+# ?to= as on /shows). Calendar clients poll these every few minutes, so before
+# any show is read one aggregate query builds the ETag (see
+# queries.calendar_version_query) and a client that already has the feed gets
+# a bodiless 304. Otherwise the events are streamed off a server-side cursor.
+
+FORMAT_VERSION = '1'
+
+
+def escape(text):
+    # TEXT values, RFC 5545 3.3.11
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def fold(line):
+    # content lines are at most 75 octets; longer ones continue on lines that
+    # start with a space, split between characters, never inside one
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts, part, size, limit = [], '', 0, 75
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > limit:
+            parts.append(part)
+            part, size, limit = '', 0, 74
+        part += char
+        size += width
+    parts.append(part)
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_time(value):
+    # floating local time, like the start times in the database
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def window():
+    # the feed's date range; the default start moves a day at a time, so the
+    # ETag stays valid between polls on the same day
+    start, end = queries.date_window(request.args.get('from'), request.args.get('to'))
+    if start is None and request.args.get('from') is None:
+        today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+        start = today - datetime.timedelta(days=current_app.config['CALENDAR_PAST_DAYS'])
+    return start, end
+
+
+def etag(model, id, start, end, version):
+    parts = [FORMAT_VERSION, model.__tablename__, id, start, end] + list(version)
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def events(rows, name, model):
+    duration = datetime.timedelta(minutes=current_app.config['SHOW_DURATION_MINUTES'])
+    stamp = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    host = request.host.split(':')[0]
+
+    yield fold('BEGIN:VCALENDAR')
+    yield fold('VERSION:2.0')
+    yield fold('PRODID:-//Fyyur//Shows//EN')
+    yield fold('CALSCALE:GREGORIAN')
+    yield fold('X-WR-CALNAME:' + escape(name))
+    for row in rows:
+        location = ', '.join(part for part in (row.venue_name, row.venue_address, row.venue_city, row.venue_state) if part)
+        # each event links to the other side: the artist on a venue's calendar
+        if model is Venue:
+            link = url_for('artists.show_artist', artist_id=row.artist_id, _external=True)
+        else:
+            link = url_for('venues.show_venue', venue_id=row.venue_id, _external=True)
+        yield ''.join([
+            fold('BEGIN:VEVENT'),
+            fold('UID:show-{}@{}'.format(row.show_id, host)),
+            fold('DTSTAMP:' + stamp),
+            fold('DTSTART:' + format_time(row.start_time)),
+            fold('DTEND:' + format_time(row.start_time + duration)),
+            fold('SUMMARY:' + escape('{} at {}'.format(row.artist_name, row.venue_name))),
+            fold('LOCATION:' + escape(location)),
+            fold('URL:' + link),
+            fold('END:VEVENT'),
+        ])
+    yield fold('END:VCALENDAR')
+
+
+def calendar_response(model, id):
+    try:
+        start, end = window()
+    except ValueError:
+        abort(400)
+    version = queries.calendar_version_query(model, id, start, end).one_or_none()
+    if version is None:
+        abort(404)
+    tag = etag(model, id, start, end, version)
+    # the connection goes back to the pool before the client gets a 304
+    db.session.commit()
+
+    headers = {'Cache-Control': 'public, max-age={}'.format(current_app.config['CALENDAR_MAX_AGE'])}
+    if request.if_none_match.contains(tag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(tag)
+        return response
+
+    rows = queries.calendar_query(model, id, start, end).yield_per(current_app.config['LISTING_YIELD_PER'])
+    response = Response(
+        stream_with_context(events(rows, version.name, model)),
+        mimetype='text/calendar',
+        headers=headers
+    )
+    response.set_etag(tag)
+    return response
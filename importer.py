@@ -0,0 +1,189 @@
+import csv
+import json
+import os
+import time
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import exc
+from werkzeug.datastructures import MultiDict
+import counters
+from cache import cache
+from models import db, Venue, Artist, Show, build_search_text
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# Loads venues, artists or shows from CSV or JSONL. Every row is validated with
+# the same WTForms form the create pages use, valid rows are inserted a batch
+# at a time in one executemany per batch (sent as multi-row VALUES by psycopg2),
+# and invalid rows are reported with their line number instead of aborting the
+# import. If the database rejects a batch, that batch is retried row by row in
+# savepoints so only the offending rows are dropped.
+
+# the forms are looked up by name when an import runs, so registering the
+# command doesn't load WTForms
+KINDS = {
+    'venues': (Venue, 'VenueForm', ['name', 'city', 'state', 'address', 'phone', 'image_link', 'genres', 'facebook_link']),
+    'artists': (Artist, 'ArtistForm', ['name', 'city', 'state', 'phone', 'image_link', 'genres', 'facebook_link']),
+    'shows': (Show, 'ShowForm', ['artist_id', 'venue_id', 'start_time']),
+}
+
+
+def read_rows(path, format):
+    # yields (line number, dict, parse error) triples
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                yield line, row, None
+        else:
+            for line, text in enumerate(f, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    row = json.loads(text)
+                except ValueError as error:
+                    yield line, text.rstrip('\n'), {'json': [str(error)]}
+                    continue
+                if isinstance(row, dict):
+                    yield line, row, None
+                else:
+                    yield line, text.rstrip('\n'), {'json': ['expected an object, got {}'.format(type(row).__name__)]}
+
+
+def formdata(row):
+    # genres may be a JSON list or a 'Jazz;Rock' / 'Jazz,Rock' string
+    data = MultiDict()
+    for key, value in row.items():
+        if key == 'genres' and isinstance(value, str):
+            value = [genre.strip() for genre in value.replace(';', ',').split(',') if genre.strip()]
+        if isinstance(value, list):
+            for item in value:
+                data.add(key, item)
+        elif value is not None:
+            data.add(key, str(value))
+    return data
+
+
+def validate(form_class, fields, row):
+    form = form_class(formdata=formdata(row), meta={'csrf': False})
+    if not form.validate():
+        return None, {field: errors for field, errors in form.errors.items()}
+    return {field: form.data[field] for field in fields}, None
+
+
+def check_show_ids(rows):
+    # ids must be integers of existing rows; one query per table for the whole batch
+    errors = {}
+    for line, values in rows:
+        try:
+            values['artist_id'] = int(values['artist_id'])
+            values['venue_id'] = int(values['venue_id'])
+        except (TypeError, ValueError):
+            errors[line] = {'id': ['artist_id and venue_id must be integers']}
+    rows = [(line, values) for line, values in rows if line not in errors]
+    artist_ids = {values['artist_id'] for line, values in rows}
+    venue_ids = {values['venue_id'] for line, values in rows}
+    known_artists = {id for (id,) in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids), Artist.deleted_at.is_(None))}
+    known_venues = {id for (id,) in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids), Venue.deleted_at.is_(None))}
+    for line, values in rows:
+        if values['artist_id'] not in known_artists:
+            errors[line] = {'artist_id': ['No artist with id {}'.format(values['artist_id'])]}
+        elif values['venue_id'] not in known_venues:
+            errors[line] = {'venue_id': ['No venue with id {}'.format(values['venue_id'])]}
+    return errors
+
+
+def insert_batch(table, rows):
+    # returns {line: errors} for the rows the database refused
+    try:
+        db.session.execute(table.insert(), [values for line, values in rows])
+        db.session.commit()
+        return {}
+    except exc.DBAPIError:
+        db.session.rollback()
+
+    errors = {}
+    for line, values in rows:
+        savepoint = db.session.begin_nested()
+        try:
+            db.session.execute(table.insert(), values)
+            savepoint.commit()
+        except exc.DBAPIError as error:
+            savepoint.rollback()
+            errors[line] = {'database': [str(error.orig).strip()]}
+    db.session.commit()
+    return errors
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--rejects', type=click.Path(dir_okay=False), help='Write rejected rows and their errors to this JSONL file.')
+@with_appcontext
+def import_command(kind, path, format, batch_size, rejects):
+    """Bulk load venues, artists or shows from CSV or JSONL."""
+    import forms
+    model, form_name, fields = KINDS[kind]
+    form_class = getattr(forms, form_name)
+    format = format or ('jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson', '.json') else 'csv')
+    rejects_file = open(rejects, 'w') if rejects else None
+    started = time.monotonic()
+    loaded = rejected = 0
+
+    def reject(line, row, errors):
+        if rejects_file:
+            rejects_file.write(json.dumps({'line': line, 'row': row, 'errors': errors}, default=str) + '\n')
+        elif rejected <= 20:
+            # without --rejects only the first few are printed
+            click.echo('line {}: {}'.format(line, errors), err=True)
+
+    def flush(batch, raw):
+        nonlocal loaded, rejected
+        if kind == 'shows':
+            errors = check_show_ids(batch)
+        else:
+            errors = {}
+            for line, values in batch:
+                values['search_text'] = build_search_text(values['name'], values['city'], values['state'], values['genres'])
+        batch = [(line, values) for line, values in batch if line not in errors]
+        if batch:
+            inserted = insert_batch(model.__table__, batch)
+            loaded += len(batch) - len(inserted)
+            errors.update(inserted)
+        for line in sorted(errors):
+            rejected += 1
+            reject(line, raw[line], errors[line])
+        elapsed = time.monotonic() - started
+        click.echo('{}: {} loaded, {} rejected, {:.0f} rows/s'.format(kind, loaded, rejected, (loaded + rejected) / elapsed if elapsed else 0))
+
+    try:
+        batch, raw = [], {}
+        for line, row, errors in read_rows(path, format):
+            if not errors:
+                values, errors = validate(form_class, fields, row)
+            if errors:
+                rejected += 1
+                reject(line, row, errors)
+                continue
+            batch.append((line, values))
+            raw[line] = row
+            if len(batch) >= batch_size:
+                flush(batch, raw)
+                batch, raw = [], {}
+        if batch:
+            flush(batch, raw)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+
+    if kind == 'shows' and loaded:
+        counters.recount()
+        db.session.commit()
+    cache.clear()
+    elapsed = time.monotonic() - started
+    click.echo('Done: {} {} loaded, {} rejected in {:.1f}s ({:.0f} rows/s)'.format(
+        loaded, kind, rejected, elapsed, (loaded + rejected) / elapsed if elapsed else 0
+    ))
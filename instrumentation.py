@@ -0,0 +1,133 @@
+import functools
+import heapq
+import json
+import logging
+import time
+from logging import FileHandler, Formatter
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Request instrumentation.
+#----------------------------------------------------------------------------#
+
+# Engine events count every statement a request runs and how long it spent in
+# the database. Each response carries the totals in a Server-Timing header
+# (visible in the browser's network panel; for streamed pages it only covers the
+# work done before the first byte) and requests slower than
+# SLOW_REQUEST_THRESHOLD_MS are written as one JSON line to SLOW_REQUEST_LOG,
+# together with their slowest statements.
+
+slow_log = logging.getLogger('fyyur.slow_requests')
+
+
+class RequestStats:
+
+    def __init__(self, keep):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.keep = keep
+        self.slowest = []
+
+    def record(self, statement, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        entry = (elapsed, self.queries, statement)
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, entry)
+        elif elapsed > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+
+def current_stats():
+    if has_request_context():
+        return g.get('request_stats')
+    return None
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # kept on the statement's own execution context, which a failed statement
+    # takes with it; only the dialect's setup queries run without one
+    if context is not None:
+        context.query_started = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'query_started', None)
+    stats = current_stats()
+    if stats is not None and started is not None:
+        stats.record(statement, time.perf_counter() - started)
+
+
+def start_request(keep):
+    def start():
+        g.request_stats = RequestStats(keep)
+    return start
+
+
+def log_if_slow(stats, threshold, method, path, endpoint, status):
+    total_ms = (time.perf_counter() - stats.started) * 1000
+    if total_ms < threshold:
+        return
+    slow_log.warning(json.dumps({
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'method': method,
+        'path': path,
+        'endpoint': endpoint,
+        'status': status,
+        'total_ms': round(total_ms, 1),
+        'db_ms': round(stats.db_time * 1000, 1),
+        'queries': stats.queries,
+        'slowest': [{
+            'ms': round(elapsed * 1000, 1),
+            'statement': ' '.join(statement.split())[:500]
+        } for elapsed, n, statement in sorted(stats.slowest, reverse=True)]
+    }))
+
+
+def finish_request(app):
+    def finish(response):
+        stats = current_stats()
+        if stats is None:
+            return response
+        total_ms = (time.perf_counter() - stats.started) * 1000
+        response.headers.add(
+            'Server-Timing',
+            'db;dur={:.1f};desc="{} queries", app;dur={:.1f}'.format(stats.db_time * 1000, stats.queries, total_ms)
+        )
+
+        # a streamed page keeps querying after the headers are out, so its totals
+        # are only final once the body has been sent
+        log = functools.partial(
+            log_if_slow, stats, app.config['SLOW_REQUEST_THRESHOLD_MS'],
+            request.method, request.full_path.rstrip('?'), request.endpoint, response.status_code
+        )
+        if response.is_streamed:
+            response.call_on_close(log)
+        else:
+            log()
+        return response
+    return finish
+
+
+def init_app(app):
+    app.config.setdefault('SLOW_REQUEST_THRESHOLD_MS', 500)
+    app.config.setdefault('SLOW_REQUEST_LOG', 'slow_requests.log')
+    app.config.setdefault('SLOW_REQUEST_STATEMENTS', 5)
+
+    # listening on the Engine class covers every engine the app creates
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    app.before_request(start_request(app.config['SLOW_REQUEST_STATEMENTS']))
+    app.after_request(finish_request(app))
+
+    if app.config['SLOW_REQUEST_LOG'] and not slow_log.handlers:
+        handler = FileHandler(app.config['SLOW_REQUEST_LOG'])
+        handler.setFormatter(Formatter('%(message)s'))
+        slow_log.addHandler(handler)
+        slow_log.setLevel(logging.WARNING)
+        slow_log.propagate = False
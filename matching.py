@@ -0,0 +1,434 @@
+import collections
+import importlib.util
+import io
+import threading
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import Integer, and_, any_, case, cast, func, select, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from models import db, Venue, Artist, MatchSuggestion
+
+#----------------------------------------------------------------------------#
+# Matching.
+#----------------------------------------------------------------------------#
+
+# Suggests venues to the artists seeking one, and those artists to venues. A
+# pair scores the Jaccard overlap of its genres (shared / either), plus
+# MATCH_STATE_WEIGHT when both are in the same state and MATCH_CITY_WEIGHT more
+# in the same city; pairs without a genre in common are never suggested.
+#
+# Scoring is done in NumPy, on genre sets rather than rows: each distinct set
+# of genres is a 0/1 row of a matrix, so one matrix product gives the overlap
+# of many sets with every candidate, and states and cities are integer codes.
+# Within one state (or city) the location bonus is the same for every
+# candidate, so the best matches of a row are among the best genre overlaps
+# of all rows, of the rows in its state and of the rows in its city. Those
+# three short lists are found once per genre set and location, not once per
+# row, and only they are scored in full. That keeps 100k artists against 20k
+# venues to seconds where scoring every pair would take minutes.
+#
+# `flask match rebuild` computes the MATCH_TOP_K best venues of every seeking
+# artist and artists of every venue and swaps them into match_suggestions in
+# one transaction: artist_rank is the venue's place among the artist's
+# suggestions, venue_rank the artist's among the venue's, and a pair can be
+# both. After that the table is kept current incrementally: creating, editing
+# or deleting a venue or artist queues it for a background thread, which
+# rescores only the queued rows against the other side, replaces their own
+# suggestions and re-ranks the lists of the other side they enter or leave. A
+# list that loses an entry this way is refilled by the next rebuild, so run it
+# nightly. Rebuilds and updates take the same advisory lock. Pages and the API
+# only read the table.
+#
+# NumPy is only needed to score (pip install numpy); without it the table is
+# served as it is and updates are skipped.
+
+# pg_advisory_xact_lock key shared by rebuilds and updates
+LOCK_KEY = 0x6d61746368
+
+OTHER = {Artist: Venue, Venue: Artist}
+SIDES = {
+    Artist: (MatchSuggestion.__table__.c.artist_id, MatchSuggestion.__table__.c.artist_rank),
+    Venue: (MatchSuggestion.__table__.c.venue_id, MatchSuggestion.__table__.c.venue_rank),
+}
+# edits to any of these rescore the row
+PROFILE_FIELDS = ('genres', 'city', 'state', 'seeking_venue')
+
+# one side of a run: row ids and, per row, the codes of its genre set, state and city
+Profiles = collections.namedtuple('Profiles', 'ids sets states cities')
+# the genre sets of a run as 0/1 rows, and how many genres each has
+GenreSets = collections.namedtuple('GenreSets', 'matrix sizes')
+
+
+class Encoder:
+    # integer codes shared by both sides of a run
+
+    def __init__(self):
+        self.genres = {}
+        self.sets = {}
+        self.states = {}
+        self.cities = {}
+
+    def code(self, codes, value):
+        return codes.setdefault(value, len(codes))
+
+    def profiles(self, rows):
+        import numpy as np
+        ids, sets, states, cities = [], [], [], []
+        for row in rows:
+            state = (row.state or '').strip().upper()
+            genres = tuple(sorted({self.code(self.genres, genre) for genre in row.genres or ()}))
+            ids.append(row.id)
+            sets.append(self.code(self.sets, genres))
+            states.append(self.code(self.states, state))
+            cities.append(self.code(self.cities, ((row.city or '').strip().lower(), state)))
+        return Profiles(
+            np.array(ids, dtype=np.int64),
+            np.array(sets, dtype=np.int64),
+            np.array(states, dtype=np.int64),
+            np.array(cities, dtype=np.int64)
+        )
+
+    def genre_sets(self):
+        # once both sides are encoded
+        import numpy as np
+        matrix = np.zeros((len(self.sets), max(len(self.genres), 1)), dtype=np.float32)
+        for index, genres in enumerate(self.sets):
+            matrix[index, list(genres)] = 1
+        return GenreSets(matrix, matrix.sum(axis=1))
+
+
+def matchable(model, ids=None):
+    # the rows that take part: venues that aren't deleted, artists that also seek a venue
+    query = db.session.query(model.id, model.genres, model.city, model.state).filter(model.deleted_at.is_(None))
+    if model is Artist:
+        query = query.filter(Artist.seeking_venue.is_(True))
+    if ids is not None:
+        query = query.filter(model.id == any_(cast(list(ids), ARRAY(Integer))))
+    return query.order_by(model.id).yield_per(current_app.config['LISTING_YIELD_PER'])
+
+
+def load(model, ids=None):
+    # (genre sets, model's profiles (only ids, if given), the other side's profiles)
+    encoder = Encoder()
+    own = encoder.profiles(matchable(model, ids))
+    rest = encoder.profiles(matchable(OTHER[model]))
+    return encoder.genre_sets(), own, rest
+
+
+def block(profiles, start, stop):
+    return Profiles._make(field[start:stop] for field in profiles)
+
+
+def groups(keys):
+    # {key: positions of the rows that have it}
+    import numpy as np
+    order = np.argsort(keys, kind='stable')
+    values, starts = np.unique(keys[order], return_index=True)
+    return dict(zip(values.tolist(), np.split(order, starts[1:])))
+
+
+def jaccard(genre_sets, left, right):
+    # len(left) x len(right) float32 overlap / union of two lists of set codes
+    import numpy as np
+    overlap = genre_sets.matrix[left] @ genre_sets.matrix[right].T
+    union = genre_sets.sizes[left][:, None] + genre_sets.sizes[right][None, :] - overlap
+    return np.divide(overlap, union, out=np.zeros_like(overlap), where=union > 0)
+
+
+def top_k(scores, k):
+    # per row, the columns of the k best scores, best first, and those scores
+    import numpy as np
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.int64), np.zeros((scores.shape[0], 0), dtype=scores.dtype)
+    best = np.argpartition(scores, scores.shape[1] - k, axis=1)[:, -k:]
+    top = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-top, axis=1, kind='stable')
+    return np.take_along_axis(best, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+
+def located(left, right, rows, columns, overlap, state_weight, city_weight):
+    # genre overlaps of (rows, columns) pairs turned into scores
+    import numpy as np
+    scores = overlap.copy()
+    scores += np.float32(state_weight) * (left.states[rows] == right.states[columns])
+    scores += np.float32(city_weight) * (left.cities[rows] == right.cities[columns])
+    scores[overlap == 0] = 0
+    return scores
+
+
+def score(genre_sets, left, right, state_weight, city_weight):
+    # len(left) x len(right) scores, every pair
+    import numpy as np
+    rows, columns = np.meshgrid(np.arange(len(left.ids)), np.arange(len(right.ids)), indexing='ij', sparse=True)
+    return located(left, right, rows, columns, jaccard(genre_sets, left.sets, right.sets), state_weight, city_weight)
+
+
+def candidates(genre_sets, left, right, k, location, block_cells):
+    # per left row, the k right rows with the best genre overlap among those in
+    # the same location ('states', 'cities', or None for all of them), and the
+    # overlaps; -1 and 0 pad rows with fewer
+    import numpy as np
+    found = np.full((len(left.ids), k), -1, dtype=np.int64)
+    overlaps = np.zeros((len(left.ids), k), dtype=np.float32)
+    left_keys = getattr(left, location) if location else np.zeros(len(left.ids), dtype=np.int64)
+    right_keys = getattr(right, location) if location else np.zeros(len(right.ids), dtype=np.int64)
+    right_groups = groups(right_keys)
+    for key, members in groups(left_keys).items():
+        others = right_groups.get(key)
+        if others is None:
+            continue
+        # rows with the same genre set in the same place share their candidates
+        sets, inverse = np.unique(left.sets[members], return_inverse=True)
+        top = np.full((len(sets), k), -1, dtype=np.int64)
+        best = np.zeros((len(sets), k), dtype=np.float32)
+        step = max(block_cells // len(others), 1)
+        for start in range(0, len(sets), step):
+            columns, overlap = top_k(jaccard(genre_sets, sets[start:start + step], right.sets[others]), k)
+            top[start:start + step, :columns.shape[1]] = np.where(overlap > 0, others[columns], -1)
+            best[start:start + step, :columns.shape[1]] = overlap
+        found[members] = top[inverse]
+        overlaps[members] = best[inverse]
+    return found, overlaps
+
+
+def best_matches(genre_sets, left, right, k, state_weight, city_weight, block_cells):
+    # the k best right rows of every left row, as (left ids, right ids, scores, ranks)
+    import numpy as np
+    if not len(left.ids) or not len(right.ids):
+        # nobody seeking a venue yet, or nothing to suggest
+        return (
+            np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        )
+    found, overlaps = zip(*(
+        candidates(genre_sets, left, right, k, location, block_cells) for location in (None, 'states', 'cities')
+    ))
+    found, overlaps = np.concatenate(found, axis=1), np.concatenate(overlaps, axis=1)
+    # a row can be a candidate in more than one list; only its first copy counts
+    order = np.argsort(found, axis=1, kind='stable')
+    found, overlaps = np.take_along_axis(found, order, axis=1), np.take_along_axis(overlaps, order, axis=1)
+    overlaps[:, 1:][found[:, 1:] == found[:, :-1]] = 0
+    overlaps[found < 0] = 0
+
+    rows = np.arange(len(left.ids))[:, None]
+    scores = located(left, right, rows, np.maximum(found, 0), overlaps, state_weight, city_weight)
+    columns, top = top_k(scores, k)
+    keep = top > 0
+    ranks = np.broadcast_to(np.arange(1, columns.shape[1] + 1), columns.shape)
+    return (
+        left.ids[np.broadcast_to(rows, columns.shape)[keep]],
+        right.ids[np.take_along_axis(found, columns, axis=1)[keep]],
+        top[keep],
+        ranks[keep]
+    )
+
+#  Rebuild
+#  ----------------------------------------------------------------
+
+def copy_rows(connection, artist_side, venue_side):
+    # COPY both lists into a temporary table; a pair on both comes twice
+    import numpy as np
+    connection.execute(text(
+        'CREATE TEMPORARY TABLE match_staging (artist_id integer, venue_id integer, score double precision, '
+        'artist_rank smallint, venue_rank smallint) ON COMMIT DROP'
+    ))
+    data = io.StringIO()
+    for side, fmt in ((artist_side, '%d\t%d\t%.6f\t%d\t\\N'), (venue_side, '%d\t%d\t%.6f\t\\N\t%d')):
+        if len(side[0]):
+            np.savetxt(data, np.column_stack([np.asarray(column, dtype=np.float64) for column in side]), fmt=fmt)
+    data.seek(0)
+    cursor = connection.connection.cursor()
+    cursor.copy_expert('COPY match_staging FROM STDIN', data)
+    cursor.close()
+
+
+def rebuild(k, state_weight, city_weight, block_cells):
+    # returns (artists, venues, suggestions, seconds scoring, seconds writing)
+    started = time.monotonic()
+    connection = db.session.connection()
+    connection.execute(select([func.pg_advisory_xact_lock(LOCK_KEY)]))
+    genre_sets, artists, venues = load(Artist)
+    artist_side = best_matches(genre_sets, artists, venues, k, state_weight, city_weight, block_cells)
+    venue_ids, artist_ids, scores, ranks = best_matches(genre_sets, venues, artists, k, state_weight, city_weight, block_cells)
+    scored = time.monotonic()
+
+    copy_rows(connection, artist_side, (artist_ids, venue_ids, scores, ranks))
+    # readers wait for the commit rather than see a half-filled table
+    connection.execute(text('TRUNCATE match_suggestions'))
+    count = connection.execute(text(
+        'INSERT INTO match_suggestions (artist_id, venue_id, score, artist_rank, venue_rank) '
+        'SELECT artist_id, venue_id, max(score), min(artist_rank), min(venue_rank) '
+        'FROM match_staging GROUP BY artist_id, venue_id'
+    )).rowcount
+    db.session.commit()
+    return len(artists.ids), len(venues.ids), count, scored - started, time.monotonic() - scored
+
+#  Incremental updates
+#  ----------------------------------------------------------------
+
+def rerank(model, ids, k):
+    # renumbers the lists of model's ids, dropping what falls past k
+    table = MatchSuggestion.__table__
+    column, rank = SIDES[model]
+    other_column = SIDES[OTHER[model]][0]
+    ranked = select([
+        table.c.artist_id,
+        table.c.venue_id,
+        func.row_number().over(partition_by=column, order_by=(table.c.score.desc(), other_column)).label('rank')
+    ]).where(and_(rank.isnot(None), column == any_(cast(list(ids), ARRAY(Integer))))).alias('ranked')
+    db.session.execute(table.update().where(and_(
+        table.c.artist_id == ranked.c.artist_id,
+        table.c.venue_id == ranked.c.venue_id
+    )).values({rank.name: case([(ranked.c.rank <= k, ranked.c.rank)])}))
+    db.session.execute(table.delete().where(and_(table.c.artist_rank.is_(None), table.c.venue_rank.is_(None))))
+
+
+def update(model, ids, k, state_weight, city_weight, block_cells):
+    # rescores model's ids against the other side; returns the other side's ids
+    # whose lists changed
+    import numpy as np
+    table = MatchSuggestion.__table__
+    column, rank = SIDES[model]
+    other_column, other_rank = SIDES[OTHER[model]]
+    db.session.execute(select([func.pg_advisory_xact_lock(LOCK_KEY)]))
+
+    removed = db.session.execute(
+        table.delete().where(column == any_(cast(list(ids), ARRAY(Integer)))).returning(other_column, other_rank)
+    ).fetchall()
+    changed = {other_id for other_id, other_place in removed if other_place is not None}
+
+    genre_sets, own, rest = load(model, ids)
+    if len(own.ids) and len(rest.ids):
+        own_ids, other_ids, scores, places = best_matches(genre_sets, own, rest, k, state_weight, city_weight, block_cells)
+        rows = {
+            (own_id, other_id): {column.name: own_id, other_column.name: other_id, 'score': value, rank.name: place, other_rank.name: None}
+            for own_id, other_id, value, place in zip(own_ids.tolist(), other_ids.tolist(), scores.tolist(), places.tolist())
+        }
+
+        # an id enters another list if it beats the list's last entry, or the list isn't full
+        floors = dict(db.session.query(other_column, case(
+            [(func.count() >= k, func.min(table.c.score))], else_=0
+        )).filter(other_rank.isnot(None)).group_by(other_column))
+        floor = np.array([floors.get(other_id, 0) for other_id in rest.ids.tolist()], dtype=np.float32)
+        step = max(block_cells // len(rest.ids), 1)
+        for start in range(0, len(own.ids), step):
+            part = block(own, start, start + step)
+            scores = score(genre_sets, part, rest, state_weight, city_weight)
+            for row, col in zip(*np.nonzero((scores > 0) & (scores > floor[None, :]))):
+                own_id, other_id = int(part.ids[row]), int(rest.ids[col])
+                entry = rows.setdefault((own_id, other_id), {
+                    column.name: own_id, other_column.name: other_id, 'score': float(scores[row, col]), rank.name: None
+                })
+                # a placeholder until rerank() numbers the list
+                entry[other_rank.name] = k
+                changed.add(other_id)
+        if rows:
+            db.session.execute(table.insert(), list(rows.values()))
+
+    if changed:
+        rerank(OTHER[model], sorted(changed), k)
+    db.session.commit()
+    return changed
+
+
+class Matcher:
+    # one background thread per process, started by the first change
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.thread = None
+        self.lock = threading.Lock()
+        self.pending = {Artist: set(), Venue: set()}
+        self.wakeup = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MATCH_TOP_K', 20)
+        app.config.setdefault('MATCH_STATE_WEIGHT', 0.25)
+        app.config.setdefault('MATCH_CITY_WEIGHT', 0.5)
+        app.config.setdefault('MATCH_BLOCK_CELLS', 10000000)
+        app.config.setdefault('MATCH_UPDATES', True)
+        self.app = app
+        # without NumPy the table stays as the last rebuild left it
+        self.enabled = app.config['MATCH_UPDATES'] and importlib.util.find_spec('numpy') is not None
+
+    def notify(self, model, id):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.pending[model].add(id)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='fyyur-matcher', daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def take(self):
+        with self.lock:
+            pending = {model: ids for model, ids in self.pending.items() if ids}
+            self.pending = {Artist: set(), Venue: set()}
+        return pending
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            with self.app.app_context():
+                config = self.app.config
+                for model, ids in self.take().items():
+                    try:
+                        update(model, ids, config['MATCH_TOP_K'], config['MATCH_STATE_WEIGHT'], config['MATCH_CITY_WEIGHT'], config['MATCH_BLOCK_CELLS'])
+                    except Exception:
+                        self.app.logger.exception('updating match suggestions of %s %s failed', model.__tablename__, sorted(ids))
+                        db.session.rollback()
+                    finally:
+                        db.session.remove()
+
+
+matcher = Matcher()
+
+
+def suggestions_query(model, id):
+    # the suggestions for one venue or artist, best first
+    column, rank = SIDES[model]
+    other = OTHER[model]
+    return db.session.query(
+        other.id,
+        other.name,
+        other.city,
+        other.state,
+        other.genres,
+        MatchSuggestion.score,
+        rank.label('rank')
+    ).join(MatchSuggestion, SIDES[other][0] == other.id).filter(
+        column == id,
+        rank.isnot(None),
+        other.deleted_at.is_(None)
+    ).order_by(rank)
+
+
+@click.group('match')
+def match_command():
+    """Precompute venue suggestions for artists and artist suggestions for venues."""
+
+
+@match_command.command('rebuild')
+@click.option('--top-k', type=int, help='Suggestions kept per venue and per artist. Defaults to MATCH_TOP_K.')
+@with_appcontext
+def rebuild_command(top_k):
+    """Score every seeking artist against every venue and replace all suggestions."""
+    if importlib.util.find_spec('numpy') is None:
+        raise click.ClickException('Scoring needs NumPy: pip install numpy')
+    config = current_app.config
+    artists, venues, count, scoring, writing = rebuild(
+        top_k or config['MATCH_TOP_K'],
+        config['MATCH_STATE_WEIGHT'],
+        config['MATCH_CITY_WEIGHT'],
+        config['MATCH_BLOCK_CELLS']
+    )
+    click.echo('Scored {} artists against {} venues in {:.1f}s'.format(artists, venues, scoring))
+    click.echo('Wrote {} suggestions in {:.1f}s'.format(count, writing))
@@ -0,0 +1,50 @@
+"""upcoming and past show counters on venues and artists
+
+Revision ID: 3e9a7b1c5d42
+Revises: 8c4d2e6f1a93
+Create Date: 2026-10-18 22:03:11.418376
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e9a7b1c5d42'
+down_revision = '8c4d2e6f1a93'
+branch_labels = None
+depends_on = None
+
+BACKFILL = '''
+UPDATE {table} SET
+    upcoming_shows_count = COALESCE(counts.upcoming, 0),
+    past_shows_count = COALESCE(counts.past, 0)
+FROM {table} AS t LEFT JOIN (
+    SELECT {column} AS id,
+           count(*) FILTER (WHERE start_time >= rolled_at) AS upcoming,
+           count(*) FILTER (WHERE start_time < rolled_at) AS past
+    FROM shows, show_counters GROUP BY {column}
+) AS counts ON counts.id = t.id
+WHERE {table}.id = t.id
+'''
+
+
+def upgrade():
+    op.create_table('show_counters',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('INSERT INTO show_counters (id, rolled_at) VALUES (1, now()::timestamp)')
+    for table, column in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.execute(BACKFILL.format(table=table, column=column))
+
+
+def downgrade():
+    op.drop_column('artists', 'past_shows_count')
+    op.drop_column('artists', 'upcoming_shows_count')
+    op.drop_column('venues', 'past_shows_count')
+    op.drop_column('venues', 'upcoming_shows_count')
+    op.drop_table('show_counters')
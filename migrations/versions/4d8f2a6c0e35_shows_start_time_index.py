@@ -0,0 +1,24 @@
+"""index shows by start_time
+
+Revision ID: 4d8f2a6c0e35
+Revises: 9a3c5e7f1b28
+Create Date: 2026-10-18 23:58:31.902418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8f2a6c0e35'
+down_revision = '9a3c5e7f1b28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_start_time', 'shows', ['start_time', 'show_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shows_start_time', table_name='shows')
@@ -0,0 +1,38 @@
+"""search text with trigram indexes
+
+Revision ID: 5b7e1c9a3f20
+Revises: 2dfa40b80006
+Create Date: 2026-10-18 20:05:12.418306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e1c9a3f20'
+down_revision = '2dfa40b80006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.add_column('artists', sa.Column('search_text', sa.Text(), nullable=True))
+    op.add_column('venues', sa.Column('search_text', sa.Text(), nullable=True))
+    # same text models.build_search_text() produces for new and edited rows:
+    # concat_ws() skips NULLs but not empty strings, which the model also drops
+    for table in ('artists', 'venues'):
+        op.execute(
+            "UPDATE {} SET search_text = concat_ws(' ', NULLIF(name, ''), NULLIF(city, ''), NULLIF(state, ''), "
+            "NULLIF(array_to_string(array_remove(genres, ''), ' '), ''))".format(table)
+        )
+    op.create_index('ix_artists_search_text_trgm', 'artists', ['search_text'], unique=False, postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'})
+    op.create_index('ix_venues_search_text_trgm', 'venues', ['search_text'], unique=False, postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_venues_search_text_trgm', table_name='venues')
+    op.drop_index('ix_artists_search_text_trgm', table_name='artists')
+    op.drop_column('venues', 'search_text')
+    op.drop_column('artists', 'search_text')
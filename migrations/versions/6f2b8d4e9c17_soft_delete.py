@@ -0,0 +1,30 @@
+"""deleted_at on venues and artists
+
+Revision ID: 6f2b8d4e9c17
+Revises: 3e9a7b1c5d42
+Create Date: 2026-10-18 23:12:47.205913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f2b8d4e9c17'
+down_revision = '3e9a7b1c5d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venues', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.add_column('artists', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_venues_deleted_at', 'venues', ['deleted_at'], unique=False, postgresql_where=sa.text('deleted_at IS NOT NULL'))
+    op.create_index('ix_artists_deleted_at', 'artists', ['deleted_at'], unique=False, postgresql_where=sa.text('deleted_at IS NOT NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_artists_deleted_at', table_name='artists')
+    op.drop_index('ix_venues_deleted_at', table_name='venues')
+    op.drop_column('artists', 'deleted_at')
+    op.drop_column('venues', 'deleted_at')
@@ -0,0 +1,37 @@
+"""match suggestions
+
+Revision ID: 7e1b3d5f9a62
+Revises: 4d8f2a6c0e35
+Create Date: 2026-10-18 23:59:12.408163
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e1b3d5f9a62'
+down_revision = '4d8f2a6c0e35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('match_suggestions',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('artist_rank', sa.SmallInteger(), nullable=True),
+    sa.Column('venue_rank', sa.SmallInteger(), nullable=True),
+    sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id', 'venue_id')
+    )
+    op.create_index('ix_match_suggestions_artist_rank', 'match_suggestions', ['artist_id', 'artist_rank'], unique=False, postgresql_where=sa.text('artist_rank IS NOT NULL'))
+    op.create_index('ix_match_suggestions_venue_rank', 'match_suggestions', ['venue_id', 'venue_rank'], unique=False, postgresql_where=sa.text('venue_rank IS NOT NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_match_suggestions_venue_rank', table_name='match_suggestions')
+    op.drop_index('ix_match_suggestions_artist_rank', table_name='match_suggestions')
+    op.drop_table('match_suggestions')
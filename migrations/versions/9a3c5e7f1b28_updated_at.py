@@ -0,0 +1,27 @@
+"""updated_at on venues and artists
+
+Revision ID: 9a3c5e7f1b28
+Revises: 6f2b8d4e9c17
+Create Date: 2026-10-18 23:48:05.614270
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3c5e7f1b28'
+down_revision = '6f2b8d4e9c17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows all get the time of the migration as their first version
+    op.add_column('venues', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('LOCALTIMESTAMP'), nullable=False))
+    op.add_column('artists', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('LOCALTIMESTAMP'), nullable=False))
+
+
+def downgrade():
+    op.drop_column('artists', 'updated_at')
+    op.drop_column('venues', 'updated_at')
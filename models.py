@@ -1,7 +1,9 @@
 
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from replicas import RoutingSQLAlchemy
 
-db = SQLAlchemy()
+# reads of GET requests may go to a replica (see replicas.py)
+db = RoutingSQLAlchemy()
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -11,6 +13,12 @@ db = SQLAlchemy()
 
 class Venue(db.Model):
     __tablename__ = 'venues'
+    __table_args__ = (
+        db.Index('ix_venues_search_text_trgm', 'search_text', postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'}),
+        db.Index('ix_venues_city_state', 'city', 'state'),
+        db.Index('ix_venues_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_venues_deleted_at', 'deleted_at', postgresql_where=db.text('deleted_at IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -21,10 +29,23 @@ class Venue(db.Model):
     genres = db.Column(db.ARRAY(db.String()), nullable=False)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    search_text = db.Column(db.Text)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, server_default='0')
+    # set when the row is deleted; the row itself goes once its shows are purged
+    deleted_at = db.Column(db.DateTime)
+    # moved by every edit, which is only written if it still matches (see edits.py)
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.localtimestamp())
+    shows = db.relationship('Show', backref='venue', lazy=True, order_by='Show.start_time')
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 class Artist(db.Model):
     __tablename__ = 'artists'
+    __table_args__ = (
+        db.Index('ix_artists_search_text_trgm', 'search_text', postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'}),
+        db.Index('ix_artists_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_artists_deleted_at', 'deleted_at', postgresql_where=db.text('deleted_at IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -37,13 +58,61 @@ class Artist(db.Model):
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(200))
+    search_text = db.Column(db.Text)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, server_default='0')
+    deleted_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.localtimestamp())
+    shows = db.relationship('Show', backref='artist', lazy=True, order_by='Show.start_time')
   
   # TODO: implement any missing fields, as a database migration using Flask-Migrate
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 class Show(db.Model):
       __tablename__ = 'shows'
+      __table_args__ = (
+          db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+          db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+          # date ranges and the (start_time, show_id) cursor of the show feed
+          db.Index('ix_shows_start_time', 'start_time', 'show_id'),
+      )
       show_id = db.Column(db.Integer, primary_key=True)
       artist_id = db.Column('artist_id', db.Integer, db.ForeignKey('artists.id'), nullable=False)
       venue_id = db.Column('venue_id', db.Integer, db.ForeignKey('venues.id'), nullable=False)
       start_time = db.Column(db.DateTime, nullable=False)
-      
\ No newline at end of file
+
+class ShowCounters(db.Model):
+    # a single row: shows starting before rolled_at are counted as past on venues and artists
+    __tablename__ = 'show_counters'
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_at = db.Column(db.DateTime, nullable=False)
+
+class MatchSuggestion(db.Model):
+    # precomputed by matching.py: artist_rank is the venue's place among the
+    # artist's suggestions, venue_rank the artist's among the venue's
+    __tablename__ = 'match_suggestions'
+    __table_args__ = (
+        db.Index('ix_match_suggestions_artist_rank', 'artist_id', 'artist_rank', postgresql_where=db.text('artist_rank IS NOT NULL')),
+        db.Index('ix_match_suggestions_venue_rank', 'venue_id', 'venue_rank', postgresql_where=db.text('venue_rank IS NOT NULL')),
+    )
+    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    artist_rank = db.Column(db.SmallInteger)
+    venue_rank = db.Column(db.SmallInteger)
+
+#----------------------------------------------------------------------------#
+# Search text.
+#----------------------------------------------------------------------------#
+
+# search_text is what the trigram index covers: name, city, state and genres in
+# one column, since array_to_string() is not immutable and can't be indexed directly.
+
+def build_search_text(name, city, state, genres):
+    return ' '.join(part for part in [name, city, state] + list(genres or []) if part)
+
+@event.listens_for(Venue, 'before_insert')
+@event.listens_for(Venue, 'before_update')
+@event.listens_for(Artist, 'before_insert')
+@event.listens_for(Artist, 'before_update')
+def update_search_text(mapper, connection, target):
+    target.search_text = build_search_text(target.name, target.city, target.state, target.genres)
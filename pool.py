@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from flask import jsonify
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+#----------------------------------------------------------------------------#
+# Connection pool.
+#----------------------------------------------------------------------------#
+
+# Every gunicorn worker holds its own pool, so the pool is sized per worker: with
+# DB_CONNECTION_BUDGET set, the budget is split evenly across WEB_CONCURRENCY
+# workers (two thirds kept open, the rest as overflow) and the workers together
+# can never exceed it. Connections are pinged on checkout, which also recovers
+# the pool after a failover, and recycled every DB_POOL_RECYCLE seconds.
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that keeps track of how long checkouts waited for a connection
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self.stats_lock:
+                self.checkouts += 1
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'size': self.size(),
+                'checked_out': self.checkedout(),
+                'checked_in': self.checkedin(),
+                'overflow': max(self.overflow(), 0),
+                'max_overflow': self._max_overflow,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_ms_total': round(self.wait_time * 1000, 3),
+                'wait_ms_avg': round(self.wait_time * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                'wait_ms_max': round(self.max_wait * 1000, 3)
+            }
+
+
+def worker_pool_size(budget, workers):
+    # (pool_size, max_overflow) for one worker's share of the connection budget
+    per_worker = max(budget // max(workers, 1), 1)
+    size = max(per_worker * 2 // 3, 1)
+    return size, per_worker - size
+
+
+def engine_options(config):
+    size, overflow = config['DB_POOL_SIZE'], config['DB_MAX_OVERFLOW']
+    if config['DB_CONNECTION_BUDGET']:
+        size, overflow = worker_pool_size(config['DB_CONNECTION_BUDGET'], config['WEB_CONCURRENCY'])
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': size,
+        'max_overflow': overflow,
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+        # executemany() inserts go out as multi-row INSERT ... VALUES statements
+        'executemany_mode': 'values'
+    }
+
+
+def pool_stats(db):
+    def stats():
+        pool = db.engine.pool
+        data = pool.stats() if isinstance(pool, TimedQueuePool) else {'status': pool.status()}
+        data['pid'] = os.getpid()
+        return jsonify(data)
+    return stats
+
+
+def init_app(app, db):
+    app.config.setdefault('WEB_CONCURRENCY', 1)
+    app.config.setdefault('DB_CONNECTION_BUDGET', 0)
+    app.config.setdefault('DB_POOL_SIZE', 5)
+    app.config.setdefault('DB_MAX_OVERFLOW', 10)
+    app.config.setdefault('DB_POOL_TIMEOUT', 10)
+    app.config.setdefault('DB_POOL_RECYCLE', 1800)
+    app.config.setdefault('STATS_ENDPOINTS', False)
+    app.config.setdefault('POOL_STATS_URL', '/_stats/pool')
+
+    # the engine is created lazily, so these only need to be in place before the first query
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    if app.config['STATS_ENDPOINTS'] and app.config['POOL_STATS_URL']:
+        app.add_url_rule(app.config['POOL_STATS_URL'], 'pool_stats', pool_stats(db))
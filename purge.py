@@ -0,0 +1,134 @@
+import datetime
+import threading
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, exc, exists, select
+import counters
+from cache import cache
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Deletes.
+#----------------------------------------------------------------------------#
+
+# Deleting a venue or artist only sets its deleted_at, which every listing,
+# search and show query filters on, so it disappears at once however many
+# shows it has. Its shows are then deleted in a background thread, in batches
+# of PURGE_BATCH_SIZE that each commit on their own (a short lock on a few
+# rows, never the whole history at once), and the row itself goes once no shows
+# point at it. `flask purge-deleted` does the same from the command line, for
+# deletes a restarted worker didn't get to finish.
+
+OWNERS = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+
+def soft_delete(model, id):
+    # the row's genres, or None if there was no such row to delete; its shows
+    # come off the other side's counters in the same transaction
+    connection = db.session.connection()
+    deleted = connection.execute(
+        model.__table__.update().where(
+            and_(model.id == id, model.deleted_at.is_(None))
+        ).values(deleted_at=datetime.datetime.now()).returning(model.genres)
+    ).first()
+    if deleted is not None:
+        counters.remove_owner(connection, model, id)
+    return deleted
+
+
+def purge_batch(column, id, size):
+    # deletes up to size of the owner's shows and returns how many went; rows
+    # another purger holds are skipped rather than waited on. The shows of a
+    # deleted owner are on no counter anymore (see soft_delete)
+    batch = select([Show.show_id]).where(column == id).limit(size).with_for_update(skip_locked=True)
+    deleted = db.session.connection().execute(Show.__table__.delete().where(Show.show_id.in_(batch))).rowcount
+    db.session.commit()
+    return deleted
+
+
+def purge_owner(model, column, id, size, pause):
+    purged = 0
+    while True:
+        count = purge_batch(column, id, size)
+        purged += count
+        if count < size:
+            break
+        # leave room for other writers between batches
+        time.sleep(pause)
+    try:
+        db.session.execute(model.__table__.delete().where(and_(
+            model.id == id,
+            model.deleted_at.isnot(None),
+            ~exists().where(column == id)
+        )))
+        db.session.commit()
+    except exc.IntegrityError:
+        # a show was added in the meantime; the next pass picks it up
+        db.session.rollback()
+    return purged
+
+
+def purge_pending(size, pause):
+    # returns {(table, id): shows purged}
+    purged = {}
+    for model, column in OWNERS:
+        pending = [id for (id,) in db.session.query(model.id).filter(model.deleted_at.isnot(None)).order_by(model.deleted_at)]
+        db.session.commit()
+        for id in pending:
+            purged[model.__tablename__, id] = purge_owner(model, column, id, size, pause)
+    if purged:
+        cache.invalidate('venues', 'artists', 'shows')
+    return purged
+
+
+class Purger:
+    # one background thread per process, started by the first delete
+
+    def __init__(self, app=None):
+        self.app = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PURGE_BATCH_SIZE', 1000)
+        app.config.setdefault('PURGE_PAUSE', 0.05)
+        self.app = app
+
+    def notify(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='fyyur-purger', daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            with self.app.app_context():
+                try:
+                    purge_pending(self.app.config['PURGE_BATCH_SIZE'], self.app.config['PURGE_PAUSE'])
+                except Exception:
+                    self.app.logger.exception('purging deleted venues and artists failed')
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+
+purger = Purger()
+
+
+@click.command('purge-deleted')
+@click.option('--batch-size', type=int, help='Shows deleted per transaction. Defaults to PURGE_BATCH_SIZE.')
+@with_appcontext
+def purge_deleted_command(batch_size):
+    """Delete the shows of deleted venues and artists, then the rows themselves."""
+    purged = purge_pending(batch_size or current_app.config['PURGE_BATCH_SIZE'], current_app.config['PURGE_PAUSE'])
+    for (table, id), count in purged.items():
+        click.echo('{} {}: {} shows purged'.format(table, id, count))
+    click.echo('{} deleted venues and artists processed'.format(len(purged)))
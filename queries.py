@@ -0,0 +1,385 @@
+import datetime
+from itertools import groupby
+from sqlalchemy import String, cast, func, select, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Query layer.
+#----------------------------------------------------------------------------#
+
+# The views only ever see plain dicts built here, so every page is loaded with a
+# fixed number of queries no matter how many rows it ends up showing.
+
+
+def split_shows(shows, now=None):
+    # shows come back ordered by start_time, so one pass keeps both halves sorted
+    now = now or datetime.datetime.now()
+    past, upcoming = [], []
+    for show in shows:
+        (past if show.start_time < now else upcoming).append(show)
+    return past, upcoming
+
+
+VENUE_DETAIL_FIELDS = ['id', 'name', 'genres', 'address', 'city', 'state', 'phone', 'image_link', 'facebook_link', 'updated_at']
+ARTIST_DETAIL_FIELDS = [
+    'id', 'name', 'genres', 'city', 'state', 'phone', 'website', 'facebook_link',
+    'seeking_venue', 'seeking_description', 'image_link', 'updated_at'
+]
+SHOW_COUNT_FIELDS = ['upcoming_shows_count', 'past_shows_count']
+
+
+def detail_shows(columns, owner_column, other, other_column, owner_id, limit, now=None):
+    # the next limit shows and the last limit shows of a venue or artist, in
+    # start_time order, so a long history doesn't grow the page; the totals
+    # come from the show counters
+    now = now or datetime.datetime.now()
+    shows = db.session.query(*columns).join(other, other.id == other_column).filter(
+        owner_column == owner_id,
+        other.deleted_at.is_(None)
+    )
+    upcoming = shows.filter(Show.start_time >= now).order_by(Show.start_time).limit(limit)
+    past = shows.filter(Show.start_time < now).order_by(Show.start_time.desc()).limit(limit)
+    return upcoming.union_all(past).order_by(Show.start_time)
+
+
+def venue_detail_queries(venue_id, limit):
+    # the venue, and up to limit upcoming and limit past shows joined to their artists
+    venue = select_fields(VENUE_FIELDS, VENUE_DETAIL_FIELDS + SHOW_COUNT_FIELDS).filter(Venue.id == venue_id, Venue.deleted_at.is_(None))
+    shows = detail_shows([
+        Show.artist_id.label('artist_id'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.start_time.label('start_time')
+    ], Show.venue_id, Artist, Show.artist_id, venue_id, limit)
+    return venue, shows
+
+
+def artist_detail_queries(artist_id, limit):
+    # the artist, and up to limit upcoming and limit past shows joined to their venues
+    artist = select_fields(ARTIST_FIELDS, ARTIST_DETAIL_FIELDS + SHOW_COUNT_FIELDS).filter(Artist.id == artist_id, Artist.deleted_at.is_(None))
+    shows = detail_shows([
+        Show.venue_id.label('venue_id'),
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link'),
+        Show.start_time.label('start_time')
+    ], Show.artist_id, Venue, Show.venue_id, artist_id, limit)
+    return artist, shows
+
+
+def build_detail(row, fields, shows, show_fields):
+    # the page dict for a venue or artist row and its shows, which may come from
+    # SQLAlchemy or from the async reader
+    if row is None:
+        return None
+    past_shows, upcoming_shows = split_shows(shows)
+    data = {field: getattr(row, field) for field in fields}
+    data.update(
+        past_shows=[{field: getattr(show, field) for field in show_fields} for show in past_shows],
+        upcoming_shows=[{field: getattr(show, field) for field in show_fields} for show in upcoming_shows],
+        # the counters; at least what is listed, for shows booked since the last roll
+        past_shows_count=max(row.past_shows_count, len(past_shows)),
+        upcoming_shows_count=max(row.upcoming_shows_count, len(upcoming_shows))
+    )
+    return data
+
+
+def build_venue_detail(venue, shows):
+    return build_detail(venue, VENUE_DETAIL_FIELDS, shows, ['artist_id', 'artist_name', 'artist_image_link', 'start_time'])
+
+
+def build_artist_detail(artist, shows):
+    return build_detail(artist, ARTIST_DETAIL_FIELDS, shows, ['venue_id', 'venue_name', 'venue_image_link', 'start_time'])
+
+
+def venue_detail(venue_id, limit):
+    # 2 queries, or 1 when there is no such venue
+    venue, shows = venue_detail_queries(venue_id, limit)
+    venue = venue.one_or_none()
+    return build_venue_detail(venue, shows.all() if venue is not None else [])
+
+
+def artist_detail(artist_id, limit):
+    # 2 queries, or 1 when there is no such artist
+    artist, shows = artist_detail_queries(artist_id, limit)
+    artist = artist.one_or_none()
+    return build_artist_detail(artist, shows.all() if artist is not None else [])
+
+
+def genre_filter(model, genre):
+    # genres @> ARRAY[genre], which the GIN index on genres answers; the cast
+    # matches the column's varchar[] (a plain list would be bound as text[]).
+    # The columns are the generic ARRAY, which has no contains(), hence op()
+    return model.genres.op('@>')(cast([genre], ARRAY(String)))
+
+
+def activity_order(model):
+    # 'busiest' sort: the materialized counters, most upcoming shows first
+    return (model.upcoming_shows_count.desc(), model.past_shows_count.desc(), model.id)
+
+
+def venue_areas_query(per_area, city=None, state=None, page=1, sort='name', genre=None):
+    # every venue is ranked inside its (city, state) area by a window function,
+    # so each area is capped at per_area rows by the database itself
+    area = (Venue.city, Venue.state)
+    order = activity_order(Venue) if sort == 'busiest' else (Venue.name, Venue.id)
+    ranked = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_shows_count,
+        func.row_number().over(partition_by=area, order_by=order).label('position'),
+        func.count().over(partition_by=area).label('total')
+    ).filter(Venue.deleted_at.is_(None))
+    if city is not None:
+        ranked = ranked.filter(Venue.city == city)
+    if state is not None:
+        ranked = ranked.filter(Venue.state == state)
+    if genre is not None:
+        ranked = ranked.filter(genre_filter(Venue, genre))
+    ranked = ranked.subquery()
+
+    offset = (page - 1) * per_area
+    return db.session.query(ranked).filter(
+        ranked.c.position > offset,
+        ranked.c.position <= offset + per_area
+    ).order_by(ranked.c.state, ranked.c.city, ranked.c.position)
+
+
+def group_areas(rows, page):
+    # rows arrive grouped by area, so areas are built in one pass and handed out
+    # as soon as each one is complete
+    for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+        venues = list(venues)
+        yield {
+            'city': city,
+            'state': state,
+            'venues': [{
+                'id': venue.id,
+                'name': venue.name,
+                'upcoming_shows_count': venue.upcoming_shows_count
+            } for venue in venues],
+            'total': venues[0].total,
+            'page': page,
+            'has_more': venues[-1].position < venues[0].total
+        }
+
+
+def venue_areas(per_area, city=None, state=None, page=1, yield_per=500, sort='name', genre=None):
+    # one query, streamed
+    rows = venue_areas_query(per_area, city, state, page, sort, genre).yield_per(yield_per)
+    return group_areas(rows, page)
+
+
+def encode_cursor(start_time, show_id):
+    return '{}_{}'.format(start_time.isoformat(), show_id)
+
+
+def decode_cursor(cursor):
+    # raises ValueError on anything encode_cursor() could not have produced
+    start_time, show_id = cursor.rsplit('_', 1)
+    return datetime.datetime.fromisoformat(start_time), int(show_id)
+
+
+# columns the listings and the API can select, by field name
+VENUE_FIELDS = {
+    'id': Venue.id,
+    'name': Venue.name,
+    'city': Venue.city,
+    'state': Venue.state,
+    'address': Venue.address,
+    'phone': Venue.phone,
+    'genres': Venue.genres,
+    'image_link': Venue.image_link,
+    'facebook_link': Venue.facebook_link,
+    'upcoming_shows_count': Venue.upcoming_shows_count,
+    'past_shows_count': Venue.past_shows_count,
+    # only moved by edits, so a client can tell whether its copy is current
+    'updated_at': Venue.updated_at
+}
+ARTIST_FIELDS = {
+    'id': Artist.id,
+    'name': Artist.name,
+    'city': Artist.city,
+    'state': Artist.state,
+    'phone': Artist.phone,
+    'genres': Artist.genres,
+    'image_link': Artist.image_link,
+    'facebook_link': Artist.facebook_link,
+    'website': Artist.website,
+    'seeking_venue': Artist.seeking_venue,
+    'seeking_description': Artist.seeking_description,
+    'upcoming_shows_count': Artist.upcoming_shows_count,
+    'past_shows_count': Artist.past_shows_count,
+    'updated_at': Artist.updated_at
+}
+SHOW_FIELDS = {
+    'show_id': Show.show_id,
+    'start_time': Show.start_time,
+    'venue_id': Show.venue_id,
+    'venue_name': Venue.name,
+    'artist_id': Show.artist_id,
+    'artist_name': Artist.name,
+    'artist_image_link': Artist.image_link
+}
+
+
+def select_fields(columns, fields):
+    return db.session.query(*[columns[field].label(field) for field in fields])
+
+
+def venues_query(fields=VENUE_FIELDS, sort='id', genre=None):
+    order = activity_order(Venue) if sort == 'busiest' else (Venue.id,)
+    query = select_fields(VENUE_FIELDS, fields).filter(Venue.deleted_at.is_(None))
+    if genre is not None:
+        query = query.filter(genre_filter(Venue, genre))
+    return query.order_by(*order)
+
+
+def artists_query(fields=ARTIST_FIELDS, sort='id', genre=None):
+    order = activity_order(Artist) if sort == 'busiest' else (Artist.id,)
+    query = select_fields(ARTIST_FIELDS, fields).filter(Artist.deleted_at.is_(None))
+    if genre is not None:
+        query = query.filter(genre_filter(Artist, genre))
+    return query.order_by(*order)
+
+
+def date_window(start, end):
+    # YYYY-MM-DD strings from a query string; the end day is inclusive
+    start = datetime.datetime.strptime(start, '%Y-%m-%d') if start else None
+    end = datetime.datetime.strptime(end, '%Y-%m-%d') + datetime.timedelta(days=1) if end else None
+    return start, end
+
+
+def deleted_ids(model):
+    # venues or artists deleted but not purged yet; only ever a handful
+    return select([model.id]).where(model.deleted_at.isnot(None))
+
+
+def shows_query(fields=SHOW_FIELDS, when='all', start=None, end=None):
+    # venues and artists are only joined when one of their columns is selected;
+    # shows of deleted ones are left out either way
+    query = select_fields(SHOW_FIELDS, fields).select_from(Show)
+    if 'venue_name' in fields:
+        query = query.join(Venue, Venue.id == Show.venue_id).filter(Venue.deleted_at.is_(None))
+    else:
+        query = query.filter(Show.venue_id.notin_(deleted_ids(Venue)))
+    if 'artist_name' in fields or 'artist_image_link' in fields:
+        query = query.join(Artist, Artist.id == Show.artist_id).filter(Artist.deleted_at.is_(None))
+    else:
+        query = query.filter(Show.artist_id.notin_(deleted_ids(Artist)))
+
+    now = datetime.datetime.now()
+    if when == 'upcoming':
+        query = query.filter(Show.start_time >= now)
+    elif when == 'past':
+        query = query.filter(Show.start_time < now)
+    return in_window(query, start, end)
+
+
+def in_window(query, start=None, end=None):
+    # shows starting in [start, end); either end may be open
+    if start is not None:
+        query = query.filter(Show.start_time >= start)
+    if end is not None:
+        query = query.filter(Show.start_time < end)
+    return query
+
+
+# for a venue's or an artist's calendar: the show column that points at it, and
+# the other side of each show
+CALENDAR_SIDES = {
+    Venue: (Show.venue_id, Artist, Show.artist_id),
+    Artist: (Show.artist_id, Venue, Show.venue_id),
+}
+
+
+def calendar_query(model, id, start=None, end=None):
+    # one venue's or artist's shows in [start, end), in calendar order; the range
+    # is read off ix_shows_venue_id_start_time / ix_shows_artist_id_start_time
+    column = CALENDAR_SIDES[model][0]
+    query = db.session.query(
+        Show.show_id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Venue.address.label('venue_address'),
+        Venue.city.label('venue_city'),
+        Venue.state.label('venue_state'),
+        Show.artist_id,
+        Artist.name.label('artist_name')
+    ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id).filter(
+        column == id,
+        Venue.deleted_at.is_(None),
+        Artist.deleted_at.is_(None)
+    )
+    return in_window(query, start, end).order_by(Show.start_time, Show.show_id)
+
+
+def calendar_version_query(model, id, start=None, end=None):
+    # everything calendar_query()'s output depends on, in one row (none if there
+    # is no such venue or artist): its own name and updated_at, and over the same
+    # shows the number of them, the newest show_id and the other side's latest edit
+    column, other, other_column = CALENDAR_SIDES[model]
+    shows = in_window(db.session.query(
+        func.count(Show.show_id).label('shows'),
+        func.max(Show.show_id).label('last_show_id'),
+        func.max(other.updated_at).label('other_updated_at')
+    ).join(other, other.id == other_column).filter(
+        column == id,
+        other.deleted_at.is_(None)
+    ), start, end).subquery()
+    return db.session.query(model.name, model.updated_at, shows).filter(model.id == id, model.deleted_at.is_(None))
+
+
+class ShowPage:
+    # one page of the feed, read straight off the cursor while the template
+    # iterates it; next_cursor is set once the page has been iterated
+
+    def __init__(self, rows, limit):
+        # rows holds up to limit + 1 shows; the extra one means there is a next page
+        self.rows = rows
+        self.limit = limit
+        self.next_cursor = None
+
+    def __iter__(self):
+        last = None
+        for n, row in enumerate(self.rows):
+            if n == self.limit:
+                self.next_cursor = encode_cursor(last.start_time, last.show_id)
+                break
+            last = row
+            yield {
+                'venue_id': row.venue_id,
+                'venue_name': row.venue_name,
+                'artist_id': row.artist_id,
+                'artist_name': row.artist_name,
+                'artist_image_link': row.artist_image_link,
+                'start_time': row.start_time
+            }
+
+
+def show_feed_query(limit, when='all', start=None, end=None, cursor=None):
+    # shows joined to their venue and artist, paged by a (start_time, show_id)
+    # cursor so page N costs the same as page 1
+    key = tuple_(Show.start_time, Show.show_id)
+    query = shows_query(when=when, start=start, end=end)
+
+    # past shows read newest first, everything else in calendar order
+    descending = when == 'past'
+    if cursor is not None:
+        after = tuple_(*decode_cursor(cursor))
+        query = query.filter(key < after if descending else key > after)
+    if descending:
+        query = query.order_by(Show.start_time.desc(), Show.show_id.desc())
+    else:
+        query = query.order_by(Show.start_time, Show.show_id)
+
+    # one extra row to know whether there is a next page
+    return query.limit(limit + 1)
+
+
+def show_feed(limit, when='all', start=None, end=None, cursor=None):
+    # one query per page
+    return ShowPage(show_feed_query(limit, when, start, end, cursor), limit)
@@ -0,0 +1,220 @@
+import functools
+import itertools
+import threading
+import time
+from flask import current_app, g, has_request_context, jsonify, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, exc, orm, text
+from sqlalchemy.engine.url import make_url
+
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+
+# With DATABASE_REPLICA_URLS set, GET and HEAD requests read from the replicas
+# in turn and everything else, along with the CLI commands and the purger,
+# stays on SQLALCHEMY_DATABASE_URI. A request picks its database at its first
+# query and keeps it to the end, streamed body included.
+#
+# A replica is checked (a ping plus its replay lag) at most every
+# REPLICA_CHECK_INTERVAL seconds, by whichever request comes across it first.
+# One that can't be reached, or lags more than REPLICA_MAX_LAG seconds, is
+# skipped until a later check passes; with none left, reads go to the primary.
+# A write leaves a REPLICA_STICKY_SECONDS mark in the browser's session, so
+# the page it redirects to (and anything else read in the meantime) comes
+# from the primary and shows the change, lagging replicas or not. POST views
+# that only read, like the searches, are marked with @read_only: they read
+# from a replica too and leave no mark. Views whose reads feed a write, like
+# the edit forms and their version token, are marked with @on_primary. Pages
+# read from a replica are not stored in the page cache (see cache.py).
+
+SAFE_METHODS = ('GET', 'HEAD')
+STICKY_KEY = 'read_primary_until'
+
+LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class Replica:
+
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        self.healthy = True
+        self.lag = None
+        self.checked_at = None
+        self.failures = 0
+        self.reads = 0
+        self.lock = threading.Lock()
+        event.listen(engine, 'handle_error', self.connection_failed)
+
+    def due(self, interval):
+        return self.checked_at is None or time.monotonic() - self.checked_at >= interval
+
+    def check(self, max_lag):
+        # one thread checks, the others go by the last result meanwhile
+        if not self.lock.acquire(blocking=False):
+            return self.healthy
+        try:
+            with self.engine.connect() as connection:
+                lag = connection.execute(LAG_QUERY).scalar()
+            self.lag = float(lag or 0)
+            self.healthy = self.lag <= max_lag
+        except exc.SQLAlchemyError:
+            self.lag = None
+            self.healthy = False
+            self.failures += 1
+        finally:
+            self.checked_at = time.monotonic()
+            self.lock.release()
+        return self.healthy
+
+    def connection_failed(self, context):
+        # a request that loses the replica takes it out until the next check
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, exc.OperationalError):
+            self.healthy = False
+            self.failures += 1
+            self.checked_at = time.monotonic()
+
+    def stats(self):
+        pool = self.engine.pool
+        return {
+            'name': self.name,
+            'healthy': self.healthy,
+            'lag_seconds': self.lag,
+            'failures': self.failures,
+            'reads': self.reads,
+            'pool': pool.stats() if hasattr(pool, 'stats') else {'status': pool.status()}
+        }
+
+
+class ReplicaSet:
+    # the replicas of one app, handed out round-robin
+
+    def __init__(self, replicas, check_interval, max_lag):
+        self.replicas = replicas
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self.turns = itertools.count()
+
+    def choose(self):
+        # the next healthy replica, or None for the primary
+        if not self.replicas:
+            return None
+        start = next(self.turns)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            healthy = replica.check(self.max_lag) if replica.due(self.check_interval) else replica.healthy
+            if healthy:
+                replica.reads += 1
+                return replica
+        return None
+
+
+def replica_set():
+    return current_app.extensions.get('replicas')
+
+
+def read_only_request():
+    return request.method in SAFE_METHODS or g.get('db_read_only', False)
+
+
+def reads_from_replica():
+    return read_only_request() and session.get(STICKY_KEY, 0) <= time.time()
+
+
+def read_replica():
+    # the replica this request reads from, chosen at its first query; None outside
+    # requests, for writes, and when no replica is available
+    if not has_request_context():
+        return None
+    if 'db_replica' not in g:
+        replicas = replica_set()
+        g.db_replica = replicas.choose() if replicas is not None and reads_from_replica() else None
+    return g.db_replica
+
+
+def on_primary(view):
+    # the view reads from the primary even on GET
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_replica = None
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def read_only(view):
+    # the view doesn't write, whatever its method
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = read_replica()
+        if replica is not None:
+            return replica.engine
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def replica_name(url, index):
+    # host, port and database only, never the password
+    url = make_url(url)
+    return 'replica-{} {}:{}/{}'.format(index, url.host, url.port or 5432, url.database)
+
+
+def finish_request(app):
+    def finish(response):
+        if not read_only_request():
+            session[STICKY_KEY] = time.time() + app.config['REPLICA_STICKY_SECONDS']
+        if app.config['REPLICA_ROUTE_HEADER'] and 'db_replica' in g:
+            response.headers['X-Database'] = g.db_replica.name if g.db_replica is not None else 'primary'
+        return response
+    return finish
+
+
+def replica_stats():
+    replicas = replica_set()
+    return jsonify([replica.stats() for replica in replicas.replicas])
+
+
+def init_app(app):
+    app.config.setdefault('DATABASE_REPLICA_URLS', [])
+    app.config.setdefault('REPLICA_CHECK_INTERVAL', 5)
+    app.config.setdefault('REPLICA_MAX_LAG', 5)
+    app.config.setdefault('REPLICA_CONNECT_TIMEOUT', 2)
+    app.config.setdefault('REPLICA_STICKY_SECONDS', 10)
+    app.config.setdefault('REPLICA_ROUTE_HEADER', False)
+    app.config.setdefault('STATS_ENDPOINTS', False)
+    app.config.setdefault('REPLICA_STATS_URL', '/_stats/replicas')
+
+    urls = app.config['DATABASE_REPLICA_URLS']
+    if not urls:
+        return
+
+    # each replica gets a pool like the primary's (see pool.py); engines only
+    # connect on first use, so nothing is opened here
+    options = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+    options['connect_args'] = dict(options.get('connect_args') or {}, connect_timeout=app.config['REPLICA_CONNECT_TIMEOUT'])
+    app.extensions['replicas'] = ReplicaSet(
+        [Replica(replica_name(url, index), create_engine(url, **options)) for index, url in enumerate(urls, 1)],
+        app.config['REPLICA_CHECK_INTERVAL'],
+        app.config['REPLICA_MAX_LAG']
+    )
+
+    app.after_request(finish_request(app))
+    # names the database hosts, so only with STATS_ENDPOINTS on (see pool.py)
+    if app.config['STATS_ENDPOINTS'] and app.config['REPLICA_STATS_URL']:
+        app.add_url_rule(app.config['REPLICA_STATS_URL'], 'replica_stats', replica_stats)
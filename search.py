@@ -0,0 +1,60 @@
+from sqlalchemy import case, func
+import queries
+from models import db
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# Venues and artists are matched on their search_text column (name, city, state
+# and genres), which carries a pg_trgm GIN index, so a '%term%' pattern is an
+# index lookup instead of a sequential scan.
+
+
+def escape_like(term):
+    # backslash is Postgres' LIKE escape character by default, so the patterns
+    # need no ESCAPE clause, whose literal each dialect would render its own way
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def matches(model, term):
+    return model.search_text.ilike('%{}%'.format(escape_like((term or '').strip())))
+
+
+def search_query(model, term, limit, page=1, genre=None):
+    term = (term or '').strip()
+    pattern = '%{}%'.format(escape_like(term))
+
+    # name hits first, then closest names, then the rest of the matching text
+    ranking = (
+        case([(model.name.ilike(pattern), 0)], else_=1),
+        func.word_similarity(term, model.name).desc(),
+        func.similarity(model.search_text, term).desc(),
+        model.name,
+        model.id
+    )
+    query = db.session.query(
+        model.id,
+        model.name,
+        func.count().over().label('total')
+    ).filter(
+        matches(model, term),
+        model.deleted_at.is_(None)
+    )
+    if genre is not None:
+        query = query.filter(queries.genre_filter(model, genre))
+    return query.order_by(*ranking).limit(limit).offset((page - 1) * limit)
+
+
+def search_results(rows, limit, page=1):
+    total = rows[0].total if rows else 0
+    return {
+        'count': total,
+        'data': [{'id': row.id, 'name': row.name} for row in rows],
+        'page': page,
+        'has_more': page * limit < total
+    }
+
+
+def search(model, term, limit, page=1, genre=None):
+    return search_results(search_query(model, term, limit, page, genre).all(), limit, page)
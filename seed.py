@@ -0,0 +1,128 @@
+import datetime
+import random
+import time
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func
+import counters
+from models import db, Venue, Artist, Show, build_search_text
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#----------------------------------------------------------------------------#
+
+# Fills venues, artists and shows with a skewed, repeatable data set. Cities,
+# venues and artists are all drawn from Zipf-like weights, so a handful of metros
+# and headline venues carry most of the shows, like the real catalogue does.
+
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Houston', 'TX'),
+    ('Phoenix', 'AZ'), ('Philadelphia', 'PA'), ('San Antonio', 'TX'), ('San Diego', 'CA'),
+    ('Dallas', 'TX'), ('San Francisco', 'CA'), ('Austin', 'TX'), ('Seattle', 'WA'),
+    ('Denver', 'CO'), ('Nashville', 'TN'), ('Boston', 'MA'), ('Portland', 'OR'),
+    ('Las Vegas', 'NV'), ('Detroit', 'MI'), ('Memphis', 'TN'), ('New Orleans', 'LA'),
+    ('Atlanta', 'GA'), ('Miami', 'FL'), ('Minneapolis', 'MN'), ('Portland', 'ME'),
+    ('Springfield', 'IL'), ('Springfield', 'MA'), ('Columbus', 'OH'), ('Kansas City', 'MO'),
+]
+VENUE_WORDS = ['Hall', 'Room', 'Lounge', 'Club', 'Theatre', 'Tavern', 'Garden', 'Cellar', 'Ballroom', 'Stage']
+ARTIST_WORDS = ['Band', 'Collective', 'Trio', 'Quartet', 'Orchestra', 'Project', 'Sound', 'Ensemble']
+ADJECTIVES = ['Musical', 'Electric', 'Velvet', 'Golden', 'Midnight', 'Crimson', 'Silver', 'Wild', 'Blue', 'Hidden']
+
+
+def zipf_weights(count, skew):
+    return [1.0 / (rank ** skew) for rank in range(1, count + 1)]
+
+
+def insert_batches(table, rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(table.insert(), rows[start:start + batch_size])
+    db.session.commit()
+
+
+def inserted_ids(model, after):
+    return [id for (id,) in db.session.query(model.id).filter(model.id > after).order_by(model.id)]
+
+
+def profile(rng, name, cities, city_weights, genre_values):
+    city, state = rng.choices(cities, weights=city_weights)[0]
+    genres = rng.sample(genre_values, rng.randint(1, 3))
+    return {
+        'name': name,
+        'city': city,
+        'state': state,
+        'phone': '{}-{}-{}'.format(rng.randint(200, 999), rng.randint(100, 999), rng.randint(1000, 9999)),
+        'genres': genres,
+        'image_link': 'https://picsum.photos/seed/{}/400/400'.format(rng.randint(1, 10 ** 9)),
+        'facebook_link': 'https://www.facebook.com/{}'.format(name.replace(' ', '')),
+        'search_text': build_search_text(name, city, state, genres)
+    }
+
+
+@click.command('seed')
+@click.option('--venues', default=2000, show_default=True)
+@click.option('--artists', default=10000, show_default=True)
+@click.option('--shows', default=100000, show_default=True)
+@click.option('--skew', default=1.1, show_default=True, help='Zipf exponent; higher means a few headline venues and artists get more of the shows.')
+@click.option('--seed', 'random_seed', default=42, show_default=True)
+@click.option('--batch-size', default=5000, show_default=True)
+@click.option('--truncate', is_flag=True, help='Empty shows, venues and artists first.')
+@with_appcontext
+def seed_command(venues, artists, shows, skew, random_seed, batch_size, truncate):
+    """Fill the database with synthetic venues, artists and shows."""
+    # imported here so other commands don't load WTForms
+    from forms import GENRE_CHOICES
+    genre_values = [value for value, label in GENRE_CHOICES]
+    rng = random.Random(random_seed)
+    started = time.monotonic()
+    if truncate:
+        db.session.execute('TRUNCATE match_suggestions, shows, venues, artists RESTART IDENTITY')
+        db.session.commit()
+
+    city_weights = zipf_weights(len(CITIES), skew)
+    last_venue = db.session.query(func.coalesce(func.max(Venue.id), 0)).scalar()
+    last_artist = db.session.query(func.coalesce(func.max(Artist.id), 0)).scalar()
+
+    venue_rows = []
+    for n in range(venues):
+        row = profile(rng, 'The {} {} {}'.format(rng.choice(ADJECTIVES), rng.choice(VENUE_WORDS), n), CITIES, city_weights, genre_values)
+        row['address'] = '{} {} Street'.format(rng.randint(1, 9999), rng.choice(ADJECTIVES))
+        venue_rows.append(row)
+    insert_batches(Venue.__table__, venue_rows, batch_size)
+    click.echo('{} venues'.format(venues))
+
+    artist_rows = []
+    for n in range(artists):
+        row = profile(rng, '{} {} {}'.format(rng.choice(ADJECTIVES), rng.choice(ARTIST_WORDS), n), CITIES, city_weights, genre_values)
+        row['website'] = 'https://example.com/artists/{}'.format(n)
+        row['seeking_venue'] = rng.random() < 0.3
+        row['seeking_description'] = 'Looking for places to play.' if row['seeking_venue'] else None
+        artist_rows.append(row)
+    insert_batches(Artist.__table__, artist_rows, batch_size)
+    click.echo('{} artists'.format(artists))
+
+    venue_ids = inserted_ids(Venue, last_venue)
+    artist_ids = inserted_ids(Artist, last_artist)
+    if venue_ids and artist_ids:
+        # shuffled so the headline venues and artists are not simply the first ids
+        rng.shuffle(venue_ids)
+        rng.shuffle(artist_ids)
+        venue_weights = zipf_weights(len(venue_ids), skew)
+        artist_weights = zipf_weights(len(artist_ids), skew)
+        # three years of history and one year of upcoming shows
+        first = datetime.datetime.now().replace(minute=0, second=0, microsecond=0) - datetime.timedelta(days=3 * 365)
+        hours = 4 * 365 * 24
+
+        show_rows = [{
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'start_time': first + datetime.timedelta(hours=rng.randrange(hours))
+        } for venue_id, artist_id in zip(
+            rng.choices(venue_ids, weights=venue_weights, k=shows),
+            rng.choices(artist_ids, weights=artist_weights, k=shows)
+        )]
+        insert_batches(Show.__table__, show_rows, batch_size)
+        counters.recount()
+        db.session.commit()
+        click.echo('{} shows'.format(shows))
+
+    click.echo('Seeded in {:.1f}s'.format(time.monotonic() - started))
@@ -0,0 +1,117 @@
+import datetime
+from flask import Blueprint, abort, current_app, flash, jsonify, render_template, request
+import booking
+import queries
+from cache import cache
+from models import db, Show
+from views import render_listing
+
+#----------------------------------------------------------------------------#
+# Shows.
+#----------------------------------------------------------------------------#
+
+shows = Blueprint('shows', __name__, url_prefix='/shows')
+
+
+@shows.route('')
+@cache.cached('shows')
+def index():
+    # displays list of shows at /shows, one fixed-size page at a time
+    # ?when=upcoming|past|all, ?from=YYYY-MM-DD, ?to=YYYY-MM-DD (inclusive), ?after=<cursor>
+    when = request.args.get('when', 'all')
+    if when not in ('all', 'upcoming', 'past'):
+        abort(400)
+    try:
+        start, end = queries.date_window(request.args.get('from'), request.args.get('to'))
+        feed = queries.show_feed(
+            limit=current_app.config['SHOWS_PER_PAGE'],
+            when=when,
+            start=start,
+            end=end,
+            cursor=request.args.get('after')
+        )
+    except ValueError:
+        abort(400)
+
+    return render_listing('pages/shows.html', shows=feed, when=when)
+
+
+@shows.route('/create')
+def create_shows():
+    # renders form. do not touch.
+    from forms import ShowForm
+    form = ShowForm()
+    return render_template('forms/new_show.html', form=form)
+
+
+@shows.route('/create', methods=['POST'])
+def create_show_submission():
+    # called to create new shows in the db, upon submitting new show listing form
+    try:
+        data = request.form
+        show = Show(artist_id=data['artist_id'], venue_id=data['venue_id'], start_time=data['start_time'])
+        db.session.add(show)
+        db.session.commit()
+        # the venues and artists listings show upcoming show counts
+        cache.invalidate('venue:%s' % data['venue_id'], 'artist:%s' % data['artist_id'], 'venues', 'artists', 'shows')
+        flash('Show was successfully listed!')
+    except:
+        current_app.logger.exception('%s %s failed', request.method, request.path)
+        db.session.rollback()
+        flash('An error occurred. Show could not be listed.')
+    finally:
+        db.session.close()
+
+    return render_template('pages/home.html')
+
+
+@shows.route('/tour', methods=['GET', 'POST'])
+def create_tour():
+    # books a whole tour at once; the form takes one 'artist_id, venue_id, YYYY-MM-DD HH:MM'
+    # per line, JSON clients post {"shows": [{"artist_id": .., "venue_id": .., "start_time": ..}, ..]}
+    from forms import TourForm
+    config = current_app.config
+    if request.method == 'GET':
+        return render_template('forms/new_tour.html', form=TourForm(), results=None)
+
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        items = payload.get('shows') if isinstance(payload, dict) else payload
+        if not isinstance(items, list):
+            return jsonify({'error': 'Expected a list of shows'}), 400
+    else:
+        form = TourForm()
+        items = [line for line in (form.shows.data or '').splitlines() if line.strip()]
+    if not items or len(items) > config['TOUR_MAX_SHOWS']:
+        message = 'A tour needs between 1 and %d shows.' % config['TOUR_MAX_SHOWS']
+        if request.is_json:
+            return jsonify({'error': message}), 400
+        flash(message)
+        return render_template('forms/new_tour.html', form=form, results=None), 400
+
+    try:
+        results = booking.book_tour(items, datetime.timedelta(minutes=config['SHOW_DURATION_MINUTES']))
+    except:
+        current_app.logger.exception('%s %s failed', request.method, request.path)
+        db.session.rollback()
+        if request.is_json:
+            return jsonify({'error': 'The tour could not be booked'}), 500
+        flash('An error occurred. The tour could not be booked.')
+        return render_template('forms/new_tour.html', form=form, results=None), 500
+    finally:
+        db.session.close()
+
+    booked = [entry for entry in results if entry['status'] == 'booked']
+    if booked:
+        cache.invalidate('venues', 'artists', 'shows', *(
+            ['venue:%s' % venue_id for venue_id in {entry['venue_id'] for entry in booked}] +
+            ['artist:%s' % artist_id for artist_id in {entry['artist_id'] for entry in booked}]
+        ))
+    if request.is_json:
+        return jsonify({
+            'booked': len(booked),
+            'rejected': len(results) - len(booked),
+            'results': [dict(entry, start_time=entry['start_time'].isoformat()) if entry.get('start_time') else entry for entry in results]
+        })
+    flash('%d of %d shows were booked.' % (len(booked), len(results)))
+    return render_template('forms/new_tour.html', form=form, results=results)
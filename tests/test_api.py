@@ -0,0 +1,95 @@
+import datetime
+import json
+import pytest
+from sqlalchemy.dialects import postgresql
+import queries
+from app import create_app
+
+#----------------------------------------------------------------------------#
+# JSON API, streamed from stand-in rows.
+#----------------------------------------------------------------------------#
+
+ROWS = [(1, 'The Dive', datetime.datetime(2030, 5, 1, 20)), (2, 'The Hall', datetime.datetime(2030, 5, 2, 20))]
+
+
+class StubQuery:
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.yield_per_rows = None
+
+    def yield_per(self, count):
+        self.yield_per_rows = count
+        return iter(self.rows)
+
+    def order_by(self, *columns):
+        return self
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app = create_app()
+    app.config['API_YIELD_PER'] = 7
+    requested = {}
+
+    def venues_query(fields, sort='id', genre=None):
+        requested.update(fields=fields, sort=sort, genre=genre)
+        requested['query'] = StubQuery([row[:len(fields)] for row in ROWS])
+        return requested['query']
+
+    monkeypatch.setattr(queries, 'venues_query', venues_query)
+    client = app.test_client()
+    client.requested = requested
+    return client
+
+
+def test_a_collection_streams_as_one_json_array(client):
+    response = client.get('/api/v1/venues?fields=id,name&sort=busiest&genre=Jazz')
+    assert response.is_streamed and response.mimetype == 'application/json'
+    assert json.loads(response.get_data()) == [{'id': 1, 'name': 'The Dive'}, {'id': 2, 'name': 'The Hall'}]
+    assert client.requested['fields'] == ['id', 'name']
+    assert (client.requested['sort'], client.requested['genre']) == ('busiest', 'Jazz')
+    assert client.requested['query'].yield_per_rows == 7
+
+
+@pytest.mark.parametrize('url, headers', [
+    ('/api/v1/venues?fields=id,name,updated_at&format=ndjson', {}),
+    ('/api/v1/venues?fields=id,name,updated_at', {'Accept': 'application/x-ndjson'}),
+])
+def test_a_collection_streams_as_ndjson(client, url, headers):
+    response = client.get(url, headers=headers)
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.get_data(as_text=True).splitlines() == [
+        '{"id":1,"name":"The Dive","updated_at":"2030-05-01T20:00:00"}',
+        '{"id":2,"name":"The Hall","updated_at":"2030-05-02T20:00:00"}',
+    ]
+
+
+def test_unknown_fields_are_a_bad_request(client):
+    response = client.get('/api/v1/venues?fields=id,password')
+    assert response.status_code == 400
+    assert b'Unknown fields: password' in response.data
+
+
+def test_bad_show_filters_are_a_bad_request(client):
+    assert client.get('/api/v1/shows?when=someday').status_code == 400
+    assert client.get('/api/v1/shows?from=May').status_code == 400
+
+
+def compile_shows(fields):
+    with create_app().app_context():
+        return str(queries.shows_query(fields).statement.compile(dialect=postgresql.dialect()))
+
+
+def test_only_the_requested_columns_are_selected():
+    statement = compile_shows(['show_id', 'start_time'])
+    assert statement.startswith('SELECT shows.show_id AS show_id, shows.start_time AS start_time \nFROM shows')
+    # deleted venues and artists are left out without joining them
+    assert 'JOIN' not in statement
+    assert 'shows.venue_id NOT IN (SELECT venues.id' in statement
+
+
+def test_venue_and_artist_columns_join_their_tables():
+    statement = compile_shows(['show_id', 'venue_name', 'artist_name'])
+    assert 'JOIN venues ON venues.id = shows.venue_id JOIN artists ON artists.id = shows.artist_id' in statement
+    assert 'NOT IN' not in statement
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+from app import COMMANDS, create_app
+
+#----------------------------------------------------------------------------#
+# App factory.
+#----------------------------------------------------------------------------#
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_workers_dont_load_the_cli():
+    # a fresh interpreter, since this one may have imported the commands already
+    script = 'import sys, app; app.create_app(); print(sorted({}.intersection(sys.modules)))'.format(
+        {'bench', 'seed', 'explain', 'importer'}
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', script], cwd=ROOT, check=True, stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout
+    assert output.strip() == '[]'
+
+
+def test_commands_load_when_asked_for():
+    app = create_app()
+    assert set(COMMANDS) <= set(app.cli.list_commands(None))
+    for name in COMMANDS:
+        assert app.cli.get_command(None, name).name == name
+    assert app.cli.get_command(None, 'no-such-command') is None
+
+
+def test_stats_endpoints_are_off_by_default():
+    app = create_app()
+    assert not app.config['STATS_ENDPOINTS']
+    assert 'pool_stats' not in app.view_functions
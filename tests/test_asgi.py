@@ -0,0 +1,27 @@
+import pytest
+import search
+from app import create_app
+from models import Artist, Venue
+
+asgi = pytest.importorskip('asgi')
+
+#----------------------------------------------------------------------------#
+# Async read server queries, compiled for asyncpg.
+#----------------------------------------------------------------------------#
+
+
+@pytest.fixture
+def app():
+    app = create_app()
+    with app.app_context():
+        yield app
+
+
+@pytest.mark.parametrize('model', [Venue, Artist])
+def test_search_relies_on_the_default_like_escape(app, model):
+    # Postgres escapes LIKE patterns with a backslash unless told otherwise
+    sql, params = asgi.compile_query(search.search_query(model, '50%_off', 10, genre='Jazz'))
+    assert 'ESCAPE' not in sql
+    assert sql.count('ILIKE $') == 2
+    assert '$1' in sql and ':1' not in sql
+    assert '%50\\%\\_off%' in params
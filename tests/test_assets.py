@@ -0,0 +1,96 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import pytest
+from flask import Flask, render_template_string
+import assets
+
+#----------------------------------------------------------------------------#
+# Static assets, built from the repository's static folder into a temporary one.
+#----------------------------------------------------------------------------#
+
+STATIC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+
+
+def test_rebase_urls():
+    css = "a { background: url('../img/bg.png?v=2') } b { background: url(data:image/png;base64,xx) } i { src: url(/fonts/x.woff) }"
+    rebased = assets.rebase_urls(css, '/static/css/main.css', '/static/dist')
+    assert "url('../img/bg.png?v=2')" in rebased
+    assert 'url(data:image/png;base64,xx)' in rebased and 'url(/fonts/x.woff)' in rebased
+    assert assets.rebase_urls('a { background: url(fonts/x.woff) }', '/static/css/main.css', '/static/dist') == \
+        'a { background: url(../css/fonts/x.woff) }'
+
+
+def test_minify():
+    assert assets.minify_css('/* header */\na {\n  color: red;\n}\n') in ('a{color:red}', 'a{color:red;}')
+    assert 'sourceMappingURL' not in assets.minify_js('var a = 1;\n//# sourceMappingURL=a.map\n')
+
+
+def test_hashed_name():
+    assert assets.hashed_name('css/main.css', b'a{}') == 'css/main.{}.css'.format(hashlib.sha256(b'a{}').hexdigest()[:12])
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def static(tmp_path):
+    # a copy, so a build doesn't touch the checkout
+    shutil.copytree(STATIC, str(tmp_path / 'static'), ignore=shutil.ignore_patterns('dist'))
+    return str(tmp_path / 'static')
+
+
+def test_build_writes_hashed_precompressed_bundles(static):
+    dist = os.path.join(static, 'dist')
+    report = assets.build(static, dist)
+    with open(os.path.join(dist, 'manifest.json')) as f:
+        manifest = json.load(f)
+    assert set(manifest) == set(assets.BUNDLES) | set(assets.FILES)
+    for name, target in manifest.items():
+        assert target == assets.hashed_name(name, read(os.path.join(dist, target)))
+        assert report[name][0] == target
+    main_css = os.path.join(dist, manifest['main.css'])
+    with gzip.open(main_css + '.gz') as f:
+        assert f.read() == read(main_css)
+    # images aren't compressed again
+    assert not os.path.exists(os.path.join(dist, manifest['img/front-splash.jpg']) + '.gz')
+    # the same sources build the same bytes
+    gz = read(main_css + '.gz')
+    assert assets.build(static, dist)['main.css'][0] == manifest['main.css']
+    assert read(main_css + '.gz') == gz
+
+
+def assets_app(static):
+    app = Flask(__name__, static_folder=static)
+    extension = assets.Assets(app)
+    return app, extension
+
+
+def test_sources_are_linked_until_a_build(static):
+    app, extension = assets_app(static)
+    with app.test_request_context():
+        assert render_template_string("{{ asset_urls('head.js')|join(' ') }}") == ' '.join(
+            '/static/' + source for source in assets.BUNDLES['head.js']
+        )
+        assert extension.asset_url('img/front-splash.jpg') == '/static/img/front-splash.jpg'
+
+
+def test_built_bundles_are_served_precompressed_and_cached_forever(static):
+    assets.build(static, os.path.join(static, 'dist'))
+    app, extension = assets_app(static)
+    with app.test_request_context():
+        (url,) = extension.asset_urls('main.css')
+    assert url.startswith('/static/dist/main.') and url.endswith('.css')
+
+    client = app.test_client()
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data) == client.get(url).data
+    response.close()
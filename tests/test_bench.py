@@ -0,0 +1,43 @@
+from urllib.parse import urlsplit
+import bench
+from app import create_app
+
+#----------------------------------------------------------------------------#
+# Benchmarks.
+#----------------------------------------------------------------------------#
+
+
+def test_percentile():
+    samples = [5, 1, 4, 2, 3]
+    assert bench.percentile(samples, 0.0) == 1
+    assert bench.percentile(samples, 0.5) == 3
+    assert bench.percentile(samples, 0.99) == 5
+    assert bench.percentile([7], 0.9) == 7
+
+
+def result(p50_ms, queries):
+    return {'p50_ms': p50_ms, 'queries': queries}
+
+
+def test_regressions():
+    baseline = {'GET /venues': result(10.0, 2), 'GET /shows': result(5.0, 1), 'GET /': result(0, 0)}
+    current = {
+        'GET /venues': result(11.9, 3),
+        'GET /shows': result(6.5, 1),
+        'GET /': result(1.0, 0),
+        'GET /new': result(100.0, 50),
+    }
+    assert bench.regressions(baseline, current, 0.2) == [
+        'GET /venues: 2 -> 3 queries',
+        'GET /shows: p50 5.00ms -> 6.50ms',
+    ]
+    assert bench.regressions(baseline, baseline, 0.2) == []
+
+
+def test_benchmarked_routes_exist():
+    adapter = create_app().url_map.bind('localhost')
+    routes = [(method, url) for name, method, url, data in bench.read_routes(1, 2)]
+    routes += [(method, url) for method, url, data in bench.throughput_routes(1, 2)]
+    for method, url in routes:
+        # raises NotFound or MethodNotAllowed for a route that has gone
+        adapter.match(urlsplit(url).path, method=method)
@@ -0,0 +1,140 @@
+import datetime
+import types
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Query
+import booking
+
+#----------------------------------------------------------------------------#
+# Tour booking, with the database calls stood in for.
+#----------------------------------------------------------------------------#
+
+HOURS = datetime.timedelta(hours=3)
+
+
+def test_parse_entries():
+    entries = booking.parse_entries([
+        '1, 2, 2030-05-01 20:00',
+        {'artist_id': '3', 'venue_id': 4, 'start_time': '2030-05-02 21:30:00'},
+        '1, 2',
+        {'artist_id': 1, 'venue_id': 2, 'start_time': 1893456000},
+        'x, 2, 2030-05-01 20:00',
+        '1, 2, 1 May 2030',
+    ])
+    assert [entry['line'] for entry in entries] == [1, 2, 3, 4, 5, 6]
+    assert entries[0] == {
+        'line': 1, 'status': None, 'reason': None,
+        'artist_id': 1, 'venue_id': 2, 'start_time': datetime.datetime(2030, 5, 1, 20)
+    }
+    assert (entries[1]['artist_id'], entries[1]['venue_id'], entries[1]['start_time']) == (3, 4, datetime.datetime(2030, 5, 2, 21, 30))
+    for entry in entries[2:]:
+        assert entry['status'] == 'rejected'
+        assert entry['reason'].startswith('Expected artist_id, venue_id, YYYY-MM-DD HH:MM')
+        assert 'input' in entry
+
+
+def test_parse_start_time():
+    assert booking.parse_start_time(' 2030-05-01 20:00 ') == datetime.datetime(2030, 5, 1, 20)
+    moment = datetime.datetime(2030, 5, 1, 20)
+    assert booking.parse_start_time(moment) is moment
+    with pytest.raises(ValueError):
+        booking.parse_start_time(None)
+
+
+def show(venue_id, artist_id, start_time):
+    return types.SimpleNamespace(show_id=None, venue_id=venue_id, artist_id=artist_id, start_time=start_time)
+
+
+def test_clash_reason():
+    entry = {'venue_id': 1, 'artist_id': 2, 'start_time': datetime.datetime(2030, 5, 1, 20)}
+    assert booking.clash_reason(entry, show(1, 9, datetime.datetime(2030, 5, 1, 22)), HOURS) == 'Venue 1 is already booked at 2030-05-01 22:00'
+    assert booking.clash_reason(entry, show(9, 2, datetime.datetime(2030, 5, 1, 18)), HOURS) == 'Artist 2 is already playing at 2030-05-01 18:00'
+    # exactly one show length apart is fine, and so are other venues and artists
+    assert booking.clash_reason(entry, show(1, 2, datetime.datetime(2030, 5, 1, 23)), HOURS) is None
+    assert booking.clash_reason(entry, show(8, 9, datetime.datetime(2030, 5, 1, 20)), HOURS) is None
+
+
+class RecordingQuery(Query):
+    # a query bound to no session; all() keeps the statement instead of running it
+    statements = []
+
+    def all(self):
+        self.statements.append(self.statement)
+        return []
+
+
+def test_clashes_are_range_scans_on_live_shows(monkeypatch):
+    monkeypatch.setattr(booking.db, 'session', types.SimpleNamespace(query=lambda *columns: RecordingQuery(columns)))
+    assert booking.clashing_shows(booking.parse_entries(['1, 2, 2030-05-01 20:00']), HOURS) == []
+    assert booking.clashing_shows([], HOURS) == []
+
+    sql = str(RecordingQuery.statements[-1].compile(dialect=postgresql.dialect()))
+    assert 'shows.venue_id = %(venue_id_1)s AND shows.start_time > %(start_time_1)s AND shows.start_time < %(start_time_2)s' in sql
+    assert 'shows.artist_id = %(artist_id_1)s AND shows.start_time > %(start_time_3)s AND shows.start_time < %(start_time_4)s' in sql
+    assert 'venues.deleted_at IS NULL AND artists.deleted_at IS NULL' in sql
+    assert len(RecordingQuery.statements) == 1
+
+
+class StubSession:
+
+    def __init__(self):
+        self.inserted = []
+        self.committed = False
+
+    def execute(self, statement, rows):
+        self.inserted.extend(rows)
+
+    def connection(self):
+        return None
+
+    def commit(self):
+        self.committed = True
+
+
+@pytest.fixture
+def stubbed(monkeypatch):
+    # artists 1 and 2 and venues 10 and 11 exist; venue 10 has a show on May 1st at 20:00
+    session = StubSession()
+    adjusted = []
+    monkeypatch.setattr(booking.db, 'session', session)
+    monkeypatch.setattr(booking, 'existing_ids', lambda artist_ids, venue_ids: ({1, 2} & artist_ids, {10, 11} & venue_ids))
+    monkeypatch.setattr(booking, 'lock', lambda artist_ids, venue_ids: None)
+    monkeypatch.setattr(booking, 'clashing_shows', lambda entries, duration: [show(10, 7, datetime.datetime(2030, 5, 1, 20))])
+    monkeypatch.setattr(booking.counters, 'adjust', lambda connection, shows, delta=1: adjusted.extend(shows))
+    return session, adjusted
+
+
+def test_each_entry_gets_its_own_result(stubbed):
+    session, adjusted = stubbed
+    results = booking.book_tour([
+        '1, 11, 2030-05-03 20:00',
+        '1, 10, 2030-05-01 21:00',
+        '3, 11, 2030-05-04 20:00',
+        '1, 12, 2030-05-05 20:00',
+        'garbage',
+        '2, 11, 2030-05-03 22:00',
+        '2, 11, 2030-05-06 20:00',
+    ], HOURS)
+
+    assert [(entry['line'], entry['status']) for entry in results] == [
+        (1, 'booked'), (2, 'rejected'), (3, 'rejected'), (4, 'rejected'), (5, 'rejected'), (6, 'rejected'), (7, 'booked')
+    ]
+    assert results[1]['reason'] == 'Venue 10 is already booked at 2030-05-01 20:00'
+    assert results[2]['reason'] == 'No artist with id 3'
+    assert results[3]['reason'] == 'No venue with id 12'
+    # a clash within the tour: the earlier date wins
+    assert results[5]['reason'] == 'Venue 11 is already booked at 2030-05-03 20:00'
+
+    # the booked shows go in with one executemany, and onto the counters
+    assert session.inserted == [
+        {'venue_id': 11, 'artist_id': 1, 'start_time': datetime.datetime(2030, 5, 3, 20)},
+        {'venue_id': 11, 'artist_id': 2, 'start_time': datetime.datetime(2030, 5, 6, 20)},
+    ]
+    assert adjusted == [(11, 1, datetime.datetime(2030, 5, 3, 20)), (11, 2, datetime.datetime(2030, 5, 6, 20))]
+    assert session.committed
+
+
+def test_the_earlier_date_wins_whatever_the_line_order(stubbed):
+    session, adjusted = stubbed
+    results = booking.book_tour(['2, 11, 2030-05-03 22:00', '1, 11, 2030-05-03 20:00'], HOURS)
+    assert [entry['status'] for entry in results] == ['rejected', 'booked']
@@ -0,0 +1,171 @@
+import fnmatch
+import pytest
+from flask import Flask, Response, flash, request, stream_with_context
+from cache import LocalBackend, PageCache
+
+#----------------------------------------------------------------------------#
+# Page cache, with a stand-in for a shared redis.
+#----------------------------------------------------------------------------#
+
+
+class StubRedis:
+    # the commands RedisBackend uses, on one dict any number of backends can share
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def sadd(self, key, member):
+        self.data.setdefault(key, set()).add(member)
+
+    def expire(self, key, seconds):
+        pass
+
+    def smembers(self, key):
+        return set(self.data.get(key, ()))
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, pattern):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, pattern)]
+
+    def pipeline(self):
+        return StubPipeline(self)
+
+
+class StubPipeline:
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        for name, args, kwargs in self.commands:
+            getattr(self.client, name)(*args, **kwargs)
+
+
+def worker(redis, **config):
+    # one gunicorn worker's app and page cache
+    app = Flask(__name__)
+    app.config.update(CACHE_BACKEND='redis', CACHE_REDIS_URL='redis://localhost:6379/0', WEB_CONCURRENCY=2, **config)
+    pages = PageCache(app)
+    pages.backend.client = redis
+    names = {'name': 'old name'}
+
+    @app.route('/venues/<int:venue_id>')
+    @pages.cached('venue:{venue_id}')
+    def venue(venue_id):
+        return names['name']
+
+    return app, pages, names
+
+
+def test_an_invalidation_reaches_every_worker():
+    redis = StubRedis()
+    (first, first_pages, names), (second, second_pages, other_names) = worker(redis), worker(redis)
+    assert second.test_client().get('/venues/1').data == b'old name'
+
+    # the write lands on the first worker, the redirect after it on the second
+    names['name'] = other_names['name'] = 'new name'
+    with first.app_context():
+        first_pages.invalidate('venue:1')
+    assert second.test_client().get('/venues/1').data == b'new name'
+
+
+def test_local_refuses_more_than_one_worker():
+    app = Flask(__name__)
+    app.config.update(CACHE_BACKEND='local', WEB_CONCURRENCY=4)
+    with pytest.raises(RuntimeError):
+        PageCache(app)
+    app.config['WEB_CONCURRENCY'] = 1
+    assert isinstance(PageCache(app).backend, LocalBackend)
+
+
+def test_local_backend_evicts_the_least_recently_used():
+    backend = LocalBackend(max_entries=2, ttl=300)
+    backend.set('a', 'A', 'venues')
+    backend.set('b', 'B', 'venues')
+    assert backend.get('a') == 'A'
+    backend.set('c', 'C', 'artists')
+    assert (backend.get('a'), backend.get('b'), backend.get('c')) == ('A', None, 'C')
+    assert backend.tags == {'venues': {'a'}, 'artists': {'c'}}
+
+
+def test_local_backend_expires_entries():
+    backend = LocalBackend(max_entries=2, ttl=-1)
+    backend.set('a', 'A', 'venues')
+    assert backend.get('a') is None
+    assert backend.entries == {} and backend.tags == {}
+
+
+def local_app(**config):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.config.update(CACHE_BACKEND='local', **config)
+    pages = PageCache(app)
+    renders = []
+
+    @app.route('/venues')
+    @pages.cached('venues')
+    def index():
+        renders.append(request.full_path)
+        return 'page %s' % len(renders)
+
+    @app.route('/streamed')
+    @pages.cached('venues')
+    def streamed():
+        renders.append(request.full_path)
+        return Response(stream_with_context(iter(['page ', str(len(renders))])))
+
+    @app.route('/flash')
+    def flash_message():
+        flash('Saved')
+        return ''
+
+    return app, pages, renders
+
+
+def test_every_variant_of_a_tag_goes_at_once():
+    app, pages, renders = local_app()
+    client = app.test_client()
+    assert client.get('/venues').data == b'page 1'
+    assert client.get('/venues?page=2').data == b'page 2'
+    assert client.get('/venues').data == b'page 1'
+    assert client.get('/venues?page=2').data == b'page 2'
+    with app.app_context():
+        pages.invalidate('venues')
+    assert client.get('/venues?page=2').data == b'page 3'
+    assert client.get('/venues').data == b'page 4'
+
+
+def test_streamed_pages_are_stored_once_sent():
+    app, pages, renders = local_app()
+    client = app.test_client()
+    assert client.get('/streamed').data == b'page 1'
+    assert client.get('/streamed').data == b'page 1'
+    assert renders == ['/streamed?']
+
+
+def test_oversized_streamed_pages_are_not_stored():
+    app, pages, renders = local_app(CACHE_MAX_PAGE_SIZE=3)
+    client = app.test_client()
+    assert client.get('/streamed').data == b'page 1'
+    assert client.get('/streamed').data == b'page 2'
+
+
+def test_pages_with_flashed_messages_are_not_shared():
+    app, pages, renders = local_app()
+    client = app.test_client()
+    client.get('/flash')
+    assert client.get('/venues').data == b'page 1'
+    assert client.get('/venues').data == b'page 2'
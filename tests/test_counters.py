@@ -0,0 +1,57 @@
+import datetime
+from flask import Flask
+from sqlalchemy import event
+import counters
+from models import Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Show counters, against a connection that records what it is sent.
+#----------------------------------------------------------------------------#
+
+
+class RecordingConnection:
+
+    def __init__(self, rolled_at=datetime.datetime(2030, 1, 1)):
+        self.rolled_at = rolled_at
+        self.statements = []
+
+    def execute(self, statement, *multiparams, **params):
+        self.statements.append((str(statement), multiparams, params))
+        return self
+
+    def scalar(self):
+        return self.rolled_at
+
+
+def test_listeners_come_with_the_app():
+    app = Flask(__name__)
+    counters.init_app(app)
+    counters.init_app(app)
+    assert event.contains(Show, 'after_insert', counters.count_inserted_show)
+    assert event.contains(Show, 'after_delete', counters.count_deleted_show)
+
+
+def test_deleting_a_venue_takes_its_shows_off_the_artists():
+    connection = RecordingConnection()
+    counters.remove_owner(connection, Venue, 7)
+    # the watermark, then the update
+    (watermark, _, _), (statement, multiparams, params) = connection.statements
+    assert 'show_counters.rolled_at' in watermark
+    assert statement.strip().startswith('UPDATE artists SET')
+    assert 'WHERE venue_id = :owner_id GROUP BY artist_id' in statement
+    assert 'artists.deleted_at IS NULL' in statement
+    assert params == {'rolled_at': connection.rolled_at, 'owner_id': 7}
+
+
+def test_deleting_an_artist_takes_its_shows_off_the_venues():
+    connection = RecordingConnection()
+    counters.remove_owner(connection, Artist, 3)
+    statement = connection.statements[-1][0]
+    assert statement.strip().startswith('UPDATE venues SET')
+    assert 'WHERE artist_id = :owner_id GROUP BY venue_id' in statement
+
+
+def test_recount_only_counts_live_shows():
+    for model, column, position in counters.TARGETS:
+        sql = counters.RECOUNT.format(table=model.__tablename__, column=column.key)
+        assert 'venues.deleted_at IS NULL' in sql and 'artists.deleted_at IS NULL' in sql
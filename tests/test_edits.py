@@ -0,0 +1,94 @@
+import datetime
+import types
+import pytest
+from sqlalchemy.dialects import postgresql
+import edits
+from app import create_app
+from models import Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Edits.
+#----------------------------------------------------------------------------#
+
+VERSION = datetime.datetime(2030, 1, 1, 12, 0, 0, 123456)
+
+
+def compile_update(model, values, monkeypatch):
+    statements = []
+    monkeypatch.setattr(edits.db, 'session', types.SimpleNamespace(
+        execute=lambda statement: statements.append(statement) or types.SimpleNamespace(first=lambda: None)
+    ))
+    assert edits.update_record(model, 5, VERSION, values) is None
+    (statement,) = statements
+    compiled = statement.compile(dialect=postgresql.dialect())
+    return str(compiled), compiled.params
+
+
+def test_version_token_round_trip():
+    assert edits.parse_version(edits.version_token(VERSION)) == VERSION
+    for token in (None, '', 'yesterday'):
+        with pytest.raises(ValueError):
+            edits.parse_version(token)
+
+
+def test_an_edit_only_writes_over_its_version(monkeypatch):
+    sql, params = compile_update(Artist, {'phone': '123-456-7890'}, monkeypatch)
+    assert sql.startswith('UPDATE artists SET phone=%(phone)s, updated_at=LOCALTIMESTAMP')
+    assert 'WHERE artists.id = %(id_1)s AND artists.updated_at = %(updated_at_1)s AND artists.deleted_at IS NULL' in sql
+    assert params['updated_at_1'] == VERSION
+    # phone isn't part of the search text
+    assert 'search_text' not in sql
+
+
+def test_a_genre_edit_returns_the_old_genres(monkeypatch):
+    sql, params = compile_update(Venue, {'name': 'The Dive', 'genres': ['Jazz', 'Blues']}, monkeypatch)
+    assert 'FROM venues AS "old" WHERE' in sql
+    assert 'AND "old".id = venues.id RETURNING venues.updated_at, "old".genres AS old_genres' in sql
+    assert 'search_text=concat_ws(' in sql
+    assert 'Jazz Blues' in params.values()
+
+
+def test_submitted_values_leave_out_what_was_not_sent():
+    from werkzeug.datastructures import MultiDict
+    values = edits.submitted_values(Artist, MultiDict([('name', 'Guns'), ('seeking_venue', 'y'), ('unknown', 'x')]))
+    assert values == {'name': 'Guns', 'seeking_venue': True}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    saved = types.SimpleNamespace(
+        id=5, name='The Dive', city='Austin', state='TX', address='1 Main St', phone='', genres=['Jazz'],
+        image_link='', facebook_link='', updated_at=VERSION + datetime.timedelta(minutes=5)
+    )
+    # the row was edited by someone else: the update matches nothing
+    monkeypatch.setattr(edits, 'update_record', lambda model, id, version, values: None)
+    with app.app_context():
+        monkeypatch.setattr(Venue, 'query', types.SimpleNamespace(
+            filter=lambda *conditions: types.SimpleNamespace(first_or_404=lambda: saved)
+        ))
+    return app.test_client()
+
+
+def test_a_stale_edit_is_a_conflict_that_keeps_the_submitted_values(client):
+    response = client.post('/venues/5/edit', data={
+        'version': edits.version_token(VERSION),
+        'name': 'The Dive Bar',
+        'city': 'Austin',
+        'genres': ['Jazz', 'Folk'],
+    })
+    assert response.status_code == 409
+    page = response.get_data(as_text=True)
+    assert 'was changed by someone else while you were editing' in page
+    # what was submitted is still in the form, with what was saved next to it
+    assert 'value="The Dive Bar"' in page
+    assert 'Saved meanwhile: The Dive' in page
+    assert 'Saved meanwhile: Jazz' in page
+    assert 'Saved meanwhile: Austin' not in page
+    # and the new version, so saving again goes through
+    assert 'name="version" value="{}"'.format(edits.version_token(VERSION + datetime.timedelta(minutes=5))) in page
+
+
+def test_an_edit_without_a_version_is_refused(client):
+    assert client.post('/venues/5/edit', data={'name': 'The Dive Bar'}).status_code == 400
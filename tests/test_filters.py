@@ -0,0 +1,29 @@
+import datetime
+import babel.dates
+import pytest
+import filters
+
+#----------------------------------------------------------------------------#
+# The datetime filter.
+#----------------------------------------------------------------------------#
+
+MOMENT = datetime.datetime(2030, 5, 1, 21, 30)
+
+
+@pytest.mark.parametrize('format', ['medium', 'full', 'short', 'long', 'yyyy-MM-dd HH:mm'])
+def test_the_same_output_as_babel(format):
+    expected = babel.dates.format_datetime(MOMENT, filters.DATETIME_FORMATS.get(format, format), locale='en_US')
+    assert filters.format_datetime(MOMENT, format, locale='en_US') == expected
+
+
+def test_named_formats():
+    assert filters.format_datetime(MOMENT, 'full', locale='en_US') == 'Wednesday May, 1, 2030 at 9:30PM'
+    assert filters.format_datetime(MOMENT, locale='en_US') == 'Wed 05, 01, 2030 9:30PM'
+
+
+def test_patterns_are_parsed_once():
+    filters.compiled_pattern.cache_clear()
+    for day in range(1, 11):
+        filters.format_datetime(MOMENT.replace(day=day), locale='en_US')
+    info = filters.compiled_pattern.cache_info()
+    assert (info.misses, info.hits) == (1, 9)
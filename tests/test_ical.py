@@ -0,0 +1,118 @@
+import collections
+import datetime
+import types
+import pytest
+from sqlalchemy.dialects import postgresql
+import ical
+import queries
+from app import create_app
+from models import Artist, Venue
+
+#----------------------------------------------------------------------------#
+# Calendar feeds, from stand-in rows.
+#----------------------------------------------------------------------------#
+
+
+def test_escape():
+    assert ical.escape('Rock, Jazz; Blues\\\nNight') == r'Rock\, Jazz\; Blues\\\nNight'
+    assert ical.escape(None) == ''
+
+
+def test_fold_splits_between_characters():
+    assert ical.fold('SUMMARY:short') == 'SUMMARY:short\r\n'
+    line = 'SUMMARY:' + 'é' * 60
+    folded = ical.fold(line)
+    parts = folded[:-2].split('\r\n')
+    assert all(len(part.encode('utf-8')) <= 75 for part in parts)
+    assert all(part.startswith(' ') for part in parts[1:])
+    assert ''.join(part[1:] if n else part for n, part in enumerate(parts)) == line
+
+
+def test_calendar_query_reads_one_side_in_order():
+    with create_app().app_context():
+        statement = str(queries.calendar_query(
+            Artist, 4, datetime.datetime(2030, 1, 1), datetime.datetime(2030, 2, 1)
+        ).statement.compile(dialect=postgresql.dialect()))
+    assert 'WHERE shows.artist_id = %(artist_id_1)s AND venues.deleted_at IS NULL AND artists.deleted_at IS NULL' in statement
+    assert 'shows.start_time >= %(start_time_1)s AND shows.start_time < %(start_time_2)s' in statement
+    assert statement.endswith('ORDER BY shows.start_time, shows.show_id')
+
+
+ROW = types.SimpleNamespace(
+    show_id=7, start_time=datetime.datetime(2030, 5, 1, 20), venue_id=1, venue_name='The Dive',
+    venue_address='1 Main St', venue_city='Austin', venue_state='TX', artist_id=2, artist_name='Guns, Roses'
+)
+
+
+Version = collections.namedtuple('Version', 'name updated_at shows last_show_id other_updated_at')
+
+
+class StubQuery:
+
+    def __init__(self, result):
+        self.result = result
+
+    def one_or_none(self):
+        return self.result
+
+    def yield_per(self, count):
+        return iter(self.result)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app = create_app()
+    windows = []
+
+    def calendar_version_query(model, id, start, end):
+        windows.append((start, end))
+        if id != 1:
+            return StubQuery(None)
+        return StubQuery(Version('The Dive', datetime.datetime(2030, 1, 1), 1, 7, datetime.datetime(2030, 1, 2)))
+
+    monkeypatch.setattr(queries, 'calendar_version_query', calendar_version_query)
+    monkeypatch.setattr(queries, 'calendar_query', lambda model, id, start, end: StubQuery([ROW]))
+    monkeypatch.setattr(ical.db.session, 'commit', lambda: None)
+    client = app.test_client()
+    client.windows = windows
+    return client
+
+
+def test_a_feed_lists_the_shows(client):
+    response = client.get('/venues/1/calendar.ics?from=2030-05-01&to=2030-05-31')
+    assert response.status_code == 200 and response.mimetype == 'text/calendar'
+    assert response.headers['Cache-Control'] == 'public, max-age=300'
+    assert client.windows == [(datetime.datetime(2030, 5, 1), datetime.datetime(2030, 6, 1))]
+    lines = response.get_data(as_text=True).split('\r\n')
+    assert lines[:5] == ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Fyyur//Shows//EN', 'CALSCALE:GREGORIAN', 'X-WR-CALNAME:The Dive']
+    assert 'UID:show-7@localhost' in lines
+    assert 'DTSTART:20300501T200000' in lines and 'DTEND:20300501T230000' in lines
+    assert 'SUMMARY:Guns\\, Roses at The Dive' in lines
+    assert 'LOCATION:The Dive\\, 1 Main St\\, Austin\\, TX' in lines
+    # a venue's events link to the artist
+    assert 'URL:http://localhost/artists/2' in lines
+    assert lines[-2:] == ['END:VCALENDAR', '']
+
+
+def test_a_current_copy_gets_a_304(client):
+    etag = client.get('/venues/1/calendar.ics').headers['ETag'].strip('"')
+    response = client.get('/venues/1/calendar.ics', headers={'If-None-Match': '"{}"'.format(etag)})
+    assert response.status_code == 304 and response.data == b''
+    # the default window starts CALENDAR_PAST_DAYS back, at midnight
+    start, end = client.windows[-1]
+    assert start == datetime.datetime.combine(datetime.date.today(), datetime.time()) - datetime.timedelta(days=30)
+    assert end is None
+
+
+def test_bad_and_missing_calendars(client):
+    assert client.get('/venues/1/calendar.ics?from=May').status_code == 400
+    assert client.get('/venues/2/calendar.ics').status_code == 404
+
+
+def test_etag_follows_the_version_and_the_window():
+    version = ('The Dive', datetime.datetime(2030, 1, 1), 1, 7, None)
+    tag = ical.etag(Venue, 1, None, None, version)
+    assert tag == ical.etag(Venue, 1, None, None, version)
+    assert tag != ical.etag(Venue, 1, None, None, version[:3] + (8, None))
+    assert tag != ical.etag(Venue, 1, datetime.datetime(2030, 1, 1), None, version)
+    assert tag != ical.etag(Artist, 1, None, None, version)
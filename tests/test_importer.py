@@ -0,0 +1,120 @@
+import datetime
+import pytest
+from sqlalchemy import exc
+import importer
+from app import create_app
+from models import Venue
+
+#----------------------------------------------------------------------------#
+# Bulk import, against a session that records what it is sent.
+#----------------------------------------------------------------------------#
+
+
+def test_csv_rows_are_numbered_by_file_line(tmp_path):
+    path = tmp_path / 'venues.csv'
+    path.write_text('name,city\nThe Dive,Austin\nThe Hall,Boston\n')
+    assert list(importer.read_rows(str(path), 'csv')) == [
+        (2, {'name': 'The Dive', 'city': 'Austin'}, None),
+        (3, {'name': 'The Hall', 'city': 'Boston'}, None),
+    ]
+
+
+def test_bad_jsonl_lines_are_row_errors(tmp_path):
+    path = tmp_path / 'venues.jsonl'
+    path.write_text('{"name": "The Dive"}\n\n{"name": \n[1, 2]\n')
+    rows = list(importer.read_rows(str(path), 'jsonl'))
+    assert rows[0] == (1, {'name': 'The Dive'}, None)
+    line, text, errors = rows[1]
+    assert (line, text) == (3, '{"name": ')
+    assert list(errors) == ['json']
+    assert rows[2] == (4, '[1, 2]', {'json': ['expected an object, got list']})
+
+
+def test_formdata_splits_genres():
+    data = importer.formdata({'name': 'The Dive', 'genres': 'Jazz; Blues,Folk', 'phone': None, 'seats': 200})
+    assert data.getlist('genres') == ['Jazz', 'Blues', 'Folk']
+    assert data['seats'] == '200'
+    assert 'phone' not in data
+    assert importer.formdata({'genres': ['Jazz', 'Rock']}).getlist('genres') == ['Jazz', 'Rock']
+
+
+def test_rows_are_validated_with_the_create_forms():
+    import forms
+    model, form_name, fields = importer.KINDS['venues']
+    row = {
+        'name': 'The Dive', 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+        'genres': 'Jazz;Blues', 'facebook_link': 'https://www.facebook.com/thedive'
+    }
+    with create_app().test_request_context():
+        values, errors = importer.validate(getattr(forms, form_name), fields, row)
+        assert errors is None
+        assert values['genres'] == ['Jazz', 'Blues'] and values['state'] == 'TX'
+        values, errors = importer.validate(getattr(forms, form_name), fields, dict(row, state='XX', name=''))
+        assert values is None
+        assert set(errors) == {'name', 'state'}
+
+
+class RecordingSession:
+    # refuses the rows whose name is in refused, and with them any batch holding one
+
+    def __init__(self, refused):
+        self.refused = refused
+        self.inserted = []
+        self.commits = self.rollbacks = 0
+
+    def execute(self, statement, values):
+        rows = values if isinstance(values, list) else [values]
+        if any(row['name'] in self.refused for row in rows):
+            raise exc.IntegrityError('INSERT', {}, Exception('duplicate key value'))
+        self.inserted.extend(rows)
+
+    def begin_nested(self):
+        return self
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = RecordingSession(refused={'The Hall'})
+    monkeypatch.setattr(importer.db, 'session', session)
+    return session
+
+
+def test_a_batch_goes_in_with_one_executemany(session):
+    assert importer.insert_batch(Venue.__table__, [(2, {'name': 'The Dive'}), (3, {'name': 'The Room'})]) == {}
+    assert session.inserted == [{'name': 'The Dive'}, {'name': 'The Room'}]
+    assert (session.commits, session.rollbacks) == (1, 0)
+
+
+def test_a_refused_batch_is_retried_row_by_row(session):
+    errors = importer.insert_batch(Venue.__table__, [(2, {'name': 'The Dive'}), (3, {'name': 'The Hall'}), (4, {'name': 'The Room'})])
+    assert errors == {3: {'database': ['duplicate key value']}}
+    assert session.inserted == [{'name': 'The Dive'}, {'name': 'The Room'}]
+
+
+def test_show_ids_must_be_integers(monkeypatch):
+    class Query:
+        def __init__(self, column):
+            self.column = column
+
+        def filter(self, *conditions):
+            return iter([(1,)])
+
+    monkeypatch.setattr(importer.db, 'session', type('Session', (), {'query': staticmethod(Query)}))
+    start = datetime.datetime(2030, 5, 1, 20)
+    errors = importer.check_show_ids([
+        (2, {'artist_id': '1', 'venue_id': '1', 'start_time': start}),
+        (3, {'artist_id': 'one', 'venue_id': '1', 'start_time': start}),
+        (4, {'artist_id': '2', 'venue_id': '1', 'start_time': start}),
+        (5, {'artist_id': '1', 'venue_id': '2', 'start_time': start}),
+    ])
+    assert errors == {
+        3: {'id': ['artist_id and venue_id must be integers']},
+        4: {'artist_id': ['No artist with id 2']},
+        5: {'venue_id': ['No venue with id 2']},
+    }
@@ -0,0 +1,30 @@
+import pytest
+from flask import Flask, g
+from sqlalchemy import create_engine, exc, text
+import instrumentation
+
+#----------------------------------------------------------------------------#
+# Request instrumentation, against SQLite.
+#----------------------------------------------------------------------------#
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    instrumentation.init_app(app)
+    return app
+
+
+def test_a_failed_statement_leaves_no_start_behind(app):
+    engine = create_engine('sqlite://')
+    with app.test_request_context('/'), engine.connect() as connection:
+        g.request_stats = instrumentation.RequestStats(5)
+        with pytest.raises(exc.OperationalError):
+            connection.execute(text('SELECT * FROM no_such_table'))
+        assert 'query_started' not in connection.info
+        assert connection.execute(text('SELECT 1')).scalar() == 1
+        stats = g.request_stats
+    assert stats.queries == 1
+    elapsed, n, statement = stats.slowest[0]
+    assert statement == 'SELECT 1'
+    assert 0 <= elapsed < 1
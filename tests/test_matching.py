@@ -0,0 +1,44 @@
+import collections
+import pytest
+from matching import Encoder, best_matches
+
+#----------------------------------------------------------------------------#
+# Scoring, on profiles built without a database.
+#----------------------------------------------------------------------------#
+
+Row = collections.namedtuple('Row', 'id genres city state')
+
+ARTISTS = [
+    Row(1, ['Jazz', 'Blues'], 'San Francisco', 'CA'),
+    Row(2, ['Rock n Roll'], 'New York', 'NY'),
+]
+VENUES = [
+    Row(10, ['Jazz'], 'San Francisco', 'CA'),
+    Row(11, ['Jazz', 'Blues'], 'New York', 'NY'),
+    Row(12, ['Classical'], 'New York', 'NY'),
+]
+
+
+def profiles(artists, venues):
+    encoder = Encoder()
+    artists, venues = encoder.profiles(artists), encoder.profiles(venues)
+    return encoder.genre_sets(), artists, venues
+
+
+def test_best_matches():
+    pytest.importorskip('numpy')
+    genre_sets, artists, venues = profiles(ARTISTS, VENUES)
+    artist_ids, venue_ids, scores, ranks = best_matches(genre_sets, artists, venues, 2, 0.3, 0.3, 1000)
+    pairs = list(zip(artist_ids.tolist(), venue_ids.tolist(), ranks.tolist()))
+    # the same city outweighs a closer genre match; no genre in common, no match
+    assert pairs == [(1, 10, 1), (1, 11, 2)]
+    assert scores.tolist() == sorted(scores.tolist(), reverse=True)
+
+
+@pytest.mark.parametrize('artists, venues', [([], VENUES), (ARTISTS, []), ([], [])])
+def test_an_empty_side_has_no_matches(artists, venues):
+    pytest.importorskip('numpy')
+    genre_sets, artists, venues = profiles(artists, venues)
+    for left, right in ((artists, venues), (venues, artists)):
+        result = best_matches(genre_sets, left, right, 5, 0.1, 0.1, 1000)
+        assert [len(column) for column in result] == [0, 0, 0, 0]
@@ -0,0 +1,71 @@
+import glob
+import importlib.util
+import os
+import explain
+from models import db
+
+#----------------------------------------------------------------------------#
+# Migrations, run against a recorder instead of a database.
+#----------------------------------------------------------------------------#
+
+VERSIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations', 'versions')
+
+
+class RecordingOp:
+    # records the indexes each migration creates and drops
+
+    def __init__(self):
+        self.created = {}
+        self.dropped = set()
+
+    def create_index(self, name, table, columns, **kwargs):
+        self.created[name] = (table, tuple(columns))
+
+    def drop_index(self, name, table_name=None):
+        self.dropped.add(name)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def load_migrations():
+    migrations = {}
+    for path in glob.glob(os.path.join(VERSIONS, '*.py')):
+        spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3], path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        migrations[module.revision] = module
+    return migrations
+
+
+def run(module, step):
+    module.op = RecordingOp()
+    getattr(module, step)()
+    return module.op
+
+
+def test_migrations_form_one_chain():
+    migrations = load_migrations()
+    parents = [module.down_revision for module in migrations.values()]
+    assert parents.count(None) == 1
+    assert len(set(parents)) == len(parents)
+    assert set(parents) - {None} <= set(migrations)
+
+
+def test_every_model_index_has_a_migration():
+    created = {}
+    for module in load_migrations().values():
+        created.update(run(module, 'upgrade').created)
+    for table in db.metadata.tables.values():
+        for index in table.indexes:
+            assert created.get(index.name) == (table.name, tuple(column.name for column in index.columns)), index.name
+
+
+def test_downgrades_drop_what_upgrades_create():
+    for module in load_migrations().values():
+        assert set(run(module, 'upgrade').created) == run(module, 'downgrade').dropped, module.revision
+
+
+def test_explain_compares_against_the_hot_query_indexes():
+    hot = load_migrations()['8c4d2e6f1a93']
+    assert set(explain.HOT_QUERY_INDEXES) == set(run(hot, 'upgrade').created)
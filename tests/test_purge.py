@@ -0,0 +1,99 @@
+import types
+import pytest
+from sqlalchemy import exc
+from sqlalchemy.dialects import postgresql
+import counters
+import purge
+from models import Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Deletes, against a session that records what it is sent.
+#----------------------------------------------------------------------------#
+
+
+class RecordingSession:
+
+    def __init__(self, results=()):
+        self.results = list(results)
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def connection(self):
+        return self
+
+    def execute(self, statement, *multiparams, **params):
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        return self.results.pop(0) if self.results else types.SimpleNamespace(first=lambda: None, rowcount=0)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = RecordingSession()
+    monkeypatch.setattr(purge.db, 'session', session)
+    return session
+
+
+@pytest.fixture
+def removed(monkeypatch):
+    removed = []
+    monkeypatch.setattr(counters, 'remove_owner', lambda connection, model, id: removed.append((connection, model, id)))
+    monkeypatch.setattr(counters, 'adjust', lambda *args, **kwargs: pytest.fail('purging must not touch the counters'))
+    return removed
+
+
+def test_soft_delete_takes_the_shows_off_the_counters(session, removed):
+    session.results.append(types.SimpleNamespace(first=lambda: (['Jazz'],)))
+    assert purge.soft_delete(Venue, 5) == (['Jazz'],)
+    (statement,) = session.statements
+    assert statement.startswith('UPDATE venues SET deleted_at=')
+    assert 'WHERE venues.id = %(id_1)s AND venues.deleted_at IS NULL RETURNING venues.genres' in statement
+    # in the same transaction, and nothing committed yet
+    assert removed == [(session, Venue, 5)]
+    assert session.commits == 0
+
+
+def test_soft_delete_of_a_missing_or_deleted_row(session, removed):
+    assert purge.soft_delete(Artist, 5) is None
+    assert removed == []
+
+
+def test_purge_batch_deletes_a_locked_batch(session, removed):
+    session.results.append(types.SimpleNamespace(rowcount=3))
+    assert purge.purge_batch(Show.venue_id, 5, 1000) == 3
+    (statement,) = session.statements
+    assert statement.startswith('DELETE FROM shows WHERE shows.show_id IN (SELECT shows.show_id')
+    assert 'WHERE shows.venue_id = %(venue_id_1)s' in statement
+    assert 'LIMIT %(param_1)s FOR UPDATE SKIP LOCKED' in statement
+    assert session.commits == 1
+
+
+def test_purge_owner_goes_batch_by_batch(session, removed, monkeypatch):
+    batches = [2, 2, 1]
+    sleeps = []
+    monkeypatch.setattr(purge, 'purge_batch', lambda column, id, size: batches.pop(0))
+    monkeypatch.setattr(purge.time, 'sleep', sleeps.append)
+    assert purge.purge_owner(Artist, Show.artist_id, 9, 2, 0.5) == 5
+    # a pause between full batches, none after the last
+    assert sleeps == [0.5, 0.5]
+    # then the row goes, once no shows point at it
+    (statement,) = session.statements
+    assert statement.startswith('DELETE FROM artists WHERE artists.id = %(id_1)s AND artists.deleted_at IS NOT NULL AND NOT (EXISTS')
+    assert session.commits == 1
+
+
+def test_purge_owner_leaves_a_row_that_got_a_new_show(session, removed, monkeypatch):
+    monkeypatch.setattr(purge, 'purge_batch', lambda column, id, size: 0)
+
+    def execute(statement, *multiparams, **params):
+        raise exc.IntegrityError('DELETE', {}, Exception('shows_artist_id_fkey'))
+
+    monkeypatch.setattr(session, 'execute', execute)
+    assert purge.purge_owner(Artist, Show.artist_id, 9, 2, 0) == 0
+    assert (session.commits, session.rollbacks) == (0, 1)
@@ -0,0 +1,154 @@
+import datetime
+import types
+import pytest
+from sqlalchemy.dialects import postgresql
+import queries
+import search
+from app import create_app
+from models import Artist, Venue
+
+#----------------------------------------------------------------------------#
+# Listing and search queries, compiled rather than run.
+#----------------------------------------------------------------------------#
+
+
+@pytest.fixture
+def app():
+    app = create_app()
+    with app.app_context():
+        yield app
+
+
+def sql(query):
+    return str(query.statement.compile(dialect=postgresql.dialect()))
+
+
+def test_genre_filtered_listings(app):
+    for query in (
+        queries.venue_areas_query(10, genre='Jazz'),
+        queries.venues_query(genre='Jazz'),
+        queries.artists_query(genre='Jazz'),
+        search.search_query(Artist, 'band', 10, genre='Jazz')
+    ):
+        assert '@> CAST(%(param_1)s AS VARCHAR[])' in sql(query)
+
+
+def test_genre_filter_binds_the_genre(app):
+    compiled = queries.genre_filter(Venue, 'Jazz').compile(dialect=postgresql.dialect())
+    assert str(compiled) == 'venues.genres @> CAST(%(param_1)s AS VARCHAR[])'
+    assert compiled.params == {'param_1': ['Jazz']}
+
+
+@pytest.mark.parametrize('detail_queries', [queries.venue_detail_queries, queries.artist_detail_queries])
+def test_detail_pages_load_a_bounded_number_of_shows(app, detail_queries):
+    row, shows = detail_queries(1, 30)
+    compiled = shows.statement.compile(dialect=postgresql.dialect())
+    assert str(compiled).count('LIMIT') == 2
+    assert ' UNION ALL ' in str(compiled)
+    assert sorted(value for name, value in compiled.params.items() if name.startswith('param')) == [30, 30]
+    assert 'upcoming_shows_count' in sql(row) and 'past_shows_count' in sql(row)
+
+
+def test_detail_counts_come_from_the_counters():
+    now = datetime.datetime.now()
+    venue = types.SimpleNamespace(upcoming_shows_count=500, past_shows_count=1200, **{
+        field: None for field in queries.VENUE_DETAIL_FIELDS
+    })
+    shows = [
+        types.SimpleNamespace(artist_id=1, artist_name='A', artist_image_link=None, start_time=now + datetime.timedelta(days=days))
+        for days in (-2, -1, 1)
+    ]
+    data = queries.build_venue_detail(venue, shows)
+    assert (data['past_shows_count'], data['upcoming_shows_count']) == (1200, 500)
+    assert len(data['past_shows']) == 2 and len(data['upcoming_shows']) == 1
+
+
+#  Show feed
+#  ----------------------------------------------------------------
+
+def test_cursor_round_trip():
+    start_time = datetime.datetime(2030, 5, 21, 21, 30, 15)
+    cursor = queries.encode_cursor(start_time, 42)
+    assert queries.decode_cursor(cursor) == (start_time, 42)
+
+
+@pytest.mark.parametrize('cursor', ['', 'garbage', '2030-05-21T21:30:00', '2030-05-21T21:30:00_x', 'not-a-date_4'])
+def test_bad_cursors(cursor):
+    with pytest.raises(ValueError):
+        queries.decode_cursor(cursor)
+
+
+@pytest.mark.parametrize('when, comparison, order', [
+    ('all', '>', 'shows.start_time, shows.show_id'),
+    ('upcoming', '>', 'shows.start_time, shows.show_id'),
+    ('past', '<', 'shows.start_time DESC, shows.show_id DESC'),
+])
+def test_feed_pages_from_the_cursor_row(app, when, comparison, order):
+    cursor = queries.encode_cursor(datetime.datetime(2030, 1, 1, 20), 7)
+    compiled = queries.show_feed_query(30, when=when, cursor=cursor).statement.compile(dialect=postgresql.dialect())
+    text = str(compiled)
+    # a row comparison on the index's own key, not an OFFSET
+    assert '(shows.start_time, shows.show_id) {} (%(param_1)s, %(param_2)s)'.format(comparison) in text
+    assert 'ORDER BY {} \n LIMIT %(param_3)s'.format(order) in text
+    assert 'OFFSET' not in text
+    # one row more than the page, to know whether there is a next one
+    assert [compiled.params[name] for name in ('param_1', 'param_2', 'param_3')] == [datetime.datetime(2030, 1, 1, 20), 7, 31]
+
+
+def test_show_page_stops_at_the_limit_and_points_past_the_last_row():
+    rows = [
+        types.SimpleNamespace(
+            show_id=id, start_time=datetime.datetime(2030, 1, id), venue_id=1, venue_name='V',
+            artist_id=2, artist_name='A', artist_image_link=None
+        ) for id in range(1, 5)
+    ]
+    page = queries.ShowPage(rows, 3)
+    assert [show['start_time'].day for show in page] == [1, 2, 3]
+    assert queries.decode_cursor(page.next_cursor) == (datetime.datetime(2030, 1, 3), 3)
+
+    last_page = queries.ShowPage(rows[:3], 3)
+    assert len(list(last_page)) == 3
+    assert last_page.next_cursor is None
+
+
+def test_a_bad_cursor_is_a_bad_request(app):
+    assert app.test_client().get('/shows?after=garbage').status_code == 400
+
+
+def test_areas_are_capped_by_a_window_function(app):
+    query = queries.venue_areas_query(20, page=3)
+    statement = sql(query)
+    assert 'row_number() OVER (PARTITION BY venues.city, venues.state ORDER BY venues.name, venues.id) AS position' in statement
+    assert 'count(*) OVER (PARTITION BY venues.city, venues.state) AS total' in statement
+    assert 'WHERE anon_1.position > %(position_1)s AND anon_1.position <= %(position_2)s' in statement
+    assert 'ORDER BY anon_1.state, anon_1.city, anon_1.position' in statement
+    params = query.statement.compile(dialect=postgresql.dialect()).params
+    assert (params['position_1'], params['position_2']) == (40, 60)
+
+
+def test_busiest_areas_rank_by_the_counters(app):
+    statement = sql(queries.venue_areas_query(20, city='Austin', state='TX', sort='busiest'))
+    assert 'ORDER BY venues.upcoming_shows_count DESC, venues.past_shows_count DESC, venues.id) AS position' in statement
+    assert 'venues.city = %(city_1)s AND venues.state = %(state_1)s' in statement
+
+
+def area_row(city, state, id, position, total):
+    return types.SimpleNamespace(
+        id=id, name='Venue %s' % id, city=city, state=state, upcoming_shows_count=id, position=position, total=total
+    )
+
+
+def test_group_areas():
+    areas = list(queries.group_areas([
+        area_row('Austin', 'TX', 1, 1, 3),
+        area_row('Austin', 'TX', 2, 2, 3),
+        area_row('Boston', 'MA', 3, 1, 1),
+    ], page=1))
+    assert [(area['city'], area['state'], area['total'], area['has_more']) for area in areas] == [
+        ('Austin', 'TX', 3, True), ('Boston', 'MA', 1, False)
+    ]
+    assert areas[0]['venues'] == [
+        {'id': 1, 'name': 'Venue 1', 'upcoming_shows_count': 1},
+        {'id': 2, 'name': 'Venue 2', 'upcoming_shows_count': 2},
+    ]
+    assert areas[0]['page'] == 1
@@ -0,0 +1,170 @@
+import pytest
+from flask import Flask, Response, g, jsonify, stream_with_context
+from cache import PageCache
+import replicas as routing
+from replicas import ReplicaSet, RoutingSession, finish_request, on_primary, read_only, read_replica
+
+#----------------------------------------------------------------------------#
+# Read routing, against stand-in replicas.
+#----------------------------------------------------------------------------#
+
+
+class StubReplica:
+    # what ReplicaSet and the routing need of a Replica, without an engine behind it
+
+    def __init__(self, name, healthy=True):
+        self.name = name
+        self.engine = object()
+        self.healthy = healthy
+        self.reads = 0
+        self.checks = 0
+
+    def due(self, interval):
+        return True
+
+    def check(self, max_lag):
+        self.checks += 1
+        return self.healthy
+
+
+@pytest.fixture
+def replicas():
+    return ReplicaSet([StubReplica('replica-1'), StubReplica('replica-2')], check_interval=5, max_lag=5)
+
+
+@pytest.fixture
+def app(replicas):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', REPLICA_STICKY_SECONDS=10, REPLICA_ROUTE_HEADER=True)
+    app.extensions['replicas'] = replicas
+    app.after_request(finish_request(app))
+
+    def database():
+        replica = read_replica()
+        return jsonify(replica.name if replica is not None else 'primary')
+
+    app.add_url_rule('/read', 'read', database)
+    app.add_url_rule('/write', 'write', database, methods=['POST'])
+    app.add_url_rule('/search', 'search', read_only(database), methods=['POST'])
+    app.add_url_rule('/edit', 'edit', on_primary(database))
+    return app
+
+
+def test_get_reads_from_a_replica(app):
+    client = app.test_client()
+    assert client.get('/read').get_json() == 'replica-1'
+    # round-robin
+    assert client.get('/read').get_json() == 'replica-2'
+    assert client.get('/read').headers['X-Database'] == 'replica-1'
+
+
+def test_writes_go_to_the_primary(app):
+    assert app.test_client().post('/write').get_json() == 'primary'
+
+
+def test_reads_are_sticky_after_a_write(app):
+    client = app.test_client()
+    client.post('/write')
+    assert client.get('/read').get_json() == 'primary'
+    # another browser, without the mark, still reads from a replica
+    assert app.test_client().get('/read').get_json() == 'replica-1'
+
+
+def test_stickiness_runs_out(app):
+    app.config['REPLICA_STICKY_SECONDS'] = -1
+    client = app.test_client()
+    client.post('/write')
+    assert client.get('/read').get_json() == 'replica-1'
+
+
+def test_read_only_posts_use_replicas_and_leave_no_mark(app):
+    client = app.test_client()
+    assert client.post('/search').get_json() == 'replica-1'
+    assert client.get('/read').get_json() == 'replica-2'
+
+
+def test_on_primary_views(app):
+    assert app.test_client().get('/edit').get_json() == 'primary'
+
+
+def test_unhealthy_replicas_fall_back_to_the_primary(app, replicas):
+    for replica in replicas.replicas:
+        replica.healthy = False
+    response = app.test_client().get('/read')
+    assert response.get_json() == 'primary'
+    assert response.headers['X-Database'] == 'primary'
+    assert all(replica.checks == 1 for replica in replicas.replicas)
+
+
+def test_unhealthy_replicas_are_skipped(app, replicas):
+    replicas.replicas[0].healthy = False
+    client = app.test_client()
+    assert [client.get('/read').get_json() for n in range(3)] == ['replica-2'] * 3
+    assert replicas.replicas[1].reads == 3
+
+
+def test_one_database_per_request(app):
+    with app.test_request_context('/read'):
+        first = read_replica()
+        assert read_replica() is first
+        assert g.db_replica is first
+
+
+def test_session_binds_to_the_replica(app):
+    # get_bind hands out the replica's engine before the primary's is looked at
+    with app.test_request_context('/read'):
+        assert RoutingSession.get_bind(None) is read_replica().engine
+
+
+def test_no_replicas_outside_requests(app):
+    with app.app_context():
+        assert read_replica() is None
+
+
+def test_pages_read_from_a_replica_are_not_cached(app):
+    # the replicas still have the venue's old name when the write's invalidation runs
+    names = {'primary': 'new name', 'replica-1': 'old name', 'replica-2': 'old name'}
+    pages = PageCache(app)
+
+    @pages.cached('venue:{venue_id}')
+    def venue(venue_id):
+        replica = read_replica()
+        return names[replica.name if replica is not None else 'primary']
+
+    @pages.cached('venue:{venue_id}')
+    def streamed(venue_id):
+        def generate():
+            replica = read_replica()
+            yield names[replica.name if replica is not None else 'primary']
+        return Response(stream_with_context(generate()))
+
+    def edit(venue_id):
+        pages.invalidate('venue:{}'.format(venue_id))
+        return ''
+
+    app.add_url_rule('/venues/<int:venue_id>', 'venue', venue)
+    app.add_url_rule('/venues/<int:venue_id>/streamed', 'streamed', streamed)
+    app.add_url_rule('/venues/<int:venue_id>/edit', 'edit_venue', edit, methods=['POST'])
+
+    writer, visitor = app.test_client(), app.test_client()
+    writer.post('/venues/1/edit')
+    assert visitor.get('/venues/1').data == b'old name'
+    assert visitor.get('/venues/1/streamed').data == b'old name'
+    assert pages.backend.entries == {}
+    # the writer's own reads come from the primary, and those are kept
+    assert writer.get('/venues/1').data == b'new name'
+    assert writer.get('/venues/1/streamed').data == b'new name'
+    assert len(pages.backend.entries) == 2
+    assert visitor.get('/venues/1').data == b'new name'
+
+
+@pytest.mark.parametrize('enabled', [False, True])
+def test_stats_endpoint_only_when_enabled(enabled):
+    app = Flask(__name__)
+    app.config.update(
+        DATABASE_REPLICA_URLS=['postgresql://reader@replica.internal/fyyur'],
+        SQLALCHEMY_ENGINE_OPTIONS={},
+        STATS_ENDPOINTS=enabled
+    )
+    routing.init_app(app)
+    assert ('replica_stats' in app.view_functions) is enabled
@@ -0,0 +1,65 @@
+import types
+import pytest
+from sqlalchemy.dialects import postgresql
+import search
+from app import create_app
+from models import Artist, Venue, build_search_text
+
+#----------------------------------------------------------------------------#
+# Search, compiled rather than run.
+#----------------------------------------------------------------------------#
+
+
+@pytest.fixture
+def app():
+    app = create_app()
+    with app.app_context():
+        yield app
+
+
+def compile_search(model, term, limit=20, page=1, genre=None):
+    compiled = search.search_query(model, term, limit, page, genre).statement.compile(dialect=postgresql.dialect())
+    return str(compiled), compiled.params
+
+
+def test_escape_like():
+    assert search.escape_like('100%_pure\\') == '100\\%\\_pure\\\\'
+    assert search.escape_like('Jazz') == 'Jazz'
+
+
+@pytest.mark.parametrize('model', [Venue, Artist])
+def test_search_uses_the_trigram_column_and_ranks_name_hits_first(app, model):
+    table = model.__tablename__
+    statement, params = compile_search(model, '  Dive_  ', limit=20, page=2)
+    assert '{}.search_text ILIKE %(search_text_1)s'.format(table) in statement
+    assert params['search_text_1'] == '%Dive\\_%'
+    assert (
+        'ORDER BY CASE WHEN ({0}.name ILIKE %(name_1)s) THEN %(param_1)s ELSE %(param_2)s END, '
+        'word_similarity(%(word_similarity_1)s, {0}.name) DESC, similarity({0}.search_text, %(similarity_1)s) DESC'
+    ).format(table) in statement
+    assert params['word_similarity_1'] == 'Dive_'
+    assert 'count(*) OVER () AS total' in statement
+    assert '{}.deleted_at IS NULL'.format(table) in statement
+    assert (params['param_3'], params['param_4']) == (20, 20)
+
+
+def test_search_within_a_genre(app):
+    statement, params = compile_search(Venue, 'dive', genre='Jazz')
+    assert 'venues.genres @> CAST(%(param_1)s AS VARCHAR[])' in statement
+    assert params['param_1'] == ['Jazz']
+
+
+def test_search_results_page():
+    rows = [types.SimpleNamespace(id=id, name='Venue %s' % id, total=45) for id in (21, 22)]
+    assert search.search_results(rows, 20, page=2) == {
+        'count': 45,
+        'data': [{'id': 21, 'name': 'Venue 21'}, {'id': 22, 'name': 'Venue 22'}],
+        'page': 2,
+        'has_more': True
+    }
+    assert search.search_results([], 20, page=3) == {'count': 0, 'data': [], 'page': 3, 'has_more': False}
+
+
+def test_search_text_skips_empty_parts():
+    assert build_search_text('The Dive', 'Austin', '', ['Jazz', '', 'Folk']) == 'The Dive Austin Jazz Folk'
+    assert build_search_text('The Dive', None, None, None) == 'The Dive'
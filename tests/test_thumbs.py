@@ -0,0 +1,208 @@
+import http.server
+import io
+import os
+import threading
+import pytest
+from flask import Flask
+from models import Venue
+from thumbs import ThumbnailCache, public_address
+
+#----------------------------------------------------------------------------#
+# Thumbnails against a local stand-in origin.
+#----------------------------------------------------------------------------#
+
+
+class Origin(http.server.ThreadingHTTPServer):
+    # serves /image.png, /redirect (to /image.png) and /fail (500), counting requests
+
+    def __init__(self, image):
+        super().__init__(('127.0.0.1', 0), OriginHandler)
+        self.image = image
+        self.requests = []
+
+    def url(self, path):
+        return 'http://127.0.0.1:{}{}'.format(self.server_address[1], path)
+
+
+class OriginHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path == '/image.png':
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(self.server.image)))
+            self.end_headers()
+            self.wfile.write(self.server.image)
+        elif self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/image.png')
+            self.end_headers()
+        else:
+            self.send_response(500)
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def png():
+    try:
+        from PIL import Image
+    except ImportError:
+        return b'not really a png'
+    out = io.BytesIO()
+    Image.new('RGB', (1200, 900), (200, 40, 40)).save(out, 'PNG')
+    return out.getvalue()
+
+
+@pytest.fixture
+def origin():
+    server = Origin(png())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        THUMB_CACHE_DIR=str(tmp_path / 'thumbs'),
+        THUMB_ALLOW_PRIVATE_ADDRESSES=True,
+        SERVER_NAME='localhost'
+    )
+    return app
+
+
+@pytest.fixture
+def thumbnails(app):
+    return ThumbnailCache(app)
+
+
+def serve(thumbnails, link):
+    # the endpoint, with the image_link lookup answered without a database
+    thumbnails.image_link = lambda model, id: link
+
+
+def test_miss_then_hit(app, thumbnails, origin):
+    pytest.importorskip('PIL')
+    serve(thumbnails, origin.url('/image.png'))
+    client = app.test_client()
+
+    first = client.get('/thumbs/venues/1/tile')
+    second = client.get('/thumbs/venues/1/tile')
+    detail = client.get('/thumbs/venues/1/detail')
+
+    assert first.status_code == second.status_code == detail.status_code == 200
+    assert first.mimetype == 'image/jpeg'
+    assert first.data == second.data
+    # one fetch of the original serves every size
+    assert origin.requests == ['/image.png']
+
+
+def test_webp_for_browsers_that_ask(app, thumbnails, origin):
+    features = pytest.importorskip('PIL.features')
+    if not features.check('webp'):
+        pytest.skip('Pillow built without WebP')
+    serve(thumbnails, origin.url('/image.png'))
+    response = app.test_client().get('/thumbs/artists/1/tile', headers={'Accept': 'image/webp,*/*'})
+    assert response.mimetype == 'image/webp'
+    assert 'Accept' in response.headers['Vary']
+
+
+def test_origin_failure_redirects_to_the_original(app, thumbnails, origin):
+    pytest.importorskip('PIL')
+    link = origin.url('/fail')
+    serve(thumbnails, link)
+    client = app.test_client()
+
+    response = client.get('/thumbs/venues/1/tile')
+
+    assert response.status_code == 302
+    assert response.headers['Location'] == link
+    # the failure is remembered for THUMB_FAILURE_TTL
+    assert client.get('/thumbs/venues/1/tile').status_code == 302
+    assert origin.requests == ['/fail']
+    # and retried once it has run out
+    app.config['THUMB_FAILURE_TTL'] = 0
+    assert client.get('/thumbs/venues/1/tile').status_code == 302
+    assert origin.requests == ['/fail', '/fail']
+
+
+def test_redirects_are_followed(app, thumbnails, origin):
+    with app.app_context():
+        assert thumbnails.fetch(origin.url('/redirect')) == origin.image
+    assert origin.requests == ['/redirect', '/image.png']
+
+
+def test_too_many_redirects(app, thumbnails, origin):
+    app.config['THUMB_MAX_REDIRECTS'] = 0
+    with app.app_context(), pytest.raises(ValueError):
+        thumbnails.fetch(origin.url('/redirect'))
+
+
+def test_private_addresses_are_refused(app, thumbnails, origin):
+    app.config['THUMB_ALLOW_PRIVATE_ADDRESSES'] = False
+    with app.app_context(), pytest.raises(ValueError):
+        thumbnails.fetch(origin.url('/image.png'))
+    assert origin.requests == []
+
+
+@pytest.mark.parametrize('host', ['127.0.0.1', '10.1.2.3', '192.168.0.10', '169.254.169.254', '::1', 'fe80::1', '0.0.0.0'])
+def test_non_public_addresses(host):
+    with pytest.raises(ValueError):
+        public_address(host, 80)
+
+
+def test_only_http_links(app, thumbnails):
+    with app.app_context():
+        for link in ('file:///etc/passwd', 'ftp://example.com/a.png', 'http:///nohost'):
+            with pytest.raises(ValueError):
+                thumbnails.fetch(link)
+
+
+def test_missing_link_is_404(app, thumbnails):
+    serve(thumbnails, None)
+    assert app.test_client().get('/thumbs/venues/1/tile').status_code == 404
+    assert app.test_client().get('/thumbs/nothing/1/tile').status_code == 404
+
+
+def test_eviction_keeps_a_running_size(app, thumbnails):
+    app.config['THUMB_CACHE_MAX_BYTES'] = 1000
+    with app.app_context():
+        for n in range(30):
+            thumbnails.write('{:08x}'.format(n), b'x' * 100)
+            assert thumbnails.size <= 1000
+        on_disk = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for directory, subdirectories, names in os.walk(app.config['THUMB_CACHE_DIR']) for name in names
+        )
+    assert on_disk == thumbnails.size
+    # the most recent files are the ones kept
+    with app.app_context():
+        assert thumbnails.read('{:08x}'.format(29)) is not None
+        assert thumbnails.read('{:08x}'.format(0)) is None
+
+
+def test_lookup_skips_deleted_rows(monkeypatch):
+    # the filter send() looks the link up with, compiled rather than run
+    criteria = []
+
+    class Query:
+        def filter(self, *clauses):
+            criteria.extend(str(clause) for clause in clauses)
+            return self
+
+        def scalar(self):
+            return None
+
+    class Session:
+        def query(self, *columns):
+            return Query()
+
+    monkeypatch.setattr('thumbs.db.session', Session())
+    assert ThumbnailCache().image_link(Venue, 1) is None
+    assert 'venues.deleted_at IS NULL' in criteria
@@ -0,0 +1,68 @@
+import pytest
+from flask import Flask, flash, session
+from jinja2 import DictLoader
+import views
+
+#----------------------------------------------------------------------------#
+# Listing rendering.
+#----------------------------------------------------------------------------#
+
+TEMPLATES = {
+    'listing.html': '{% for message in get_flashed_messages() %}[{{ message }}]{% endfor %}'
+                    '{% for row in rows %}<li>{{ row }}</li>{% endfor %}',
+}
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.config['STREAM_TEMPLATES'] = True
+    app.jinja_env.loader = DictLoader(TEMPLATES)
+    read = []
+
+    def rows():
+        for row in range(3):
+            read.append(row)
+            yield row
+
+    @app.route('/listing')
+    def listing():
+        response = views.render_listing('listing.html', rows=rows())
+        app.read_before_sending = list(read)
+        return response
+
+    @app.route('/flash')
+    def flash_message():
+        flash('Venue saved')
+        return ''
+
+    @app.route('/flashes')
+    def flashes():
+        return repr(session.get('_flashes'))
+
+    app.rows_read = read
+    return app
+
+
+def test_listings_stream_as_they_render(app):
+    response = app.test_client().get('/listing')
+    # nothing is read until the body is sent
+    assert app.read_before_sending == []
+    assert response.get_data(as_text=True) == '<li>0</li><li>1</li><li>2</li>'
+    assert app.rows_read == [0, 1, 2]
+
+
+def test_flashed_messages_are_popped_before_the_body_streams(app):
+    client = app.test_client()
+    client.get('/flash')
+    assert client.get('/listing').get_data(as_text=True).startswith('[Venue saved]<li>0</li>')
+    # the session sent with the listing's headers no longer holds them
+    assert client.get('/flashes').data == b'None'
+
+
+def test_listings_render_whole_when_streaming_is_off(app):
+    app.config['STREAM_TEMPLATES'] = False
+    response = app.test_client().get('/listing')
+    assert app.read_before_sending == [0, 1, 2]
+    assert response.data == b'<li>0</li><li>1</li><li>2</li>'
@@ -0,0 +1,298 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import threading
+import time
+import urllib.parse
+from flask import abort, current_app, redirect, request, send_file, url_for
+from models import db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Thumbnails.
+#----------------------------------------------------------------------------#
+
+# /thumbs/<kind>/<id>/<size> serves a resized copy of a venue's or artist's
+# image_link. The original is fetched once, each size is rendered once (WebP
+# for browsers that accept it, JPEG otherwise), and both live in a directory
+# capped at THUMB_CACHE_MAX_BYTES, least recently used files going first.
+# Without Pillow, or when the origin fails, it redirects to the original image;
+# a failed fetch is remembered for THUMB_FAILURE_TTL seconds (an empty .fail
+# file), so a dead or slow link isn't fetched again by every request meanwhile.
+#
+# image_link is whatever the forms, the importer or the API were given, so the
+# fetch treats it as hostile: the host is resolved first and refused unless
+# every address is a public one (no private, loopback, link-local or reserved
+# ranges), the connection goes to the address that was checked, and each of
+# at most THUMB_MAX_REDIRECTS redirects is checked the same way.
+#
+# thumb_url() adds a hash of the link to the URL, so the response can be cached
+# for good: a new image_link means a new URL.
+
+KINDS = {'venues': Venue, 'artists': Artist}
+REDIRECTS = (301, 302, 303, 307, 308)
+# once over the cap, files are evicted down to this share of it, so the next
+# few misses don't each trigger a scan
+EVICT_TO = 0.9
+
+
+def link_hash(image_link):
+    return hashlib.sha256(image_link.encode('utf-8')).hexdigest()
+
+
+def public_address(host, port, allow_private=False):
+    # an address of host to connect to, refusing hosts that resolve to anything
+    # but the public internet
+    addresses = [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if not allow_private and (not ip.is_global or ip.is_multicast):
+            raise ValueError('{} resolves to non-public address {}'.format(host, ip))
+    return addresses[0]
+
+
+class PinnedHTTPConnection(http.client.HTTPConnection):
+    # connects to the address that was checked, not whatever the host resolves to now
+
+    def __init__(self, host, port, address, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class PinnedHTTPSConnection(http.client.HTTPSConnection):
+
+    def __init__(self, host, port, address, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        # the certificate is still checked against the host name
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+class ThumbnailCache:
+
+    def __init__(self, app=None):
+        self.locks = [threading.Lock() for n in range(64)]
+        # bytes in the cache directory as of the last scan plus this process's
+        # writes since; None until the first write scans it
+        self.size = None
+        self.size_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('THUMB_SIZES', {'tile': (480, 400), 'detail': (960, 720)})
+        app.config.setdefault('THUMB_CACHE_DIR', os.path.join(app.instance_path, 'thumbs'))
+        app.config.setdefault('THUMB_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+        app.config.setdefault('THUMB_FETCH_TIMEOUT', 5)
+        app.config.setdefault('THUMB_MAX_SOURCE_BYTES', 20 * 1024 * 1024)
+        app.config.setdefault('THUMB_MAX_AGE', 365 * 24 * 3600)
+        app.config.setdefault('THUMB_MAX_REDIRECTS', 3)
+        app.config.setdefault('THUMB_FAILURE_TTL', 60)
+        # only for tests and local development against an origin on a private network
+        app.config.setdefault('THUMB_ALLOW_PRIVATE_ADDRESSES', False)
+
+        app.add_url_rule('/thumbs/<kind>/<int:id>/<size>', 'thumbnail', self.send)
+        app.add_template_global(self.thumb_url)
+
+    def thumb_url(self, kind, id, image_link, size='tile'):
+        if not image_link:
+            return image_link
+        return url_for('thumbnail', kind=kind, id=id, size=size, v=link_hash(image_link)[:12])
+
+    #  Cache directory
+    #  ----------------------------------------------------------------
+
+    def path(self, key):
+        return os.path.join(current_app.config['THUMB_CACHE_DIR'], key[:2], key)
+
+    def lock(self, key):
+        # one fetch or render per file and process at a time
+        return self.locks[int(key[:8], 16) % len(self.locks)]
+
+    def read(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # the mtime is the recency the eviction goes by
+        os.utime(path)
+        return data
+
+    def write(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        limit = current_app.config['THUMB_CACHE_MAX_BYTES']
+        with self.size_lock:
+            if self.size is not None:
+                self.size += len(data)
+            if self.size is None or self.size > limit:
+                self.size = self.evict(int(limit * EVICT_TO))
+
+    def evict(self, limit):
+        # scans the directory, removes the least recently used files until at
+        # most limit bytes are left and returns what is left; only runs on the
+        # first write and once the running size passes the cap. Other workers'
+        # writes are only counted by the next scan.
+        root = current_app.config['THUMB_CACHE_DIR']
+        files, total = [], 0
+        for directory, subdirectories, names in os.walk(root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total <= current_app.config['THUMB_CACHE_MAX_BYTES']:
+            return total
+        for mtime, size, path in sorted(files):
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+    def cached(self, key, produce):
+        data = self.read(key)
+        if data is None:
+            with self.lock(key):
+                data = self.read(key)
+                if data is None:
+                    data = produce()
+                    self.write(key, data)
+        return data
+
+    def failed_recently(self, source):
+        try:
+            failed_at = os.stat(self.path(source + '.fail')).st_mtime
+        except FileNotFoundError:
+            return False
+        return time.time() - failed_at < current_app.config['THUMB_FAILURE_TTL']
+
+    def original(self, source, image_link):
+        # runs under the original's lock, so requests that queued behind a
+        # failure give up at once rather than fetch again
+        if self.failed_recently(source):
+            raise ValueError('fetching {} failed recently'.format(image_link))
+        try:
+            return self.fetch(image_link)
+        except Exception:
+            self.write(source + '.fail', b'')
+            raise
+
+    #  Images
+    #  ----------------------------------------------------------------
+
+    def fetch(self, image_link):
+        config = current_app.config
+        limit = config['THUMB_MAX_SOURCE_BYTES']
+        url = image_link
+        for hop in range(config['THUMB_MAX_REDIRECTS'] + 1):
+            parts = urllib.parse.urlsplit(url)
+            if parts.scheme not in ('http', 'https') or not parts.hostname:
+                raise ValueError('not an http(s) link: {}'.format(url))
+            port = parts.port or (443 if parts.scheme == 'https' else 80)
+            address = public_address(parts.hostname, port, config['THUMB_ALLOW_PRIVATE_ADDRESSES'])
+            connection_class = PinnedHTTPSConnection if parts.scheme == 'https' else PinnedHTTPConnection
+            connection = connection_class(parts.hostname, port, address, timeout=config['THUMB_FETCH_TIMEOUT'])
+            try:
+                path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+                connection.request('GET', path, headers={'User-Agent': 'Fyyur thumbnailer'})
+                response = connection.getresponse()
+                if response.status in REDIRECTS and response.getheader('Location'):
+                    # followed by hand, so the next host is checked too
+                    url = urllib.parse.urljoin(url, response.getheader('Location'))
+                    continue
+                if response.status != 200:
+                    raise ValueError('{} answered {}'.format(url, response.status))
+                data = response.read(limit + 1)
+            finally:
+                connection.close()
+            if len(data) > limit:
+                raise ValueError('image larger than THUMB_MAX_SOURCE_BYTES')
+            return data
+        raise ValueError('more than THUMB_MAX_REDIRECTS redirects from {}'.format(image_link))
+
+    def render(self, original, box, format):
+        from PIL import Image, ImageOps
+        image = Image.open(io.BytesIO(original))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(box, Image.LANCZOS)
+        if image.mode not in ('RGB', 'RGBA') or (format == 'JPEG' and image.mode == 'RGBA'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[3])
+            image = background
+        out = io.BytesIO()
+        if format == 'WEBP':
+            image.save(out, 'WEBP', quality=80, method=4)
+        else:
+            image.save(out, 'JPEG', quality=82, optimize=True, progressive=True)
+        return out.getvalue()
+
+    def image_link(self, model, id):
+        # deleted venues and artists have no thumbnails
+        return db.session.query(model.image_link).filter(model.id == id, model.deleted_at.is_(None)).scalar()
+
+    def send(self, kind, id, size):
+        model = KINDS.get(kind)
+        box = current_app.config['THUMB_SIZES'].get(size)
+        if model is None or box is None:
+            abort(404)
+        image_link = self.image_link(model, id)
+        if not image_link:
+            abort(404)
+
+        try:
+            from PIL import features
+        except ImportError:
+            return redirect(image_link)
+        # an exact image/webp, not */*, which browsers without WebP send too
+        webp = features.check('webp') and 'image/webp' in request.accept_mimetypes.values()
+        format = 'WEBP' if webp else 'JPEG'
+
+        source = link_hash(image_link)
+        key = '{}-{}x{}.{}'.format(source, box[0], box[1], format.lower())
+
+        try:
+            data = self.read(key)
+            if data is None:
+                if self.failed_recently(source):
+                    return redirect(image_link)
+                # the original is fetched before taking the thumbnail's lock,
+                # so no thread ever holds two of them
+                original = self.cached(source + '.orig', lambda: self.original(source, image_link))
+                data = self.cached(key, lambda: self.render(original, box, format))
+        except Exception:
+            current_app.logger.warning('thumbnail of %s failed', image_link, exc_info=True)
+            return redirect(image_link)
+
+        response = send_file(io.BytesIO(data), mimetype='image/webp' if webp else 'image/jpeg', conditional=False)
+        response.vary.add('Accept')
+        if request.args.get('v') == source[:12]:
+            response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(current_app.config['THUMB_MAX_AGE'])
+        else:
+            # an old or missing version: serve it, but let the browser check back
+            response.headers['Cache-Control'] = 'public, max-age=300'
+        return response
+
+
+thumbnails = ThumbnailCache()
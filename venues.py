@@ -0,0 +1,159 @@
+from flask import Blueprint, abort, current_app, flash, jsonify, redirect, render_template, request, url_for
+import edits
+import ical
+import queries
+import search
+from cache import cache
+from facets import genre_facets
+from matching import matcher
+from replicas import on_primary, read_only
+from models import db, Venue
+from views import (
+    delete_record, edit_record, invalidate_venue_pages, listing_genre, listing_sort, render_listing, search_page
+)
+
+#----------------------------------------------------------------------------#
+# Venues.
+#----------------------------------------------------------------------------#
+
+venues = Blueprint('venues', __name__, url_prefix='/venues')
+
+
+@venues.route('')
+@cache.cached('venues')
+def index():
+    # get all venues grouped by city and state, capped per area
+    # ?city=...&state=...&page=N pages through the venues of a single area
+    # ?sort=busiest lists the venues with the most upcoming shows first
+    # ?genre=Jazz keeps only the venues with that genre
+    config = current_app.config
+    per_area = min(request.args.get('per_area', config['VENUES_PER_AREA'], type=int), config['VENUES_PER_AREA_MAX'])
+    page = max(request.args.get('page', 1, type=int), 1)
+    city, state = request.args.get('city'), request.args.get('state')
+    data = queries.venue_areas(
+        per_area=max(per_area, 1),
+        city=city,
+        state=state,
+        page=page,
+        yield_per=config['LISTING_YIELD_PER'],
+        sort=listing_sort(),
+        genre=listing_genre()
+    )
+    facets = genre_facets.counts(Venue, city=city, state=state)
+
+    return render_listing('pages/venues.html', areas=data, sort=listing_sort(), genre=listing_genre(), facets=facets)
+
+
+@venues.route('/search', methods=['POST'])
+@read_only
+def search_venues():
+    # case-insensitive partial match over name, city, state and genres, ranked by relevance
+    # seach for Hop should return "The Musical Hop".
+    # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
+    search_term = request.form.get('search_term', '')
+    response = search.search(Venue, search_term, limit=current_app.config['SEARCH_RESULTS_PER_PAGE'], page=search_page(), genre=listing_genre())
+    facets = genre_facets.counts(Venue, term=search_term)
+
+    return render_template('pages/search_venues.html', results=response, search_term=search_term, genre=listing_genre(), facets=facets)
+
+
+@venues.route('/<int:venue_id>')
+@cache.cached('venue:{venue_id}')
+def show_venue(venue_id):
+    # shows the venue page with the given venue_id
+    venue = queries.venue_detail(venue_id, current_app.config['DETAIL_SHOWS'])
+    if venue is None:
+        abort(404)
+
+    return render_template('pages/show_venue.html', venue=venue)
+
+
+@venues.route('/<int:venue_id>/calendar.ics')
+def venue_calendar(venue_id):
+    # the venue's shows for calendar apps; ?from=YYYY-MM-DD, ?to=YYYY-MM-DD (inclusive)
+    return ical.calendar_response(Venue, venue_id)
+
+#  Create Venue
+#  ----------------------------------------------------------------
+
+@venues.route('/create', methods=['GET'])
+def create_venue_form():
+    from forms import VenueForm
+    form = VenueForm()
+    return render_template('forms/new_venue.html', form=form)
+
+
+@venues.route('/create', methods=['POST'])
+def create_venue_submission():
+    try:
+        data = request.form
+        venue = Venue(name=data['name'], city=data['city'], state=data['state'], address=data['address'], phone=data['phone'], genres=data.getlist('genres'), facebook_link=data['facebook_link'])
+        db.session.add(venue)
+        db.session.commit()
+        genre_facets.adjust(Venue, added=data.getlist('genres'))
+        matcher.notify(Venue, venue.id)
+        cache.invalidate('venues')
+        flash('Venue ' + request.form['name'] + ' was successfully listed!')
+    except:
+        db.session.rollback()
+        current_app.logger.exception('%s %s failed', request.method, request.path)
+        flash('Venue ' + request.form['name'] + ' was not listed! Something wrong happened!')
+    finally:
+        db.session.close()
+
+    return render_template('pages/home.html')
+
+#  Delete Venue
+#  ----------------------------------------------------------------
+
+@venues.route('/<int:venue_id>', methods=['DELETE'])
+def delete_venue(venue_id):
+    # the venue disappears at once; its shows are purged in the background (see purge.py)
+    deleted = delete_record(Venue, venue_id, invalidate_venue_pages)
+    if deleted is None:
+        return jsonify({'success': False}), 500
+    return jsonify({'success': deleted}), 200 if deleted else 404
+
+
+@venues.route('/<int:venue_id>/delete', methods=['POST'])
+def delete_venue_submission(venue_id):
+    # the delete button on the venue page
+    if delete_record(Venue, venue_id, invalidate_venue_pages):
+        flash('Venue was successfully deleted!')
+    else:
+        flash('An error occurred. Venue could not be deleted.')
+    return redirect(url_for('index'))
+
+#  Update Venue
+#  ----------------------------------------------------------------
+
+@venues.route('/<int:venue_id>/edit', methods=['GET'])
+@on_primary
+def edit_venue(venue_id):
+    from forms import VenueForm
+    venue = Venue.query.filter(Venue.id == venue_id, Venue.deleted_at.is_(None)).first_or_404()
+    form = VenueForm(obj=venue)
+
+    return render_template('forms/edit_venue.html', form=form, venue=venue, version=edits.version_token(venue.updated_at))
+
+
+@venues.route('/<int:venue_id>/edit', methods=['POST'])
+def edit_venue_submission(venue_id):
+    # writes only the submitted fields, and only over the version the form was
+    # rendered with (see edits.py)
+    from forms import VenueForm
+    updated = edit_record(Venue, venue_id, invalidate_venue_pages)
+    if updated is False:
+        venue = Venue.query.filter(Venue.id == venue_id, Venue.deleted_at.is_(None)).first_or_404()
+        flash('Venue ' + venue.name + ' was changed by someone else while you were editing. Your changes are below, next to what is saved now; save again to keep them.')
+        # the submitted values stay in the form, and the new version token lets
+        # a second save go through over what was saved meanwhile
+        form = VenueForm(request.form)
+        conflicts = edits.conflicting_values(venue, edits.submitted_values(Venue, request.form))
+        return render_template(
+            'forms/edit_venue.html', form=form, venue=venue, version=edits.version_token(venue.updated_at), conflicts=conflicts
+        ), 409
+    if updated is None:
+        flash('An error occurred. Venue could not be updated.')
+
+    return redirect(url_for('venues.show_venue', venue_id=venue_id))
@@ -0,0 +1,106 @@
+from flask import Response, abort, current_app, get_flashed_messages, render_template, request, stream_with_context
+import edits
+import purge
+from cache import cache
+from facets import genre_facets
+from matching import PROFILE_FIELDS, matcher
+from models import db, Show
+
+#----------------------------------------------------------------------------#
+# Views.
+#----------------------------------------------------------------------------#
+
+# What the venue, artist and show blueprints share: listing parameters, the
+# streamed renderer, and the delete, edit and cache invalidation steps that
+# venues and artists go through alike.
+
+#  Rendering
+#  ----------------------------------------------------------------
+
+def render_listing(template_name, **context):
+    # long listings are sent as Jinja renders them, fed by row iterators, so the
+    # first bytes go out before the last row is read and nothing holds the whole page
+    app = current_app._get_current_object()
+    if not app.config['STREAM_TEMPLATES']:
+        return render_template(template_name, **context)
+    # the session is saved before the body streams, so flashed messages are popped now
+    get_flashed_messages()
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    return Response(stream_with_context(template.generate(**context)))
+
+
+def listing_sort():
+    return 'busiest' if request.args.get('sort') == 'busiest' else None
+
+
+def listing_genre():
+    # ?genre= on the listings, genre= in the search forms
+    return request.values.get('genre') or None
+
+
+def search_page():
+    return max(request.form.get('page', 1, type=int), 1)
+
+#  Deletes and edits
+#  ----------------------------------------------------------------
+
+def delete_record(model, id, invalidate):
+    # True once deleted, False if there was nothing to delete, None on failure
+    try:
+        deleted = purge.soft_delete(model, id)
+        db.session.commit()
+    except:
+        db.session.rollback()
+        current_app.logger.exception('%s %s failed', request.method, request.path)
+        return None
+    finally:
+        db.session.close()
+    if deleted is None:
+        return False
+    genre_facets.adjust(model, removed=deleted.genres)
+    invalidate(id)
+    # its shows came off the other listing's show counts
+    cache.invalidate('artists' if model.__tablename__ == 'venues' else 'venues')
+    purge.purger.notify()
+    matcher.notify(model, id)
+    return True
+
+
+def edit_record(model, id, invalidate):
+    # True once saved, False if the row is gone or was edited since the form was
+    # rendered, None on failure; the conflict is only looked into after the write
+    try:
+        version = edits.parse_version(request.form.get('version'))
+    except ValueError:
+        abort(400)
+    values = edits.submitted_values(model, request.form)
+    try:
+        updated = edits.update_record(model, id, version, values)
+        db.session.commit()
+    except:
+        db.session.rollback()
+        current_app.logger.exception('%s %s failed', request.method, request.path)
+        return None
+    if updated is None:
+        return False
+    if 'genres' in values:
+        genre_facets.adjust(model, removed=updated.old_genres, added=values['genres'])
+    if any(field in values for field in PROFILE_FIELDS):
+        matcher.notify(model, id)
+    invalidate(id)
+    return True
+
+#  Cache invalidation
+#  ----------------------------------------------------------------
+
+def invalidate_venue_pages(venue_id):
+    # the venue page, the listings, and every artist page that links to the venue
+    artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+    cache.invalidate('venue:%s' % venue_id, 'venues', 'shows', *['artist:%s' % artist_id for (artist_id,) in artist_ids])
+
+
+def invalidate_artist_pages(artist_id):
+    # the artist page, the listings, and every venue page that links to the artist
+    venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+    cache.invalidate('artist:%s' % artist_id, 'artists', 'shows', *['venue:%s' % venue_id for (venue_id,) in venue_ids])